@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.1/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -62,11 +63,17 @@ CORS_ALLOWED_ORIGINS = [
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'core.authentication.CachedJWTAuthentication',
     ],
 }
 
+# Seconds a token's user row stays in the shared cache, and in each process's LRU
+AUTH_USER_CACHE_TIMEOUT = 60
+AUTH_USER_LOCAL_TIMEOUT = 5
+
 MIDDLEWARE = [
+    'core.middleware.QueryInstrumentationMiddleware',  # First, so it measures the whole stack
+    'core.middleware.ReplicaRoutingMiddleware',  # Before anything that reads the database
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
@@ -109,9 +116,53 @@ DATABASES = {
         'PASSWORD': 'grey7956',
         'HOST': 'localhost',
         'PORT': '5432',
+        # Persistent connections (DB_CONN_MAX_AGE seconds, e.g. 60) only pay off under WSGI. Under ASGI
+        # every thread that runs sync ORM code keeps its own connection open, so ASGI deployments
+        # should leave this at 0 and set DB_POOL_MAX_SIZE instead. A health check replaces dropped ones.
+        'CONN_MAX_AGE': int(os.environ.get('DB_CONN_MAX_AGE', 0)),
+        'CONN_HEALTH_CHECKS': os.environ.get('DB_CONN_HEALTH_CHECKS', '1') == '1',
+        'OPTIONS': {},
     }
 }
 
+# psycopg 3 connection pool (DB_POOL_MAX_SIZE > 0); Django requires CONN_MAX_AGE = 0 alongside it
+if int(os.environ.get('DB_POOL_MAX_SIZE', 0)):
+    DATABASES['default']['CONN_MAX_AGE'] = 0
+    DATABASES['default']['OPTIONS']['pool'] = {
+        'min_size': int(os.environ.get('DB_POOL_MIN_SIZE', 2)),
+        'max_size': int(os.environ.get('DB_POOL_MAX_SIZE')),
+        'timeout': int(os.environ.get('DB_POOL_TIMEOUT', 10)),
+    }
+
+# Read replicas as a comma-separated host list; core.db_router spreads safe reads over them
+DATABASE_REPLICAS = []
+for number, host in enumerate(filter(None, os.environ.get('DB_REPLICA_HOSTS', '').split(',')), start=1):
+    alias = f'replica{number}'
+    DATABASES[alias] = {
+        **DATABASES['default'], 'HOST': host, 'OPTIONS': dict(DATABASES['default']['OPTIONS']),
+        'TEST': {'MIRROR': 'default'},
+    }
+    DATABASE_REPLICAS.append(alias)
+
+DATABASE_ROUTERS = ['core.db_router.PrimaryReplicaRouter']
+
+# The catalog version counters, cached responses and cached auth users must be shared by every
+# worker process, or invalidation only reaches the process that handled the write. Production
+# sets CACHE_REDIS_URL; the per-process LocMem fallback is only fit for tests and a single process
+# (core.checks warns when WEB_CONCURRENCY asks for more).
+if os.environ.get('CACHE_REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ['CACHE_REDIS_URL'],
+        }
+    }
+else:
+    CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+# Seconds a client that wrote keeps reading from the primary (see core/middleware.py)
+REPLICA_PIN_SECONDS = 5
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
@@ -154,7 +205,11 @@ STATIC_URL = 'static/'
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
-import os
-
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+
+# Threads rendering product image variants in the background (see core/images.py)
+IMAGE_VARIANT_WORKERS = 2
+
+# Log a request as a likely N+1 when one SQL statement repeats this often (see core/middleware.py)
+QUERY_REPEAT_THRESHOLD = 3
@@ -1,12 +1,62 @@
 from django.contrib import admin
 from .models import Category, Product, Order, Brand
-from .models import Review
+from .models import Review, ScheduledSale
+from .pagination import EstimatedCountPaginator
+from .pricing import reprice
+
+# Discounts offered as one-click "start sale" actions on the product changelist
+SALE_ACTIONS = [10, 20, 30, 50]
+
+
+class CategoryTreeFilter(admin.SimpleListFilter):
+    """Filter by a top-level category and everything below it, through the materialized path."""
+    title = 'category'
+    parameter_name = 'category_tree'
+    path_lookup = 'category__path'
+
+    def lookups(self, request, model_admin):
+        # Only the roots are listed, so the sidebar stays small however many categories there are
+        return Category.objects.filter(parent=None).order_by('name').values_list('id', 'name')
+
+    def queryset(self, request, queryset):
+        if self.value() is None:
+            return queryset
+        path = Category.objects.filter(pk=self.value()).values_list('path', flat=True).first()
+        if not path:
+            return queryset.none()
+        return queryset.filter(**{f'{self.path_lookup}__startswith': path})
+
+
+class SubtreeFilter(CategoryTreeFilter):
+    path_lookup = 'path'
+
+
+class OrderCategoryFilter(CategoryTreeFilter):
+    path_lookup = 'product__category__path'
+
+
+def sale_action(discount):
+    """A changelist action putting the selected products on sale at `discount`% off in one UPDATE."""
+    @admin.action(description=f'Start a {discount}%% off sale on the selected products')
+    def start_sale(modeladmin, request, queryset):
+        updated = reprice(queryset, discount_percentage=discount, is_on_sale=True)
+        modeladmin.message_user(request, f'{updated} products are now {discount}% off.')
+    start_sale.__name__ = f'start_sale_{discount}'
+    return start_sale
+
+
+@admin.action(description='End the sale on the selected products')
+def end_sale(modeladmin, request, queryset):
+    updated = reprice(queryset, discount_percentage=0, is_on_sale=False)
+    modeladmin.message_user(request, f'{updated} products are back to full price.')
+
 
 @admin.register(Category)
 class CategoryAdmin(admin.ModelAdmin):
     list_display = ['id', 'name', 'parent']
+    list_select_related = ['parent__parent']  # The parent column prints "grandparent → parent"
     search_fields = ['name']
-    list_filter = ['parent']  # This adds a dropdown filter for main categories
+    list_filter = [SubtreeFilter]  # This adds a filter for main categories
     autocomplete_fields = ['parent']  # Enables a dropdown for parent selection
 
 @admin.register(Brand)
@@ -20,9 +70,16 @@ class ProductAdmin(admin.ModelAdmin):
         'id', 'name', 'category', 'brand', 'price', 'stock',
         'is_on_sale', 'discount_percentage', 'image_tag'
     ]
+    list_select_related = ['category__parent', 'brand']
     readonly_fields = ['image_tag']
-    list_filter = ['category', 'brand', 'is_on_sale']
+    list_filter = [CategoryTreeFilter, 'brand', 'is_on_sale']
     search_fields = ['name']
+    autocomplete_fields = ['category', 'brand']
+    # Repricing runs as one UPDATE for the whole selection, including "select all" across pages
+    actions = [*map(sale_action, SALE_ACTIONS), end_sale]
+    # Large tables: no exact COUNT(*) on every page load
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
 
 @admin.register(Order)
 class OrderAdmin(admin.ModelAdmin):
@@ -30,13 +87,32 @@ class OrderAdmin(admin.ModelAdmin):
         'id', 'user', 'product', 'quantity', 'status', 
         'order_date', 'delivery_date'
     ]
-    list_filter = ['status', 'product__category']
+    list_select_related = ['user', 'product']
+    list_filter = ['status', OrderCategoryFilter]
     search_fields = ['user__username', 'product__name']
+    autocomplete_fields = ['user', 'product']
+    # Backed by core_order_date_idx
+    date_hierarchy = 'order_date'
+    ordering = ['-order_date']
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
 
 
 
 @admin.register(Review)
 class ReviewAdmin(admin.ModelAdmin):
     list_display = ['product', 'user', 'rating', 'created_at']
+    list_select_related = ['product', 'user']
     list_filter = ['rating', 'created_at']
     search_fields = ['product__name', 'user__username', 'comment']
+    autocomplete_fields = ['product', 'user']
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+@admin.register(ScheduledSale)
+class ScheduledSaleAdmin(admin.ModelAdmin):
+    list_display = ['id', 'name', 'discount_percentage', 'starts_at', 'ends_at', 'status']
+    list_filter = ['status']
+    search_fields = ['name']
+    readonly_fields = ['status']
+    ordering = ['-starts_at']
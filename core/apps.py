@@ -4,3 +4,8 @@ from django.apps import AppConfig
 class CoreConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'core'
+
+    def ready(self):
+        from . import checks  # noqa: F401  Registers the system checks
+        from . import signals  # noqa: F401  Connects the model signal handlers
+        from . import middleware  # noqa: F401  Hooks the query recorder into new connections
@@ -0,0 +1,72 @@
+from collections import defaultdict
+
+from asgiref.sync import sync_to_async
+from django.http import Http404, JsonResponse
+from django.views.decorators.http import require_GET
+
+from .filters import ProductFilter
+from .models import Category, Product
+from .pagination import ProductCursorPagination
+from .serializers import CategorySerializer, ProductSerializer
+from .views import ProductViewSet
+
+# Async read-only counterparts of the product and category endpoints. Under ASGI
+# (backend.asgi) they await the database instead of holding a worker thread per
+# request; under WSGI Django still runs them, one event loop per request.
+
+
+def _page_size(request):
+    pagination = ProductCursorPagination
+    try:
+        size = int(request.GET.get('page_size', pagination.page_size))
+    except ValueError:
+        size = pagination.page_size
+    return max(1, min(size, pagination.max_page_size))
+
+
+@sync_to_async
+def _filtered_products(request):
+    # Filter methods may resolve names through the cache and the database, so build the
+    # queryset on a thread; evaluation below stays async.
+    filterset = ProductFilter(request.GET, queryset=ProductViewSet.queryset.all(), request=request)
+    return filterset.qs if filterset.is_valid() else None
+
+
+@require_GET
+async def product_list(request):
+    """Product page keyed by id: `?after=<last id>&page_size=N`, plus the usual ProductFilter params."""
+    queryset = await _filtered_products(request)
+    if queryset is None:
+        return JsonResponse({'detail': 'Invalid filter parameters.'}, status=400)
+    after = request.GET.get('after')
+    if after and after.isdigit():
+        queryset = queryset.filter(id__gt=int(after))
+    size = _page_size(request)
+    products = [product async for product in queryset.order_by('id')[:size + 1].aiterator(chunk_size=size + 1)]
+
+    next_url = None
+    if len(products) > size:
+        products = products[:size]
+        params = request.GET.copy()
+        params['after'] = products[-1].id
+        next_url = request.build_absolute_uri(f'{request.path}?{params.urlencode()}')
+    data = ProductSerializer(products, many=True, context={'request': request}).data
+    return JsonResponse({'next': next_url, 'results': data})
+
+
+@require_GET
+async def product_detail(request, pk):
+    try:
+        product = await ProductViewSet.queryset.aget(pk=pk)
+    except Product.DoesNotExist:
+        raise Http404('No Product matches the given query.')
+    return JsonResponse(ProductSerializer(product, context={'request': request}).data)
+
+
+@require_GET
+async def category_list(request):
+    roots, children = [], defaultdict(list)
+    async for category in Category.objects.order_by('path'):
+        (children[category.parent_id] if category.parent_id else roots).append(category)
+    data = CategorySerializer(roots, many=True, context={'request': request, 'category_children': children}).data
+    return JsonResponse(data, safe=False)
@@ -0,0 +1,123 @@
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.utils.translation import gettext_lazy as _
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+
+# The user columns an authenticated request needs for permission checks; the rest load lazily on access
+AUTH_USER_FIELDS = ('id', 'username', 'is_active', 'is_staff', 'is_superuser')
+
+# Shared entries are deleted when the user is saved, which reaches every worker only when the
+# default cache is shared (CACHE_REDIS_URL, see core.checks); per-process entries can only expire,
+# so they bound how long another process may still accept a user who was just deactivated
+AUTH_USER_CACHE_TIMEOUT = 60
+AUTH_USER_LOCAL_TIMEOUT = 5
+AUTH_USER_LOCAL_SIZE = 1024
+
+
+def user_cache_key(user_id):
+    return f'core:auth_user:{user_id}'
+
+
+class LocalUserCache:
+    """A per-process LRU of user rows whose entries expire after `timeout` seconds."""
+
+    def __init__(self, size, timeout):
+        self.size = size
+        self.timeout = timeout
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            expires, value = entry
+            if expires <= time.monotonic():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self.lock:
+            self.entries[key] = (time.monotonic() + self.timeout, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+
+    def delete(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+local_users = LocalUserCache(
+    getattr(settings, 'AUTH_USER_LOCAL_SIZE', AUTH_USER_LOCAL_SIZE),
+    getattr(settings, 'AUTH_USER_LOCAL_TIMEOUT', AUTH_USER_LOCAL_TIMEOUT),
+)
+
+
+def forget_user(user_id):
+    """Drop a user's cached row now and again once the transaction commits (see core.cache.invalidate)."""
+    key = user_cache_key(user_id)
+
+    def forget():
+        cache.delete(key)
+        local_users.delete(key)
+
+    forget()
+    transaction.on_commit(forget)
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """
+    JWT authentication that resolves the token's user from a per-process LRU, then the shared
+    cache, and only then the database, so most authenticated requests run no user query.
+
+    Cached users carry AUTH_USER_FIELDS; other fields are deferred and load on first access, and
+    `save()` writes only the loaded fields. Entries are dropped when the User is saved or deleted
+    (see core.signals); queryset `update()`s bypass that and are picked up when entries expire.
+    """
+
+    def get_user(self, validated_token):
+        if api_settings.CHECK_REVOKE_TOKEN:
+            # Comparing password hashes needs the current row; not cached on purpose
+            return super().get_user(validated_token)
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError as error:
+            raise InvalidToken(_('Token contained no recognizable user identification')) from error
+
+        # from_db() expects the values in the model's field order
+        fields = [
+            field.attname for field in self.user_model._meta.concrete_fields if field.attname in AUTH_USER_FIELDS
+        ]
+        key = user_cache_key(user_id)
+        values = local_users.get(key)
+        if values is None:
+            values = cache.get(key)
+            if values is None:
+                values = self.user_model.objects.filter(
+                    **{api_settings.USER_ID_FIELD: user_id},
+                ).values_list(*fields).first()
+                if values is None:
+                    raise AuthenticationFailed(_('User not found'), code='user_not_found')
+                cache.set(key, values, getattr(settings, 'AUTH_USER_CACHE_TIMEOUT', AUTH_USER_CACHE_TIMEOUT))
+            local_users.set(key, values)
+
+        user = self.user_model.from_db(DEFAULT_DB_ALIAS, fields, values)
+        if api_settings.CHECK_USER_IS_ACTIVE and not user.is_active:
+            raise AuthenticationFailed(_('User is inactive'), code='user_inactive')
+        return user
@@ -0,0 +1,73 @@
+import http.client
+import statistics
+import threading
+import time
+from urllib.parse import urlsplit
+
+
+def percentile(samples, pct):
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def run_load(url, concurrency=16, requests=500, headers=None, timeout=30):
+    """
+    Fire `requests` GETs at `url` from `concurrency` keep-alive clients.
+
+    Returns requests/s, p50/p99 latency in milliseconds, mean response bytes and the
+    number of non-2xx/3xx answers.
+    """
+    parts = urlsplit(url)
+    target = parts.path + (f'?{parts.query}' if parts.query else '')
+    latencies, sizes, errors = [], [], []
+    lock = threading.Lock()
+    remaining = [requests]
+
+    def client():
+        connection_class = http.client.HTTPSConnection if parts.scheme == 'https' else http.client.HTTPConnection
+        connection = connection_class(parts.netloc, timeout=timeout)
+        try:
+            while True:
+                with lock:
+                    if remaining[0] <= 0:
+                        return
+                    remaining[0] -= 1
+                started = time.perf_counter()
+                try:
+                    connection.request('GET', target, headers=headers or {})
+                    response = connection.getresponse()
+                    body = response.read()
+                except (OSError, http.client.HTTPException):
+                    connection.close()
+                    with lock:
+                        errors.append(None)
+                    continue
+                elapsed = time.perf_counter() - started
+                with lock:
+                    latencies.append(elapsed)
+                    sizes.append(len(body))
+                    if response.status >= 400:
+                        errors.append(response.status)
+        finally:
+            connection.close()
+
+    workers = [threading.Thread(target=client) for _ in range(concurrency)]
+    started = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    wall = time.perf_counter() - started
+
+    return {
+        'url': url,
+        'concurrency': concurrency,
+        'requests': len(latencies),
+        'rps': round(len(latencies) / wall, 1) if wall else 0.0,
+        'p50_ms': round(percentile(latencies, 50) * 1000, 2),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 2),
+        'mean_bytes': round(statistics.fmean(sizes)) if sizes else 0,
+        'errors': len(errors),
+    }
@@ -0,0 +1,119 @@
+import hashlib
+import time
+
+from django.core.cache import cache
+from django.db import transaction
+
+# Bumped by any write to products, categories, brands or reviews (see core.signals)
+CATALOG_CACHE_NAMESPACE = 'catalog'
+RESPONSE_CACHE_TIMEOUT = 5 * 60
+
+
+def _version_key(namespace):
+    return f'core:version:{namespace}'
+
+
+def get_version(namespace):
+    """
+    Return the current version counter for a namespace of cached data.
+
+    Cache keys embed the version, so bumping it invalidates every entry at once. A missing
+    counter is seeded from the clock so an evicted counter never reuses an old version.
+    """
+    key = _version_key(namespace)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, time.time_ns() // 1000, timeout=None)
+        version = cache.get(key)
+    return version
+
+
+def bump_version(namespace):
+    key = _version_key(namespace)
+    try:
+        return cache.incr(key)
+    except ValueError:
+        cache.set(key, time.time_ns() // 1000, timeout=None)
+        return cache.get(key)
+
+
+def invalidate(namespace):
+    """
+    Bump a namespace now and again once the transaction commits, so anything cached
+    from not-yet-committed data in between cannot outlive the write.
+    """
+    bump_version(namespace)
+    transaction.on_commit(lambda: bump_version(namespace))
+
+
+def cached(namespace, name, build, timeout=60 * 60):
+    """Return `build()` cached under the current version of `namespace`."""
+    key = f'core:{name}:{get_version(namespace)}'
+    value = cache.get(key)
+    if value is None:
+        value = build()
+        cache.set(key, value, timeout)
+    return value
+
+
+def _count(name):
+    key = f'core:response_cache:{name}'
+    if not cache.add(key, 1, timeout=None):
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, 1, timeout=None)
+
+
+def response_cache_stats():
+    """Return the shared `{'hits': n, 'misses': n}` counters of the response cache."""
+    return {name: cache.get(f'core:response_cache:{name}', 0) for name in ('hits', 'misses')}
+
+
+def response_cache_key(request):
+    """
+    Key on the scheme, host, path, normalized query string and catalog version.
+
+    Responses embed absolute URLs (pagination links, images), so each origin gets its own entry.
+    """
+    params = sorted(
+        (name, value) for name, values in request.query_params.lists() for value in values if value != ''
+    )
+    origin = (request.scheme, request.get_host())
+    digest = hashlib.md5(repr((origin, request.path, params)).encode(), usedforsecurity=False).hexdigest()
+    return f'core:response:{get_version(CATALOG_CACHE_NAMESPACE)}:{digest}'
+
+
+def cached_response(request, render, timeout=RESPONSE_CACHE_TIMEOUT):
+    """
+    Return a cached DRF response for anonymous GETs, rendering and storing it on a miss.
+
+    Only the serialized data and its validators are cached, so a hit can still answer a
+    conditional GET with 304. Invalidation is a single version bump, never a key scan.
+    """
+    from django.utils.cache import get_conditional_response
+    from django.utils.http import parse_http_date_safe
+    from rest_framework.response import Response
+
+    if request.method != 'GET' or request.user.is_authenticated:
+        return render()
+    key = response_cache_key(request)
+    entry = cache.get(key)
+    if entry is not None:
+        _count('hits')
+        data, validators = entry
+        not_modified = get_conditional_response(
+            request._request,
+            etag=validators.get('ETag'),
+            last_modified=parse_http_date_safe(validators.get('Last-Modified', '')),
+        )
+        if not_modified is not None:
+            return not_modified
+        return Response(data, headers={**validators, 'X-Cache': 'HIT'})
+    _count('misses')
+    response = render()
+    if response.status_code == 200:
+        validators = {name: response[name] for name in ('ETag', 'Last-Modified') if response.has_header(name)}
+        cache.set(key, (response.data, validators), timeout)
+        response['X-Cache'] = 'MISS'
+    return response
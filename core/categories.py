@@ -0,0 +1,28 @@
+from collections import defaultdict
+
+from .cache import cached
+from .models import Category
+
+CATEGORY_CACHE_NAMESPACE = 'category'
+
+
+def load_category_tree():
+    """Load every category in one query and return `(roots, children_by_parent_id)`."""
+    children = defaultdict(list)
+    roots = []
+    for category in Category.objects.order_by('path'):
+        if category.parent_id is None:
+            roots.append(category)
+        else:
+            children[category.parent_id].append(category)
+    return roots, children
+
+
+def category_paths():
+    """Cached `{category_id: path}` map used to turn a category into a subtree prefix."""
+    return cached(CATEGORY_CACHE_NAMESPACE, 'category_paths', lambda: dict(Category.objects.values_list('id', 'path')))
+
+
+def category_tree(build):
+    """Cached, versioned tree payload; `build` renders it on a miss."""
+    return cached(CATEGORY_CACHE_NAMESPACE, 'category_tree', build)
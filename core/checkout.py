@@ -0,0 +1,70 @@
+import uuid
+from decimal import ROUND_HALF_UP, Decimal
+
+from django.db import transaction
+from django.db.models import F
+from django.db.models.functions import Now
+
+from .cache import CATALOG_CACHE_NAMESPACE, invalidate
+from .models import Order, Product
+from .reports import record_orders
+
+
+class OutOfStock(Exception):
+    def __init__(self, product_id):
+        super().__init__(f"Product {product_id} does not have enough stock.")
+        self.product_id = product_id
+
+
+class UnknownProducts(Exception):
+    def __init__(self, product_ids):
+        super().__init__(f"Products {', '.join(map(str, product_ids))} do not exist.")
+        self.product_ids = product_ids
+
+
+def effective_price(price, is_on_sale, discount_percentage):
+    """The discounted price of unsaved values; stored products carry it as `Product.effective_price`."""
+    if not is_on_sale or not discount_percentage:
+        return price
+    return (price * (100 - discount_percentage) / 100).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
+
+
+def place_order(user, items):
+    """
+    Reserve stock for every `(product_id, quantity)` line and create the orders atomically.
+
+    Each line is one conditional `UPDATE ... SET stock = stock - q WHERE stock >= q`, so
+    concurrent checkouts can never oversell; lines are applied in product id order so two
+    carts always take their row locks in the same order and cannot deadlock. Raises
+    `UnknownProducts` before reserving anything if a product id does not exist, and
+    `OutOfStock`, rolling everything back, if any line cannot be reserved.
+    """
+    quantities = {}
+    for product_id, quantity in items:
+        quantities[product_id] = quantities.get(product_id, 0) + quantity
+
+    with transaction.atomic():
+        # Read up front so unknown ids are not reported as out of stock; reserving never changes prices
+        prices = dict(Product.objects.filter(pk__in=quantities).values_list('id', 'effective_price'))
+        if len(prices) < len(quantities):
+            raise UnknownProducts(sorted(set(quantities) - set(prices)))
+
+        for product_id in sorted(quantities):
+            reserved = Product.objects.filter(pk=product_id, stock__gte=quantities[product_id]).update(
+                stock=F('stock') - quantities[product_id], updated_at=Now(),
+            )
+            if not reserved:
+                raise OutOfStock(product_id)
+
+        reference = uuid.uuid4()
+        orders = Order.objects.bulk_create([
+            Order(
+                user=user, product_id=product_id, quantity=quantities[product_id], reference=reference,
+                unit_price=price,
+            )
+            for product_id, price in prices.items()
+        ])
+        record_orders(orders)
+        # Stock is part of the product payload; one bump for the whole cart
+        invalidate(CATALOG_CACHE_NAMESPACE)
+    return orders
@@ -0,0 +1,22 @@
+import os
+
+from django.conf import settings
+from django.core.checks import Tags, Warning, register
+
+PROCESS_LOCAL_CACHES = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+@register(Tags.caches)
+def check_shared_cache(app_configs, **kwargs):
+    """Cache invalidation (see core.cache) only works when every worker shares the cache."""
+    workers = int(os.environ.get('WEB_CONCURRENCY', 1))
+    if workers > 1 and settings.CACHES['default']['BACKEND'] in PROCESS_LOCAL_CACHES:
+        return [Warning(
+            f'The default cache is local to each process, but WEB_CONCURRENCY runs {workers} workers.',
+            hint='Set CACHE_REDIS_URL so invalidations reach every worker.',
+            id='core.W001',
+        )]
+    return []
@@ -0,0 +1,72 @@
+import random
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+
+# Apps whose reads may be served by a replica; everything else (auth, sessions, admin) stays on the primary
+REPLICA_READ_APPS = {'core'}
+
+_routing = ContextVar('db_routing', default=None)
+
+
+class RoutingState:
+    """Per-request routing decision, set by ReplicaRoutingMiddleware."""
+
+    def __init__(self, replica_reads):
+        self.replica_reads = replica_reads
+        self.wrote = False
+
+
+def begin_request(replica_reads):
+    """Start routing a request; returns the token `end_request` needs."""
+    state = RoutingState(replica_reads)
+    return state, _routing.set(state)
+
+
+def end_request(token):
+    _routing.reset(token)
+
+
+class PrimaryReplicaRouter:
+    """
+    Send reads of REPLICA_READ_APPS models in safe-method requests to a random replica, and
+    everything else to the primary.
+
+    Once a request writes, its remaining reads go to the primary too (read-your-writes); the
+    middleware then pins the client's next requests for settings.REPLICA_PIN_SECONDS so replication lag
+    cannot hide the write. Outside a request, e.g. in management commands, all reads use the primary.
+    """
+
+    def __init__(self, primary=DEFAULT_DB_ALIAS, replicas=None):
+        self.primary = primary
+        if replicas is None:
+            replicas = getattr(settings, 'DATABASE_REPLICAS', [])
+        self.replicas = list(replicas)
+
+    def db_for_read(self, model, **hints):
+        state = _routing.get()
+        if (
+            self.replicas and state is not None and state.replica_reads and not state.wrote
+            and model._meta.app_label in REPLICA_READ_APPS
+        ):
+            return random.choice(self.replicas)
+        return self.primary
+
+    def db_for_write(self, model, **hints):
+        state = _routing.get()
+        if state is not None:
+            state.wrote = True
+        return self.primary
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {self.primary, *self.replicas}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas receive the schema through replication
+        if db in self.replicas:
+            return False
+        return None
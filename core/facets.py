@@ -0,0 +1,78 @@
+import hashlib
+from collections import Counter
+
+from django.db.models import Case, Count, IntegerField, Value, When
+
+from .cache import CATALOG_CACHE_NAMESPACE, RESPONSE_CACHE_TIMEOUT, cached
+from .categories import category_paths
+from .related import PRICE_BANDS
+
+
+def price_band_expression():
+    """The index into PRICE_BANDS of a product's effective price, computed in SQL."""
+    return Case(
+        *[When(effective_price__lt=upper, then=Value(band)) for band, upper in enumerate(PRICE_BANDS[1:])],
+        default=Value(len(PRICE_BANDS) - 1),
+        output_field=IntegerField(),
+    )
+
+
+def _ancestors(path, category_id):
+    """The category and every category above it, read from its materialized path."""
+    return [int(part) for part in path.split('/') if part] if path else [category_id]
+
+
+def product_facets(queryset):
+    """
+    Count the products in `queryset` per brand, per category (including its subcategories) and
+    per effective-price band.
+
+    One GROUP BY over (brand, category, price band) returns at most a few thousand rows however
+    many products match; every facet is summed from those rows here.
+    """
+    rows = (
+        queryset.order_by()
+        .values('brand_id', 'category_id', band=price_band_expression())
+        .annotate(count=Count('id'))
+    )
+    paths = category_paths()
+    total = 0
+    brands, categories, bands = Counter(), Counter(), Counter()
+    for row in rows:
+        total += row['count']
+        if row['brand_id'] is not None:
+            brands[row['brand_id']] += row['count']
+        for category_id in _ancestors(paths.get(row['category_id']), row['category_id']):
+            categories[category_id] += row['count']
+        bands[row['band']] += row['count']
+
+    def ranked(counts):
+        return [{'id': pk, 'count': count} for pk, count in sorted(counts.items(), key=lambda item: (-item[1], item[0]))]
+
+    return {
+        'count': total,
+        'brands': ranked(brands),
+        'categories': ranked(categories),
+        # `min` is inclusive and `max` exclusive; the top band has no upper bound
+        'price_bands': [
+            {
+                'min': PRICE_BANDS[band],
+                'max': PRICE_BANDS[band + 1] if band + 1 < len(PRICE_BANDS) else None,
+                'count': bands[band],
+            }
+            for band in range(len(PRICE_BANDS))
+        ],
+    }
+
+
+def cached_facets(filterset):
+    """Facets of a bound, valid ProductFilter, cached under the catalog version."""
+    params = sorted(
+        (name, value) for name, values in filterset.data.lists() if name in filterset.filters
+        for value in values if value != ''
+    )
+    digest = hashlib.md5(repr(params).encode(), usedforsecurity=False).hexdigest()
+    return cached(
+        CATALOG_CACHE_NAMESPACE, f'facets:{digest}', lambda: product_facets(filterset.qs),
+        timeout=RESPONSE_CACHE_TIMEOUT,
+    )
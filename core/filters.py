@@ -1,12 +1,41 @@
 import django_filters
 from .models import Product
+from .categories import category_paths
+from .lookups import brand_ids_by_name, category_ids_by_name
 
 class ProductFilter(django_filters.FilterSet):
     price_min = django_filters.NumberFilter(field_name='price', lookup_expr='gte')
     price_max = django_filters.NumberFilter(field_name='price', lookup_expr='lte')
-    category = django_filters.CharFilter(field_name='category__name', lookup_expr='iexact')
-    brand = django_filters.CharFilter(field_name='brand__name', lookup_expr='iexact')
+    # The price after discount, stored and indexed on the row
+    effective_price_min = django_filters.NumberFilter(field_name='effective_price', lookup_expr='gte')
+    effective_price_max = django_filters.NumberFilter(field_name='effective_price', lookup_expr='lte')
+    # Names are resolved to ids through a cached map, so the product query needs no joins
+    category = django_filters.CharFilter(method='filter_category')
+    brand = django_filters.CharFilter(method='filter_brand')
+    is_on_sale = django_filters.BooleanFilter(field_name='is_on_sale')
+    in_stock = django_filters.BooleanFilter(method='filter_in_stock')
+    min_rating = django_filters.NumberFilter(field_name='average_rating', lookup_expr='gte')
+    category_tree = django_filters.NumberFilter(method='filter_category_tree')
 
     class Meta:
         model = Product
-        fields = ['category', 'brand', 'price_min', 'price_max']
+        fields = [
+            'category', 'brand', 'price_min', 'price_max', 'effective_price_min', 'effective_price_max',
+            'is_on_sale', 'in_stock', 'min_rating', 'category_tree',
+        ]
+
+    def filter_category(self, queryset, name, value):
+        return queryset.filter(category_id__in=category_ids_by_name(value))
+
+    def filter_brand(self, queryset, name, value):
+        return queryset.filter(brand_id__in=brand_ids_by_name(value))
+
+    def filter_in_stock(self, queryset, name, value):
+        return queryset.filter(stock__gt=0) if value else queryset.filter(stock=0)
+
+    def filter_category_tree(self, queryset, name, value):
+        """Products in a category or any of its descendants, as one prefix match on the path index."""
+        path = category_paths().get(int(value))
+        if not path:
+            return queryset.none()
+        return queryset.filter(category__path__startswith=path)
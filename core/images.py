@@ -0,0 +1,82 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import close_old_connections
+from django.db.models.functions import Now
+from PIL import Image
+
+from .cache import CATALOG_CACHE_NAMESPACE, invalidate
+from .models import Product
+
+VARIANT_WIDTHS = [160, 480, 960]
+THUMBNAIL_WIDTH = VARIANT_WIDTHS[0]
+WEBP_QUALITY = 80
+
+# Variants are rendered off the request path; IMAGE_VARIANT_WORKERS sizes the pool
+_executor = None
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=getattr(settings, 'IMAGE_VARIANT_WORKERS', 2), thread_name_prefix='image-variants',
+        )
+    return _executor
+
+
+def variants_are_current(product):
+    return bool(product.image) and product.image_variants.get('source') == product.image.name
+
+
+def generate_variants(product):
+    """
+    Render WebP copies of the product image at each width in VARIANT_WIDTHS, never upscaling.
+
+    Stores `{'source': <image name>, 'widths': {'160': <name>, ...}}` on the product with a
+    queryset update so no save signals fire again. Returns the stored map.
+    """
+    with product.image.open('rb') as handle:
+        original = Image.open(handle)
+        original.load()
+    if original.mode not in ('RGB', 'RGBA'):
+        original = original.convert('RGBA' if 'A' in original.getbands() or original.mode == 'P' else 'RGB')
+
+    stem = os.path.splitext(os.path.basename(product.image.name))[0]
+    folder = os.path.join(os.path.dirname(product.image.name), 'variants')
+    widths = {}
+    for width in VARIANT_WIDTHS:
+        if width > original.width and widths:
+            break
+        target = min(width, original.width)
+        resized = original.resize((target, round(original.height * target / original.width)), Image.LANCZOS)
+        buffer = BytesIO()
+        resized.save(buffer, 'WEBP', quality=WEBP_QUALITY, method=4)
+        name = os.path.join(folder, f'{stem}_{target}.webp')
+        if default_storage.exists(name):
+            default_storage.delete(name)
+        widths[str(target)] = default_storage.save(name, ContentFile(buffer.getvalue()))
+
+    variants = {'source': product.image.name, 'widths': widths}
+    Product.objects.filter(pk=product.pk).update(image_variants=variants, updated_at=Now())
+    invalidate(CATALOG_CACHE_NAMESPACE)
+    product.image_variants = variants
+    return variants
+
+
+def _generate_in_worker(product_id):
+    try:
+        product = Product.objects.filter(pk=product_id).first()
+        if product is not None and product.image and not variants_are_current(product):
+            generate_variants(product)
+    finally:
+        close_old_connections()
+
+
+def schedule_variants(product_id):
+    """Queue variant generation for a product on the worker pool."""
+    return get_executor().submit(_generate_in_worker, product_id)
@@ -0,0 +1,31 @@
+import hashlib
+
+from django.db.models.functions import Lower
+
+from .cache import cached
+from .categories import CATEGORY_CACHE_NAMESPACE
+from .models import Brand, Category
+
+BRAND_CACHE_NAMESPACE = 'brand'
+
+
+def _ids_by_name(model, namespace, name):
+    """
+    Resolve a case-insensitive name to ids, cached until the model's namespace is bumped.
+
+    Misses run `LOWER(name) = %s`, which the functional lower(name) index answers.
+    """
+    key = name.strip().lower()
+    digest = hashlib.md5(key.encode(), usedforsecurity=False).hexdigest()
+    return cached(namespace, f'{model._meta.model_name}_ids:{digest}', lambda: list(
+        model.objects.annotate(name_lower=Lower('name')).filter(name_lower=key).values_list('id', flat=True)
+    ))
+
+
+def category_ids_by_name(name):
+    # Category names are only unique per parent, so a name can map to several ids
+    return _ids_by_name(Category, CATEGORY_CACHE_NAMESPACE, name)
+
+
+def brand_ids_by_name(name):
+    return _ids_by_name(Brand, BRAND_CACHE_NAMESPACE, name)
@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand
+
+from core.benchmark import run_load
+
+# Sync endpoint on the WSGI server -> async counterpart on the ASGI server
+ROUTES = [
+    ('/api/products/', '/api/async/products/'),
+    ('/api/products/{product_id}/', '/api/async/products/{product_id}/'),
+    ('/api/categories/', '/api/async/categories/'),
+]
+
+
+class Command(BaseCommand):
+    help = (
+        'Compare requests/s and p99 latency of the WSGI product/category endpoints with their async '
+        'counterparts on ASGI. Start both servers first, for example '
+        '`gunicorn backend.wsgi -w 4 -b :8000` and `uvicorn backend.asgi:application --port 8001`.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--wsgi-url', default='http://127.0.0.1:8000')
+        parser.add_argument('--asgi-url', default='http://127.0.0.1:8001')
+        parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 16, 64])
+        parser.add_argument('--requests', type=int, default=1000, help='Requests per route and level.')
+        parser.add_argument('--product-id', type=int, default=1)
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"{'route':<40} {'conc':>5} {'server':>6} {'req/s':>9} {'p50 ms':>8} {'p99 ms':>8} {'err':>4}")
+        for sync_path, async_path in ROUTES:
+            for concurrency in options['concurrency']:
+                for server, base, path in (('wsgi', options['wsgi_url'], sync_path),
+                                           ('asgi', options['asgi_url'], async_path)):
+                    path = path.format(product_id=options['product_id'])
+                    result = run_load(base.rstrip('/') + path, concurrency, options['requests'])
+                    self.stdout.write(
+                        f"{sync_path:<40} {concurrency:>5} {server:>6} {result['rps']:>9} "
+                        f"{result['p50_ms']:>8} {result['p99_ms']:>8} {result['errors']:>4}"
+                    )
@@ -0,0 +1,174 @@
+import json
+import subprocess
+import time
+
+from django.apps import apps
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from django.urls import URLPattern, URLResolver, get_resolver, reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from core.benchmark import percentile
+from core.models import Product
+
+BENCHMARK_USERNAME = 'benchmark'
+BENCHMARK_PASSWORD = 'benchmark-password'
+# Sample values for URL parameters that do not name an object
+SAMPLE_KWARGS = {'app_label': 'core'}
+# Routes that need query parameters
+GET_PARAMS = {
+    'product-search': lambda run: {'q': run.search_term},
+}
+# Routes that only accept POST, with a body built from the run's state
+POST_ROUTES = {
+    'checkout': lambda run: {'items': [{'product': run.product_id, 'quantity': 1}]},
+    'bulk_pricing': lambda run: {'products': [run.product_id], 'discount_percentage': 10, 'is_on_sale': True},
+    'register': lambda run: {'username': f'benchmark{next(run.counter)}', 'email': 'benchmark@example.com',
+                             'password': 'Benchmark-pass-123'},
+    'token_obtain_pair': lambda run: {'username': BENCHMARK_USERNAME, 'password': BENCHMARK_PASSWORD},
+    'token_refresh': lambda run: {'refresh': run.refresh_token},
+}
+
+
+def iter_routes(patterns=None, namespace='', params=()):
+    """Yield `(name, parameter names)` for every named URL pattern, with includes flattened."""
+    if patterns is None:
+        patterns = get_resolver().url_patterns
+    for pattern in patterns:
+        names = params + tuple(pattern.pattern.regex.groupindex)
+        if isinstance(pattern, URLResolver):
+            prefix = f'{namespace}{pattern.namespace}:' if pattern.namespace else namespace
+            yield from iter_routes(pattern.url_patterns, prefix, names)
+        elif isinstance(pattern, URLPattern) and pattern.name:
+            yield f'{namespace}{pattern.name}', names
+
+
+def model_for_route(name):
+    """Guess which model a route's object id refers to from the earliest model name in the route name."""
+    matches = []
+    for model in apps.get_models():
+        position = name.find(model._meta.model_name)
+        if position != -1:
+            matches.append((position, -len(model._meta.model_name), model))
+    return min(matches, key=lambda match: match[:2])[2] if matches else None
+
+
+class Command(BaseCommand):
+    help = (
+        'Request every named route in the project URLconf in-process and write p50/p99 latency, queries '
+        'per request and response bytes to a JSON file, so runs can be diffed between commits. Runs '
+        'inside a transaction that is rolled back, so writes made by the routes are discarded.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', default='benchmark.json', help='JSON file the results are written to.')
+        parser.add_argument('--repeat', type=int, default=20, help='Timed requests per route, after one warm-up.')
+        parser.add_argument('--anonymous', action='store_true',
+                            help='Do not log in, so anonymous reads can be served by the response cache.')
+        parser.add_argument('--include', nargs='*', default=None, help='Only routes whose name contains one of these.')
+
+    def handle(self, *args, **options):
+        if not Product.objects.exists():
+            raise CommandError('The catalog is empty; run generate_catalog first.')
+        started = timezone.now()
+        with transaction.atomic():
+            results = self.run(options)
+            transaction.set_rollback(True)
+
+        report = {
+            'started_at': started.isoformat(),
+            'commit': self.git_commit(),
+            'database': connection.vendor,
+            'repeat': options['repeat'],
+            'anonymous': options['anonymous'],
+            'catalog': {model._meta.model_name: model.objects.count() for model in apps.get_app_config('core').get_models()},
+            'routes': results,
+        }
+        with open(options['output'], 'w', encoding='utf-8') as handle:
+            json.dump(report, handle, indent=2, sort_keys=True)
+        self.stdout.write(self.style.SUCCESS(f"Wrote {len(results)} routes to {options['output']}."))
+
+    def run(self, options):
+        user, _ = User.objects.get_or_create(username=BENCHMARK_USERNAME)
+        user.is_staff = user.is_superuser = True
+        user.set_password(BENCHMARK_PASSWORD)
+        user.save()
+        self.client = APIClient()
+        if not options['anonymous']:
+            self.client.force_authenticate(user)  # API views
+            self.client.force_login(user)  # Admin views
+        self.product_id, name = Product.objects.values_list('id', 'name').first()
+        self.search_term = name.split()[0]
+        self.counter = iter(range(10 ** 9))
+        self.refresh_token = APIClient().post(
+            reverse('token_obtain_pair'), {'username': BENCHMARK_USERNAME, 'password': BENCHMARK_PASSWORD},
+        ).json().get('refresh', '')
+
+        self.stdout.write(f"{'route':<45} {'status':>6} {'p50 ms':>8} {'p99 ms':>8} {'queries':>8} {'bytes':>9}")
+        results = {}
+        for name, params in sorted(set(iter_routes())):
+            if 'format' in params:
+                continue  # Format-suffix duplicates of routes measured without the suffix
+            if options['include'] and not any(part in name for part in options['include']):
+                continue
+            path, skipped = self.build_path(name, params)
+            if path is None:
+                results[name] = {'skipped': skipped}
+                self.stdout.write(f'{name:<45} skipped: {skipped}')
+                continue
+            results[name] = result = self.measure(name, path, options['repeat'])
+            self.stdout.write(
+                f"{name:<45} {result['status']:>6} {result['p50_ms']:>8} {result['p99_ms']:>8} "
+                f"{result['queries']:>8} {result['bytes']:>9}"
+            )
+        return results
+
+    def build_path(self, name, params):
+        kwargs = {}
+        for param in params:
+            if param in SAMPLE_KWARGS:
+                kwargs[param] = SAMPLE_KWARGS[param]
+                continue
+            model = model_for_route(name)
+            pk = model._default_manager.values_list('pk', flat=True).first() if model else None
+            if pk is None:
+                return None, f'no sample value for {param}'
+            kwargs[param] = pk
+        return reverse(name, kwargs=kwargs), None
+
+    def request(self, name, path):
+        body = POST_ROUTES.get(name.rpartition(':')[2])
+        if body is not None:
+            return self.client.post(path, body(self), format='json')
+        params = GET_PARAMS.get(name)
+        return self.client.get(path, params(self) if params else None)
+
+    def measure(self, name, path, repeat):
+        self.request(name, path)  # Warm-up: URL resolution, lazy imports, first-hit caches
+        timings, queries = [], []
+        for _ in range(repeat):
+            with CaptureQueriesContext(connection) as captured:
+                started = time.perf_counter()
+                response = self.request(name, path)
+                content = b''.join(response.streaming_content) if response.streaming else response.content
+                timings.append(time.perf_counter() - started)
+            queries.append(len(captured))
+        return {
+            'path': path,
+            'status': response.status_code,
+            'p50_ms': round(percentile(timings, 50) * 1000, 2),
+            'p99_ms': round(percentile(timings, 99) * 1000, 2),
+            'queries': max(queries),
+            'bytes': len(content),
+        }
+
+    def git_commit(self):
+        try:
+            return subprocess.run(
+                ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True,
+            ).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
@@ -0,0 +1,62 @@
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from core.benchmark import percentile
+from core.models import Product
+from core.views import ProductViewSet
+
+# Query strings compared against the full representation
+FIELD_SETS = [
+    ('full', ''),
+    ('card', 'fields=name,price,is_on_sale,discount_percentage,image'),
+    ('card+rating', 'fields=name,price,discount_percentage,image,average_rating,total_reviews'),
+    ('card+srcset', 'fields=name,price,discount_percentage,image,image_srcset'),
+    ('card+reviews', 'fields=name,price,discount_percentage,image&expand=reviews'),
+    ('flat+related', 'expand=related_products'),
+]
+
+
+class Command(BaseCommand):
+    help = (
+        'Time the product list for each ?fields= / ?expand= set in-process, bypassing the response '
+        'cache, and report latency, queries and payload size against the full representation.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--page-size', type=int, default=100)
+        parser.add_argument('--repeat', type=int, default=50, help='Requests per field set.')
+
+    def handle(self, *args, **options):
+        if not Product.objects.exists():
+            raise CommandError('The catalog is empty; import or generate some products first.')
+        view = ProductViewSet.as_view({'get': 'list'})
+        factory = APIRequestFactory()
+        # An unsaved user is enough to skip the anonymous response cache
+        user = User(username='benchmark')
+
+        self.stdout.write(f"{'field set':<14} {'p50 ms':>8} {'p99 ms':>8} {'queries':>8} {'bytes':>9} {'speedup':>8}")
+        baseline = None
+        for label, query in FIELD_SETS:
+            url = f"/api/products/?page_size={options['page_size']}" + (f'&{query}' if query else '')
+            timings = []
+            for _ in range(options['repeat']):
+                request = factory.get(url)
+                force_authenticate(request, user=user)
+                with CaptureQueriesContext(connection) as queries:
+                    started = time.perf_counter()
+                    response = view(request)
+                    response.render()
+                    timings.append(time.perf_counter() - started)
+            if response.status_code != 200:
+                raise CommandError(f'{url} answered {response.status_code}.')
+            p50 = percentile(timings, 50) * 1000
+            baseline = baseline or p50
+            self.stdout.write(
+                f"{label:<14} {p50:>8.2f} {percentile(timings, 99) * 1000:>8.2f} {len(queries):>8} "
+                f"{len(response.content):>9} {baseline / p50:>7.1f}x"
+            )
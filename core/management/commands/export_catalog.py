@@ -0,0 +1,55 @@
+import csv
+import json
+import time
+
+from django.core.management.base import BaseCommand
+
+from core.models import Product
+from .import_catalog import CATALOG_FIELDS
+
+
+class Command(BaseCommand):
+    help = 'Stream every product to a CSV or JSONL file that import_catalog can read back.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', nargs='?', help='Output file; defaults to stdout.')
+        parser.add_argument('--format', choices=['csv', 'jsonl'], default=None,
+                            help='File format; guessed from the extension by default.')
+        parser.add_argument('--chunk-size', type=int, default=2000, help='Rows fetched per database round-trip.')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        fmt = options['format'] or ('jsonl' if path and path.endswith(('.jsonl', '.ndjson')) else 'csv')
+        rows = Product.objects.order_by('id').values_list(
+            'id', 'name', 'category__name', 'brand__name', 'price', 'stock', 'is_on_sale',
+            'discount_percentage', 'description',
+        ).iterator(chunk_size=options['chunk_size'])
+
+        handle = open(path, 'w', newline='', encoding='utf-8') if path else self.stdout
+        started = time.monotonic()
+        exported = 0
+        try:
+            writer = csv.writer(handle) if fmt == 'csv' else None
+            if writer:
+                writer.writerow(CATALOG_FIELDS)
+            for row in rows:
+                record = dict(zip(CATALOG_FIELDS, row))
+                record['brand'] = record['brand'] or ''
+                record['price'] = str(record['price'])
+                if writer:
+                    writer.writerow(record.values())
+                else:
+                    handle.write(json.dumps(record) + '\n')
+                exported += 1
+                if exported % options['chunk_size'] == 0 and path:
+                    self.report(exported, started)
+        finally:
+            if path:
+                handle.close()
+        if path:
+            self.report(exported, started)
+            self.stdout.write(self.style.SUCCESS(f'Exported {exported} products to {path}.'))
+
+    def report(self, exported, started):
+        elapsed = max(time.monotonic() - started, 1e-6)
+        self.stderr.write(f'{exported} rows, {exported / elapsed:.0f} rows/s')
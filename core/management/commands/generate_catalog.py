@@ -0,0 +1,212 @@
+import random
+import time
+import uuid
+from collections import defaultdict
+from datetime import timedelta
+from decimal import Decimal
+from itertools import accumulate
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from core.cache import CATALOG_CACHE_NAMESPACE, invalidate
+from core.categories import CATEGORY_CACHE_NAMESPACE
+from core.checkout import effective_price
+from core.lookups import BRAND_CACHE_NAMESPACE
+from core.models import Brand, Category, Order, Product, Review
+from core.related import rebuild_related_products
+from core.reports import rollup_orders
+from core.search import reindex_products
+
+ADJECTIVES = ['Classic', 'Urban', 'Trail', 'Pro', 'Lite', 'Retro', 'Studio', 'Everyday', 'Premium', 'Compact']
+NOUNS = ['Runner', 'Jacket', 'Backpack', 'Watch', 'Headphones', 'Sneaker', 'Hoodie', 'Bottle', 'Lamp', 'Speaker']
+WORDS = ['durable', 'lightweight', 'breathable', 'water', 'resistant', 'soft', 'everyday', 'design', 'comfort',
+         'recycled', 'materials', 'travel', 'fit', 'premium', 'finish', 'warranty', 'fast', 'charging']
+# Reviews lean positive, as they do on real storefronts
+RATING_WEIGHTS = [5, 7, 15, 33, 40]
+STATUS_WEIGHTS = {'delivered': 70, 'processing': 20, 'pending': 10}
+
+
+class Command(BaseCommand):
+    help = (
+        'Fill the database with a synthetic catalog for load testing: a category tree, brands, products, '
+        'shoppers, reviews and orders. Popularity follows a Zipf curve, so a few products collect most '
+        'reviews and orders. Everything is inserted in bulk.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--categories', type=int, default=60)
+        parser.add_argument('--branching', type=int, default=4, help='Subcategories per category.')
+        parser.add_argument('--depth', type=int, default=3, help='Levels in the category tree.')
+        parser.add_argument('--brands', type=int, default=40)
+        parser.add_argument('--products', type=int, default=5000)
+        parser.add_argument('--users', type=int, default=500, help='Shoppers writing reviews and placing orders.')
+        parser.add_argument('--reviews', type=int, default=20000)
+        parser.add_argument('--orders', type=int, default=10000)
+        parser.add_argument('--skew', type=float, default=1.1,
+                            help='Zipf exponent of product popularity; 0 spreads activity evenly.')
+        parser.add_argument('--days', type=int, default=365, help='Spread reviews and orders over this many days.')
+        parser.add_argument('--batch-size', type=int, default=2000, help='Rows per bulk insert.')
+        parser.add_argument('--seed', type=int, default=None, help='Seed for a reproducible catalog.')
+
+    def handle(self, *args, **options):
+        if options['categories'] < 1 or options['products'] < 1:
+            raise CommandError('At least one category and one product are needed.')
+        if (options['reviews'] or options['orders']) and options['users'] < 1:
+            raise CommandError('Reviews and orders need at least one user.')
+        self.random = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        self.days = max(options['days'], 1)
+        self.now = timezone.now()
+
+        started = time.monotonic()
+        with transaction.atomic():
+            leaves = self.step('categories', self.create_categories,
+                               options['categories'], options['branching'], options['depth'])
+            brands = self.step('brands', self.create_brands, options['brands'])
+            products = self.step('products', self.create_products, options['products'], leaves, brands)
+            users = self.step('users', self.create_users, options['users'])
+
+            # Popularity ranks are shuffled so the best sellers are spread across categories
+            ranks = list(range(1, len(products) + 1))
+            self.random.shuffle(ranks)
+            popularity = list(accumulate(1 / rank ** options['skew'] for rank in ranks))
+            if users:
+                self.step('reviews', self.create_reviews, options['reviews'], products, popularity, users)
+                self.step('orders', self.create_orders, options['orders'], products, popularity, users)
+
+            reindex_products(Product.objects.filter(pk__gte=products[0].pk))
+            invalidate(CATALOG_CACHE_NAMESPACE)
+            invalidate(CATEGORY_CACHE_NAMESPACE)
+            invalidate(BRAND_CACHE_NAMESPACE)
+        self.step('related-product links', rebuild_related_products)
+        self.stdout.write(self.style.SUCCESS(f'Generated the catalog in {time.monotonic() - started:.1f}s.'))
+
+    def step(self, label, create, *args):
+        started = time.monotonic()
+        result = create(*args)
+        count = result if isinstance(result, int) else len(result)
+        self.stdout.write(f'{count} {label} in {time.monotonic() - started:.1f}s')
+        return result
+
+    def bulk_create(self, model, objects):
+        return model.objects.bulk_create(objects, batch_size=self.batch_size)
+
+    def past(self, days_ago):
+        return self.now - timedelta(days=days_ago, seconds=self.random.randrange(86400))
+
+    def backdate(self, model, field, ids):
+        """Spread rows over the last `days` days with one UPDATE per day, since auto_now_add overwrites bulk values."""
+        by_day = defaultdict(list)
+        for pk in ids:
+            by_day[self.random.randrange(self.days)].append(pk)
+        for days_ago, pks in by_day.items():
+            for start in range(0, len(pks), self.batch_size):
+                model.objects.filter(pk__in=pks[start:start + self.batch_size]).update(**{field: self.past(days_ago)})
+
+    def create_categories(self, total, branching, depth):
+        """Build the tree breadth first, one bulk insert per level; returns the leaf categories."""
+        level, created = [None], []
+        for number in range(max(depth, 1)):
+            remaining = total - len(created)
+            if remaining <= 0:
+                break
+            # The last allowed level takes whatever is left, spread over its parents
+            per_parent = -(-remaining // len(level)) if number == max(depth, 1) - 1 else branching
+            slots = [parent for parent in level for _ in range(per_parent)][:remaining]
+            categories = self.bulk_create(Category, [
+                Category(name=f'{parent.name} / {position}' if parent else f'Department {position}', parent=parent)
+                for position, parent in enumerate(slots, start=1)
+            ])
+            # bulk_create skips Category.save(), so fill in the materialized paths here
+            for category in categories:
+                parent_path = category.parent.path if category.parent else ''
+                category.path = f'{parent_path}{category.pk:0{Category.PATH_STEP}d}/'
+                category.depth = number
+            Category.objects.bulk_update(categories, ['path', 'depth'], batch_size=self.batch_size)
+            created.extend(categories)
+            level = categories
+        parents = {category.parent_id for category in created}
+        return [category for category in created if category.pk not in parents]
+
+    def create_brands(self, total):
+        taken = set(Brand.objects.values_list('name', flat=True))
+        names = (f'Brand {number}' for number in range(1, total + len(taken) + 1))
+        return self.bulk_create(Brand, [Brand(name=name) for name in names if name not in taken][:total])
+
+    def create_products(self, total, categories, brands):
+        products = []
+        for number in range(1, total + 1):
+            on_sale = self.random.random() < 0.2
+            products.append(Product(
+                name=f'{self.random.choice(ADJECTIVES)} {self.random.choice(NOUNS)} {number}',
+                category=self.random.choice(categories),
+                brand=self.random.choice(brands) if brands and self.random.random() < 0.9 else None,
+                # Log-normal prices: mostly tens of dollars with a long tail of expensive items
+                price=Decimal(str(round(min(self.random.lognormvariate(3.8, 0.9), 9999), 2))),
+                stock=0 if self.random.random() < 0.1 else self.random.randint(1, 500),
+                is_on_sale=on_sale,
+                discount_percentage=self.random.choice([10, 15, 20, 25, 30, 50]) if on_sale else 0,
+                description=' '.join(self.random.choices(WORDS, k=self.random.randint(20, 60))),
+                updated_at=self.now,
+            ))
+        return self.bulk_create(Product, products)
+
+    def create_users(self, total):
+        offset = User.objects.aggregate(last=Max('id'))['last'] or 0
+        password = make_password(None)  # Unusable; the shoppers never log in
+        return self.bulk_create(User, [
+            User(username=f'shopper{offset + number}', password=password) for number in range(1, total + 1)
+        ])
+
+    def create_reviews(self, total, products, popularity, users):
+        pairs = set()
+        reviews = []
+        totals = defaultdict(lambda: [0, 0])
+        for product in self.random.choices(products, cum_weights=popularity, k=total):
+            # A popular product can run out of shoppers who have not reviewed it yet
+            for _ in range(5):
+                user = self.random.choice(users)
+                if (product.pk, user.pk) not in pairs:
+                    break
+            else:
+                continue
+            pairs.add((product.pk, user.pk))
+            rating = self.random.choices(range(1, 6), weights=RATING_WEIGHTS)[0]
+            reviews.append(Review(product=product, user=user, rating=rating,
+                                  comment=' '.join(self.random.choices(WORDS, k=self.random.randint(5, 30)))))
+            totals[product.pk][0] += rating
+            totals[product.pk][1] += 1
+        reviews = self.bulk_create(Review, reviews)
+        self.backdate(Review, 'created_at', [review.pk for review in reviews])
+
+        # Store the aggregates that ReviewViewSet would have kept up to date
+        rated = [product for product in products if product.pk in totals]
+        for product in rated:
+            product.rating_sum, product.rating_count = totals[product.pk]
+        Product.objects.bulk_update(rated, ['rating_sum', 'rating_count'], batch_size=self.batch_size)
+        return reviews
+
+    def create_orders(self, total, products, popularity, users):
+        statuses, weights = zip(*STATUS_WEIGHTS.items())
+        orders = []
+        for product in self.random.choices(products, cum_weights=popularity, k=total):
+            status = self.random.choices(statuses, weights=weights)[0]
+            orders.append(Order(
+                user=self.random.choice(users),
+                product=product,
+                quantity=self.random.choices([1, 2, 3, 4], weights=[70, 20, 7, 3])[0],
+                status=status,
+                reference=uuid.uuid4(),
+                unit_price=effective_price(product.price, product.is_on_sale, product.discount_percentage),
+            ))
+        orders = self.bulk_create(Order, orders)
+        self.backdate(Order, 'order_date', [order.pk for order in orders])
+        # Bulk inserts and the backdating skip the Order signals, so roll the new orders up here
+        if orders:
+            rollup_orders(Order.objects.filter(pk__gte=orders[0].pk), chunk_size=self.batch_size)
+        return orders
@@ -0,0 +1,55 @@
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from core.images import generate_variants, variants_are_current
+from core.models import Product
+
+
+def _render(product_id):
+    try:
+        generate_variants(Product.objects.get(pk=product_id))
+        return product_id, None
+    except Exception as error:  # Keep going; one broken file must not stop the backfill
+        return product_id, error
+
+
+def _render_in_thread(product_id):
+    try:
+        return _render(product_id)
+    finally:
+        close_old_connections()
+
+
+class Command(BaseCommand):
+    help = 'Backfill resized WebP variants for product images, rendering them in parallel.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4, help='Images rendered concurrently.')
+        parser.add_argument('--force', action='store_true', help='Regenerate variants that are already current.')
+
+    def handle(self, *args, **options):
+        products = Product.objects.exclude(image='').exclude(image__isnull=True).only('id', 'image', 'image_variants')
+        pending = [p.pk for p in products.iterator() if options['force'] or not variants_are_current(p)]
+        self.stdout.write(f'{len(pending)} products need variants.')
+
+        started = time.monotonic()
+        failed = 0
+        if options['workers'] <= 1:
+            results = map(_render, pending)
+        else:
+            pool = ThreadPoolExecutor(max_workers=options['workers'])
+            results = (future.result() for future in as_completed(pool.submit(_render_in_thread, pk) for pk in pending))
+        for product_id, error in results:
+            if error is not None:
+                failed += 1
+                self.stderr.write(f'Product {product_id}: {error}')
+        if options['workers'] > 1:
+            pool.shutdown()
+
+        elapsed = max(time.monotonic() - started, 1e-6)
+        self.stdout.write(self.style.SUCCESS(
+            f'Rendered {len(pending) - failed} products in {elapsed:.1f}s ({failed} failed).'
+        ))
@@ -0,0 +1,240 @@
+import csv
+import io
+import json
+import time
+from decimal import Decimal, InvalidOperation
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+
+from core.cache import CATALOG_CACHE_NAMESPACE, invalidate
+from core.categories import CATEGORY_CACHE_NAMESPACE
+from core.lookups import BRAND_CACHE_NAMESPACE
+from core.models import Brand, Category, ImportCheckpoint, Product
+from core.related import rebuild_related_products
+from core.search import reindex_products
+
+# Columns understood by import_catalog and written by export_catalog
+CATALOG_FIELDS = [
+    'id', 'name', 'category', 'brand', 'price', 'stock', 'is_on_sale', 'discount_percentage', 'description',
+]
+PRODUCT_FIELDS = ['name', 'category_id', 'brand_id', 'price', 'stock', 'is_on_sale', 'discount_percentage',
+                  'description']
+
+# Every NOT NULL column COPY has to fill, since model defaults are not database defaults
+COPY_COLUMNS = PRODUCT_FIELDS + ['image_variants', 'rating_sum', 'rating_count', 'updated_at']
+
+
+def copy_rows(products):
+    """Render unsaved products as the CSV body of a COPY into COPY_COLUMNS."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for product in products:
+        writer.writerow([
+            product.name, product.category_id, r'\N' if product.brand_id is None else product.brand_id,
+            product.price, product.stock, product.is_on_sale, product.discount_percentage,
+            product.description, '{}', 0, 0, product.updated_at.isoformat(),
+        ])
+    return buffer.getvalue()
+
+
+def read_rows(path, fmt):
+    """Yield `(line number, row dict)` for each catalog row without loading the whole file."""
+    with open(path, newline='', encoding='utf-8') as handle:
+        if fmt == 'csv':
+            reader = csv.DictReader(handle)
+            for row in reader:
+                yield reader.line_num, row
+        else:
+            for line_number, line in enumerate(handle, start=1):
+                if line.strip():
+                    try:
+                        row = json.loads(line)
+                    except ValueError:
+                        raise CommandError(f'Line {line_number}: not valid JSON.')
+                    if not isinstance(row, dict):
+                        raise CommandError(f'Line {line_number}: expected a JSON object.')
+                    yield line_number, row
+
+
+def parse_bool(value):
+    if isinstance(value, bool):
+        return value
+    return str(value).strip().lower() in ('1', 'true', 'yes', 'y')
+
+
+def clean_row(row):
+    """Parse one catalog row into typed values; raises ValueError naming the first bad column."""
+    def text(key):
+        value = row.get(key)
+        return '' if value is None else str(value).strip()
+
+    def number(key, parse, default):
+        value = text(key)
+        if not value:
+            return default
+        try:
+            parsed = parse(value)
+        except (ValueError, InvalidOperation):
+            parsed = None
+        if parsed is None or (isinstance(parsed, Decimal) and not parsed.is_finite()):
+            raise ValueError(f'{key} {value!r} is not a number')
+        if parsed < 0:
+            raise ValueError(f'{key} {value!r} is negative')
+        return parsed
+
+    cleaned = {'id': text('id') or None, 'name': text('name'), 'category': text('category')}
+    for key in ('name', 'category'):
+        if not cleaned[key]:
+            raise ValueError(f'{key} is missing')
+    if not text('price'):
+        raise ValueError('price is missing')
+    if cleaned['id'] is not None and not cleaned['id'].isdigit():
+        raise ValueError(f"id {cleaned['id']!r} is not a number")
+    cleaned.update(
+        brand=text('brand'),
+        price=number('price', Decimal, None),
+        stock=number('stock', int, 0),
+        is_on_sale=parse_bool(row.get('is_on_sale', False)),
+        discount_percentage=number('discount_percentage', int, 0),
+        description=text('description'),
+    )
+    return cleaned
+
+
+class Command(BaseCommand):
+    help = 'Import products from a CSV or JSONL file in batches, resuming from the last committed batch.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='CSV or JSONL file with the export_catalog columns.')
+        parser.add_argument('--format', choices=['csv', 'jsonl'],
+                            help='File format; guessed from the extension by default.')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Rows committed per batch.')
+        parser.add_argument('--checkpoint',
+                            help='Name of the progress record used to resume; defaults to the absolute path.')
+        parser.add_argument('--no-copy', action='store_true', help='Use bulk_create even on PostgreSQL.')
+        parser.add_argument('--skip-related', action='store_true',
+                            help='Do not rebuild the related-products index afterwards.')
+
+    def handle(self, *args, **options):
+        path = Path(options['path'])
+        if not path.exists():
+            raise CommandError(f'{path} does not exist.')
+        fmt = options['format'] or ('jsonl' if path.suffix in ('.jsonl', '.ndjson') else 'csv')
+        self.checkpoint = options['checkpoint'] or str(path.resolve())
+        self.use_copy = connection.vendor == 'postgresql' and not options['no_copy']
+        self.categories = {name.lower(): pk for pk, name in Category.objects.values_list('id', 'name')}
+        self.brands = {name.lower(): pk for pk, name in Brand.objects.values_list('id', 'name')}
+
+        done = ImportCheckpoint.objects.filter(source=self.checkpoint).values_list('position', flat=True).first() or 0
+        if done:
+            self.stdout.write(f'Resuming after row {done}.')
+
+        started = time.monotonic()
+        imported = 0
+        batch = []
+        number = 0
+        for number, (line, row) in enumerate(read_rows(path, fmt), start=1):
+            if number <= done:
+                continue
+            # Rejected before its batch is written, so a resumed run starts at the first row of that batch
+            try:
+                batch.append(clean_row(row))
+            except ValueError as error:
+                raise CommandError(f'Line {line} (row {number}): {error}.')
+            if len(batch) == options['batch_size']:
+                imported += self.write_batch(batch, number)
+                self.report(number, imported, started)
+                batch = []
+        if batch:
+            imported += self.write_batch(batch, number)
+            self.report(number, imported, started)
+        ImportCheckpoint.objects.filter(source=self.checkpoint).delete()
+
+        if imported and not options['skip_related']:
+            rebuild_related_products()
+        self.stdout.write(self.style.SUCCESS(f'Imported {imported} products.'))
+
+    def report(self, position, imported, started):
+        elapsed = max(time.monotonic() - started, 1e-6)
+        self.stdout.write(f'{position} rows read, {imported} imported, {imported / elapsed:.0f} rows/s')
+
+    def resolve(self, rows, key, lookup, model):
+        """Map names to ids, creating every missing one with a single bulk insert."""
+        missing = {}
+        for row in rows:
+            name = row[key]
+            if name and name.lower() not in lookup:
+                missing.setdefault(name.lower(), name)
+        if not missing:
+            return
+        created = model.objects.bulk_create([model(name=name) for name in missing.values()])
+        if model is Category:
+            # bulk_create skips Category.save(), so give the new roots their paths here
+            for category in created:
+                category.path = f'{category.pk:0{Category.PATH_STEP}d}/'
+            Category.objects.bulk_update(created, ['path'])
+        lookup.update({obj.name.lower(): obj.pk for obj in created})
+
+    def build(self, row):
+        """An unsaved product from a `clean_row` dict whose category and brand are resolved."""
+        return Product(
+            name=row['name'],
+            category_id=self.categories[row['category'].lower()],
+            brand_id=self.brands[row['brand'].lower()] if row['brand'] else None,
+            price=row['price'],
+            stock=row['stock'],
+            is_on_sale=row['is_on_sale'],
+            discount_percentage=row['discount_percentage'],
+            description=row['description'],
+            updated_at=timezone.now(),
+        )
+
+    def write_batch(self, rows, position):
+        with transaction.atomic():
+            self.resolve(rows, 'category', self.categories, Category)
+            self.resolve(rows, 'brand', self.brands, Brand)
+            products = [(row['id'], self.build(row)) for row in rows]
+
+            ids = [int(pk) for pk, _ in products if pk is not None]
+            existing = set(Product.objects.filter(pk__in=ids).values_list('pk', flat=True))
+            updates, creates = [], []
+            for pk, product in products:
+                if pk is not None and int(pk) in existing:
+                    product.pk = int(pk)
+                    updates.append(product)
+                else:
+                    creates.append(product)
+
+            if updates:
+                Product.objects.bulk_update(updates, PRODUCT_FIELDS + ['updated_at'])
+            if creates:
+                before = Product.objects.order_by('-pk').values_list('pk', flat=True).first() or 0
+                if self.use_copy:
+                    self.copy(creates)
+                else:
+                    Product.objects.bulk_create(creates)
+                reindex_products(Product.objects.filter(pk__gt=before))
+            if updates:
+                reindex_products(Product.objects.filter(pk__in=[p.pk for p in updates]))
+
+            # Committed with the batch, so a crash cannot re-import it on resume
+            ImportCheckpoint.objects.update_or_create(source=self.checkpoint, defaults={'position': position})
+            invalidate(CATALOG_CACHE_NAMESPACE)
+            invalidate(CATEGORY_CACHE_NAMESPACE)
+            invalidate(BRAND_CACHE_NAMESPACE)
+        return len(rows)
+
+    def copy(self, products):
+        """Stream new rows into PostgreSQL with COPY instead of INSERT statements."""
+        sql = f"COPY core_product ({', '.join(COPY_COLUMNS)}) FROM STDIN WITH (FORMAT csv, NULL '\\N')"
+        buffer = io.StringIO(copy_rows(products))
+        with connection.cursor() as cursor:
+            raw = cursor.cursor
+            if hasattr(raw, 'copy'):  # psycopg 3
+                with raw.copy(sql) as copy:
+                    copy.write(buffer.getvalue())
+            else:  # psycopg2
+                raw.copy_expert(sql, buffer)
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from core.related import RELATED_PRODUCTS_LIMIT, rebuild_related_products
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the precomputed related-products index for the whole catalog.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type=int, default=RELATED_PRODUCTS_LIMIT,
+                            help='Number of neighbours stored per product.')
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Rows written per bulk insert.')
+
+    def handle(self, *args, **options):
+        written = rebuild_related_products(limit=options['limit'], batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Wrote {written} related-product links.'))
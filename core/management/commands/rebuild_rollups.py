@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+
+from core.reports import ROLLUP_CHUNK_SIZE, rebuild_sales_rollups
+
+
+class Command(BaseCommand):
+    help = 'Recompute the daily sales rollups from the order table, reading it in id-ordered chunks.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--since', help='Only rebuild days from this date (YYYY-MM-DD) onwards.')
+        parser.add_argument('--chunk-size', type=int, default=ROLLUP_CHUNK_SIZE, help='Orders read per chunk.')
+
+    def handle(self, *args, **options):
+        since = None
+        if options['since']:
+            since = parse_date(options['since'])
+            if since is None:
+                raise CommandError('--since must be a date such as 2025-01-31.')
+        counted = rebuild_sales_rollups(chunk_size=options['chunk_size'], since=since)
+        self.stdout.write(self.style.SUCCESS(f'Rolled up {counted} orders.'))
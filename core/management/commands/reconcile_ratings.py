@@ -0,0 +1,51 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from core.cache import CATALOG_CACHE_NAMESPACE, invalidate
+from core.models import Product
+
+
+class Command(BaseCommand):
+    help = 'Recompute the stored product rating aggregates from the reviews table and fix any drift.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help='Products checked per batch.')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        checked = fixed = 0
+        last_id = 0
+        while True:
+            batch = list(
+                Product.objects.filter(id__gt=last_id).order_by('id')
+                .annotate(actual_sum=Coalesce(Sum('reviews__rating'), 0), actual_count=Count('reviews'))
+                .only('id', 'rating_sum', 'rating_count')[:batch_size]
+            )
+            if not batch:
+                break
+            last_id = batch[-1].id
+            checked += len(batch)
+
+            drifted = []
+            for product in batch:
+                if (product.rating_sum, product.rating_count) != (product.actual_sum, product.actual_count):
+                    # Applied as deltas like Product.adjust_rating, so a review written after this read
+                    # keeps its own adjustment instead of being overwritten by stale absolutes
+                    product.rating_sum = F('rating_sum') + (product.actual_sum - product.rating_sum)
+                    product.rating_count = F('rating_count') + (product.actual_count - product.rating_count)
+                    # bulk_update() skips auto_now, and conditional GETs validate against updated_at
+                    product.updated_at = timezone.now()
+                    drifted.append(product)
+            if drifted:
+                with transaction.atomic():
+                    Product.objects.bulk_update(drifted, ['rating_sum', 'rating_count', 'updated_at'])
+                fixed += len(drifted)
+
+        if fixed:
+            invalidate(CATALOG_CACHE_NAMESPACE)
+
+        self.stdout.write(self.style.SUCCESS(f'Checked {checked} products, fixed {fixed}.'))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from core.pricing import run_scheduled_sales
+
+
+class Command(BaseCommand):
+    help = (
+        'Start the scheduled sales whose start time has passed and end the ones whose end time has. '
+        'Meant to run every minute from cron or a similar scheduler; overlapping runs are safe.'
+    )
+
+    def handle(self, *args, **options):
+        started, ended = run_scheduled_sales()
+        self.stdout.write(self.style.SUCCESS(f'Started {started} and ended {ended} scheduled sales.'))
@@ -0,0 +1,206 @@
+import json
+import logging
+import time
+from collections import Counter
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db.backends.signals import connection_created
+
+from .db_router import begin_request, end_request
+
+logger = logging.getLogger('core.queries')
+
+_recorder = ContextVar('query_recorder', default=None)
+
+# After a write, the client's reads stay on the primary this long so replica lag cannot hide it
+REPLICA_PIN_COOKIE = 'db_primary_pin'
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+
+class QueryRecorder:
+    """Count, time and group the SQL statements run while it is active."""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.statements = Counter()
+
+    def record(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - started
+            self.count += 1
+            # Keyed by SQL text without params, so an N+1 loop shows up as one statement repeated
+            self.statements[sql] += 1
+
+    def repeated(self, threshold):
+        return [(sql, count) for sql, count in self.statements.most_common() if count >= threshold]
+
+
+def record_query(execute, sql, params, many, context):
+    recorder = _recorder.get()
+    if recorder is None:
+        return execute(sql, params, many, context)
+    return recorder.record(execute, sql, params, many, context)
+
+
+def install_query_recorder(sender, connection, **kwargs):
+    # Installed once per connection; the context variable decides which request it counts for,
+    # which also follows async views into the threads that run their queries
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+connection_created.connect(install_query_recorder, dispatch_uid='core.install_query_recorder')
+
+
+class QueryInstrumentationMiddleware:
+    """
+    Measure SQL per request: a `Server-Timing` header with the database and total time, and one
+    JSON log line on `core.queries`, logged as a warning when a statement repeats
+    settings.QUERY_REPEAT_THRESHOLD times or more.
+
+    Streaming responses query while their body is consumed, after the headers are sent; their
+    log line is written once the body is exhausted or closed and covers those queries too.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.threshold = settings.QUERY_REPEAT_THRESHOLD
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        recorder, token, started = self.start()
+        try:
+            response = self.get_response(request)
+        finally:
+            _recorder.reset(token)
+        return self.finish(request, response, recorder, started)
+
+    async def __acall__(self, request):
+        recorder, token, started = self.start()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _recorder.reset(token)
+        return self.finish(request, response, recorder, started)
+
+    def start(self):
+        recorder = QueryRecorder()
+        return recorder, _recorder.set(recorder), time.perf_counter()
+
+    def finish(self, request, response, recorder, started):
+        total_ms = (time.perf_counter() - started) * 1000
+        response['Server-Timing'] = (
+            f'db;dur={recorder.duration * 1000:.1f};desc="{recorder.count} queries", total;dur={total_ms:.1f}'
+        )
+        if not response.streaming:
+            self.log(request, response, recorder, started)
+        elif response.is_async:
+            response.streaming_content = self.arecord_stream(
+                response.streaming_content, request, response, recorder, started,
+            )
+        else:
+            response.streaming_content = self.record_stream(
+                response.streaming_content, request, response, recorder, started,
+            )
+        return response
+
+    def record_stream(self, content, request, response, recorder, started):
+        # Set and restored around each chunk, since the server consumes the body outside this context
+        try:
+            while True:
+                previous = _recorder.get()
+                _recorder.set(recorder)
+                try:
+                    chunk = next(content, None)
+                finally:
+                    _recorder.set(previous)
+                if chunk is None:
+                    break
+                yield chunk
+        finally:
+            self.log(request, response, recorder, started)
+
+    async def arecord_stream(self, content, request, response, recorder, started):
+        try:
+            while True:
+                previous = _recorder.get()
+                _recorder.set(recorder)
+                try:
+                    chunk = await anext(content, None)
+                finally:
+                    _recorder.set(previous)
+                if chunk is None:
+                    break
+                yield chunk
+        finally:
+            self.log(request, response, recorder, started)
+
+    def log(self, request, response, recorder, started):
+        repeated = recorder.repeated(self.threshold)
+        entry = {
+            'method': request.method,
+            'path': request.path,
+            'status': response.status_code,
+            'queries': recorder.count,
+            'db_ms': round(recorder.duration * 1000, 1),
+            'total_ms': round((time.perf_counter() - started) * 1000, 1),
+            'repeated': [{'sql': sql[:200], 'count': count} for sql, count in repeated],
+        }
+        logger.log(logging.WARNING if repeated else logging.INFO, json.dumps(entry))
+
+
+class ReplicaRoutingMiddleware:
+    """
+    Let PrimaryReplicaRouter serve this request's reads from a replica when it is a safe method
+    and the client has not written in the last settings.REPLICA_PIN_SECONDS; pin the client when it writes.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.pin_seconds = settings.REPLICA_PIN_SECONDS
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        state, token = self.start(request)
+        try:
+            response = self.get_response(request)
+        finally:
+            end_request(token)
+        return self.finish(response, state)
+
+    async def __acall__(self, request):
+        state, token = self.start(request)
+        try:
+            response = await self.get_response(request)
+        finally:
+            end_request(token)
+        return self.finish(response, state)
+
+    def start(self, request):
+        pinned = REPLICA_PIN_COOKIE in request.COOKIES
+        return begin_request(replica_reads=request.method in SAFE_METHODS and not pinned)
+
+    def finish(self, response, state):
+        if state.wrote:
+            response.set_cookie(REPLICA_PIN_COOKIE, '1', max_age=self.pin_seconds, httponly=True, samesite='Lax')
+        return response
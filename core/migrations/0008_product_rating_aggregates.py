@@ -0,0 +1,42 @@
+# Generated by Django 5.1.7 on 2026-10-18 10:55
+
+import django.db.models.expressions
+import django.db.models.functions.comparison
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Sum
+
+
+def backfill_rating_aggregates(apps, schema_editor):
+    Product = apps.get_model('core', 'Product')
+    Review = apps.get_model('core', 'Review')
+    totals = Review.objects.filter(product=OuterRef('pk')).values('product')
+    Product.objects.filter(id__in=Review.objects.values('product')).update(
+        rating_sum=Subquery(totals.annotate(total=Sum('rating')).values('total')),
+        rating_count=Subquery(totals.annotate(total=Count('id')).values('total')),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_relatedproduct'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='rating_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_sum',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='average_rating',
+            field=models.GeneratedField(db_index=True, db_persist=True, expression=models.Case(models.When(rating_count=0, then=models.Value(0.0)), default=django.db.models.expressions.CombinedExpression(django.db.models.functions.comparison.Cast('rating_sum', models.FloatField()), '/', models.F('rating_count'))), output_field=models.FloatField()),
+        ),
+        migrations.RunPython(backfill_rating_aggregates, migrations.RunPython.noop),
+    ]
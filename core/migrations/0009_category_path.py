@@ -0,0 +1,46 @@
+# Generated by Django 5.1.7 on 2026-10-18 10:56
+
+from django.db import migrations, models
+
+
+def backfill_category_paths(apps, schema_editor):
+    Category = apps.get_model('core', 'Category')
+    categories = {category.pk: category for category in Category.objects.all()}
+
+    def build(category, seen=()):
+        if category.path:
+            return category.path
+        parent = categories.get(category.parent_id)
+        parent_path = build(parent, seen + (category.pk,)) if parent and parent.pk not in seen else ''
+        category.path = f"{parent_path}{category.pk:010d}/"
+        category.depth = category.path.count('/') - 1
+        return category.path
+
+    for category in categories.values():
+        build(category)
+    Category.objects.bulk_update(categories.values(), ['path', 'depth'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_product_rating_aggregates'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='category',
+            name='depth',
+            field=models.PositiveSmallIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='category',
+            name='path',
+            field=models.CharField(blank=True, editable=False, max_length=255),
+        ),
+        migrations.AddIndex(
+            model_name='category',
+            index=models.Index(fields=['path'], name='core_category_path_idx', opclasses=['varchar_pattern_ops']),
+        ),
+        migrations.RunPython(backfill_category_paths, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.1.7 on 2026-10-18 10:59
+
+import django.db.models.functions.text
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0010_review_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='brand',
+            index=models.Index(django.db.models.functions.text.Lower('name'), name='core_brand_lower_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='category',
+            index=models.Index(django.db.models.functions.text.Lower('name'), name='core_category_lower_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['category', 'is_on_sale', 'price'], name='core_product_cat_sale_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['brand', 'is_on_sale', 'price'], name='core_product_brand_sale_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(condition=models.Q(('stock__gt', 0)), fields=['category', 'price'], name='core_product_in_stock_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['category', '-average_rating'], name='core_product_cat_rating_idx'),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.1.7 on 2026-10-18 11:02
+
+from django.db import migrations
+
+
+def install_search_index(apps, schema_editor):
+    from core.search import get_backend
+
+    backend = get_backend(schema_editor.connection)
+    if backend is None:
+        return
+    backend.install(schema_editor)
+    with schema_editor.connection.cursor() as cursor:
+        backend.reindex(apps.get_model('core', 'Product').objects.all(), cursor)
+
+
+def uninstall_search_index(apps, schema_editor):
+    from core.search import get_backend
+
+    backend = get_backend(schema_editor.connection)
+    if backend is not None:
+        backend.uninstall(schema_editor)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0011_storefront_filter_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(install_search_index, uninstall_search_index),
+    ]
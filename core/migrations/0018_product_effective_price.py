@@ -0,0 +1,25 @@
+# Generated by Django 5.1.7 on 2026-10-18 11:29
+
+import django.db.models.expressions
+import django.db.models.functions.math
+from decimal import Decimal
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0017_sales_rollup'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='effective_price',
+            field=models.GeneratedField(db_index=True, db_persist=True, expression=models.Case(models.When(discount_percentage__gt=0, is_on_sale=True, then=django.db.models.functions.math.Round(django.db.models.expressions.CombinedExpression(django.db.models.expressions.CombinedExpression(models.F('price'), '*', django.db.models.expressions.CombinedExpression(models.Value(100), '-', models.F('discount_percentage'))), '*', models.Value(Decimal('0.01'))), 2)), default=models.F('price')), output_field=models.DecimalField(decimal_places=2, max_digits=10)),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['category', 'effective_price'], name='core_product_cat_eff_price_idx'),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.1.7 on 2026-10-18 11:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0018_product_effective_price'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ScheduledSale',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(blank=True, max_length=100)),
+                ('selection', models.JSONField(default=dict)),
+                ('discount_percentage', models.PositiveIntegerField()),
+                ('starts_at', models.DateTimeField()),
+                ('ends_at', models.DateTimeField(blank=True, null=True)),
+                ('status', models.CharField(choices=[('scheduled', 'Scheduled'), ('active', 'Active'), ('ended', 'Ended')], default='scheduled', editable=False, max_length=20)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['status', 'starts_at'], name='core_sale_due_start_idx'), models.Index(fields=['status', 'ends_at'], name='core_sale_due_end_idx')],
+            },
+        ),
+    ]
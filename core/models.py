@@ -1,5 +1,10 @@
+from decimal import Decimal
+
 from django.db import models
+from django.db.models import Case, DecimalField, F, FloatField, Q, Value, When
+from django.db.models.functions import Cast, Concat, Lower, Now, Round, Substr
 from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError
 from django.utils.safestring import mark_safe
 
 # ------------------ CATEGORY MODEL ------------------
@@ -13,15 +18,47 @@ class Category(models.Model):
         blank=True, 
         related_name='subcategories'
     )
+    # Materialized path of zero-padded ancestor ids, e.g. "0000000001/0000000004/"
+    path = models.CharField(max_length=255, blank=True, editable=False)
+    depth = models.PositiveSmallIntegerField(default=0, editable=False)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    PATH_STEP = 10
 
     class Meta:
         verbose_name_plural = 'Categories'
+        indexes = [
+            # varchar_pattern_ops lets PostgreSQL use the index for path LIKE 'prefix%'
+            models.Index(fields=['path'], name='core_category_path_idx', opclasses=['varchar_pattern_ops']),
+            models.Index(Lower('name'), name='core_category_lower_name_idx'),
+        ]
 
     def __str__(self):
         if self.parent:
             return f"{self.parent.name} → {self.name}"
         return self.name
 
+    def clean(self):
+        if self.pk and self.parent_id and self.parent.path.startswith(self.path):
+            raise ValidationError({'parent': 'A category cannot be nested under itself or its descendants.'})
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        old_path, old_depth = self.path, self.depth
+        parent_path = self.parent.path if self.parent_id else ''
+        self.path = f"{parent_path}{self.pk:0{self.PATH_STEP}d}/"
+        self.depth = self.path.count('/') - 1
+        if self.path == old_path:
+            return
+        Category.objects.filter(pk=self.pk).update(path=self.path, depth=self.depth, updated_at=Now())
+        if old_path:
+            # Re-root the whole subtree in a single UPDATE
+            Category.objects.filter(path__startswith=old_path).exclude(pk=self.pk).update(
+                path=Concat(Value(self.path), Substr('path', len(old_path) + 1)),
+                depth=F('depth') + (self.depth - old_depth),
+                updated_at=Now(),
+            )
+
 # ------------------ PRODUCT MODEL ------------------
 class Product(models.Model):
     name = models.CharField(max_length=100)
@@ -41,19 +78,94 @@ class Product(models.Model):
     stock = models.PositiveIntegerField()
     is_on_sale = models.BooleanField(default=False)
     discount_percentage = models.PositiveIntegerField(default=0, null=True, blank=True)
+    # The price after any sale discount, rounded to cents half up like core.checkout.effective_price
+    effective_price = models.GeneratedField(
+        expression=Case(
+            When(
+                is_on_sale=True, discount_percentage__gt=0,
+                then=Round(F('price') * (Value(100) - F('discount_percentage')) * Value(Decimal('0.01')), 2),
+            ),
+            default=F('price'),
+        ),
+        output_field=DecimalField(max_digits=10, decimal_places=2),
+        db_persist=True,
+        db_index=True,
+    )
     image = models.ImageField(upload_to='product_images/', blank=True, null=True)
+    # Resized WebP renditions of `image`, filled in by core.images off the request path
+    image_variants = models.JSONField(default=dict, blank=True, editable=False)
     description = models.TextField(blank=True)
+    # Denormalized review aggregates, kept in step by ReviewViewSet (see `adjust_rating`)
+    rating_sum = models.PositiveIntegerField(default=0)
+    rating_count = models.PositiveIntegerField(default=0)
+    average_rating = models.GeneratedField(
+        expression=Case(
+            When(rating_count=0, then=Value(0.0)),
+            default=Cast('rating_sum', FloatField()) / F('rating_count'),
+        ),
+        output_field=FloatField(),
+        db_persist=True,
+        db_index=True,
+    )
+    # Also touched when the product's reviews or related-product stubs change
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+
+    class Meta:
+        indexes = [
+            # Storefront filter combinations: category/brand narrowed by sale flag, stock and rating
+            models.Index(fields=['category', 'is_on_sale', 'price'], name='core_product_cat_sale_idx'),
+            models.Index(fields=['brand', 'is_on_sale', 'price'], name='core_product_brand_sale_idx'),
+            models.Index(fields=['category', 'price'], condition=Q(stock__gt=0), name='core_product_in_stock_idx'),
+            models.Index(fields=['category', '-average_rating'], name='core_product_cat_rating_idx'),
+            models.Index(fields=['category', 'effective_price'], name='core_product_cat_eff_price_idx'),
+        ]
 
     def image_tag(self):
         if self.image:
-            return mark_safe(f'<img src="{self.image.url}" width="50" height="50"/>')
+            return mark_safe(f'<img src="{self.thumbnail_url()}" width="50" height="50"/>')
         return "No Image"
     
     image_tag.short_description = 'Image'
 
+    def variant_urls(self):
+        """Return `{width: url}` for the generated variants that belong to the current image."""
+        if not self.image or self.image_variants.get('source') != self.image.name:
+            return {}
+        storage = self.image.storage
+        return {int(width): storage.url(name) for width, name in self.image_variants['widths'].items()}
+
+    def thumbnail_url(self):
+        variants = self.variant_urls()
+        return variants[min(variants)] if variants else self.image.url
+
+    @classmethod
+    def adjust_rating(cls, product_id, rating_delta, count_delta=0):
+        """Atomically shift the stored rating aggregates without reading them first; also bumps `updated_at`."""
+        cls.objects.filter(pk=product_id).update(
+            rating_sum=F('rating_sum') + rating_delta,
+            rating_count=F('rating_count') + count_delta,
+            updated_at=Now(),
+        )
+
     def __str__(self):
         return self.name
 
+# ------------------ RELATED PRODUCT MODEL ------------------
+class RelatedProduct(models.Model):
+    """Precomputed top-K neighbours of a product, maintained by `core.related`."""
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='related_links')
+    related = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='+')
+    score = models.PositiveIntegerField()
+    rank = models.PositiveSmallIntegerField()
+
+    class Meta:
+        ordering = ['rank']
+        unique_together = ['product', 'related']
+        indexes = [models.Index(fields=['product', 'rank'])]
+
+    def __str__(self):
+        return f"{self.product_id} → {self.related_id} ({self.score})"
+
 # ------------------ ORDER MODEL ------------------
 class Order(models.Model):
     STATUS_CHOICES = [
@@ -76,13 +188,58 @@ class Order(models.Model):
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
     order_date = models.DateTimeField(auto_now_add=True)
     delivery_date = models.DateTimeField(null=True, blank=True)
+    # Set by checkout: groups the lines of one cart and records the price actually charged
+    reference = models.UUIDField(null=True, blank=True, db_index=True)
+    unit_price = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # Newest-first admin listing and the date_hierarchy range filters on order_date
+            models.Index(fields=['order_date', 'id'], name='core_order_date_idx'),
+        ]
 
     def __str__(self):
         return f"Order {self.id} - {self.product.name} ({self.status})"
 
+# ------------------ SALES ROLLUP MODEL ------------------
+class SalesRollup(models.Model):
+    """
+    Orders summed per day, product and status, maintained incrementally by `core.reports`.
+
+    Category and brand are copied from the product when the row is first written. The foreign
+    keys carry no database constraint so sales history outlives catalog edits.
+    """
+    day = models.DateField()
+    product = models.ForeignKey(Product, on_delete=models.DO_NOTHING, db_constraint=False, related_name='+')
+    category = models.ForeignKey(Category, on_delete=models.DO_NOTHING, db_constraint=False, related_name='+')
+    brand = models.ForeignKey(
+        'Brand', on_delete=models.DO_NOTHING, db_constraint=False, null=True, blank=True, related_name='+'
+    )
+    status = models.CharField(max_length=20, choices=Order.STATUS_CHOICES)
+    quantity = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    order_count = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            # Also the conflict target of the incremental upsert, and the index for day ranges
+            models.UniqueConstraint(fields=['day', 'product', 'status'], name='core_salesrollup_key'),
+        ]
+        indexes = [
+            models.Index(fields=['category', 'day'], name='core_salesrollup_cat_day_idx'),
+            models.Index(fields=['brand', 'day'], name='core_salesrollup_brand_day_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.day} {self.product_id} {self.status}: {self.quantity} / {self.revenue}"
+
 # ------------------ BRAND MODEL ------------------
 class Brand(models.Model):
     name = models.CharField(max_length=100, unique=True)  # Prevents duplicate brand entries
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [models.Index(Lower('name'), name='core_brand_lower_name_idx')]
 
     def __str__(self):
         return self.name
@@ -96,9 +253,71 @@ class Review(models.Model):
     rating = models.PositiveIntegerField(default=1)
     comment = models.TextField(blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         unique_together = ['product', 'user']  # Prevents duplicate reviews by the same user
+        indexes = [
+            # Match the keyset orderings used by ReviewCursorPagination, globally and per product
+            models.Index(fields=['-created_at', 'id'], name='core_review_recent_idx'),
+            models.Index(fields=['product', '-created_at', 'id'], name='core_review_product_recent_idx'),
+        ]
 
     def __str__(self):
         return f"{self.product.name} - {self.user.username} ({self.rating}/5)"
+
+# ------------------ SCHEDULED SALE MODEL ------------------
+class ScheduledSale(models.Model):
+    """
+    A discount applied to a product selection between two times by `run_scheduled_sales`.
+
+    `selection` holds the `categories` (whole subtrees), `brands` and `products` id lists
+    understood by `core.pricing.select_products`.
+    """
+    STATUS_CHOICES = [
+        ('scheduled', 'Scheduled'),
+        ('active', 'Active'),
+        ('ended', 'Ended'),
+    ]
+
+    name = models.CharField(max_length=100, blank=True)
+    selection = models.JSONField(default=dict)
+    discount_percentage = models.PositiveIntegerField()
+    starts_at = models.DateTimeField()
+    ends_at = models.DateTimeField(null=True, blank=True)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='scheduled', editable=False)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            # The scheduler's two polls: due starts and due ends
+            models.Index(fields=['status', 'starts_at'], name='core_sale_due_start_idx'),
+            models.Index(fields=['status', 'ends_at'], name='core_sale_due_end_idx'),
+        ]
+
+    def clean(self):
+        selection = self.selection if isinstance(self.selection, dict) else {}
+        if not any(selection.get(key) for key in ('categories', 'brands', 'products')):
+            raise ValidationError({'selection': 'Select products by categories, brands or products.'})
+        if self.discount_percentage is not None and not 0 < self.discount_percentage < 100:
+            raise ValidationError({'discount_percentage': 'The discount must be between 1 and 99 percent.'})
+        if self.starts_at and self.ends_at and self.ends_at <= self.starts_at:
+            raise ValidationError({'ends_at': 'The sale must end after it starts.'})
+
+    def __str__(self):
+        return f"{self.name or f'Sale {self.id}'} ({self.discount_percentage}% off, {self.status})"
+
+# ------------------ IMPORT CHECKPOINT MODEL ------------------
+class ImportCheckpoint(models.Model):
+    """
+    How many rows of a catalog file `import_catalog` has imported.
+
+    Saved in the same transaction as each batch, so a crash can never commit a batch without
+    its checkpoint, or the checkpoint without the batch.
+    """
+    source = models.CharField(max_length=255, unique=True)
+    position = models.PositiveIntegerField()
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.source} @ {self.position}"
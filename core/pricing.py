@@ -0,0 +1,119 @@
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import F, Q, Value
+from django.db.models.functions import Now, Round
+from django.utils import timezone
+
+from .cache import CATALOG_CACHE_NAMESPACE, invalidate
+from .categories import category_paths
+from .models import Product, ScheduledSale
+from .related import refresh_related_products, schedule_rebuild
+
+# Repriced batches up to this size refresh their related-product links inline; bigger ones queue
+# one background rebuild of the whole index once the transaction commits
+RELATED_REFRESH_LIMIT = 20
+
+# Keys of a product selection, as accepted by `select_products` and stored on ScheduledSale
+SELECTION_KEYS = ('categories', 'brands', 'products')
+
+
+def select_products(categories=(), brands=(), products=()):
+    """
+    Products in any of the category subtrees, of any of the brands and among the product ids.
+
+    Each given criterion narrows the selection; category ids that do not exist match nothing.
+    """
+    queryset = Product.objects.all()
+    if categories:
+        paths = category_paths()
+        subtrees = Q()
+        for category_id in categories:
+            subtrees |= Q(category__path__startswith=paths.get(category_id) or '-')
+        queryset = queryset.filter(subtrees)
+    if brands:
+        queryset = queryset.filter(brand_id__in=brands)
+    if products:
+        queryset = queryset.filter(pk__in=products)
+    return queryset
+
+
+def reprice(queryset, price=None, price_change_percent=None, discount_percentage=None, is_on_sale=None):
+    """
+    Apply price and sale changes to every product in `queryset` with one set-based UPDATE.
+
+    `price` sets a new price and `price_change_percent` scales the current one, e.g. -10 for
+    10% cheaper. Row signals do not fire; instead the catalog cache is invalidated once, the
+    products whose related stubs embed a changed product are touched, and when prices moved
+    the related-product index, which scores by price band, is refreshed, or for batches over
+    RELATED_REFRESH_LIMIT rebuilt in the background after commit. Returns the number of products updated.
+    """
+    changes = {}
+    if price is not None:
+        changes['price'] = price
+    elif price_change_percent is not None:
+        changes['price'] = Round(F('price') * (100 + price_change_percent) * Value(Decimal('0.01')), 2)
+    if discount_percentage is not None:
+        changes['discount_percentage'] = discount_percentage
+    if is_on_sale is not None:
+        changes['is_on_sale'] = is_on_sale
+    if not changes:
+        return 0
+
+    with transaction.atomic():
+        # Read once, before the UPDATE, which may change the columns `queryset` filters on
+        repriced = None
+        if 'price' in changes:
+            repriced = list(queryset.values_list('pk', flat=True)[:RELATED_REFRESH_LIMIT + 1])
+        if repriced is not None and len(repriced) <= RELATED_REFRESH_LIMIT:
+            updated = Product.objects.filter(pk__in=repriced).update(**changes, updated_at=Now())
+            # Also touches the neighbours that embed a repriced product as a related stub
+            refresh_related_products(repriced)
+        else:
+            Product.objects.filter(related_links__related__in=queryset.values('pk')).update(updated_at=Now())
+            updated = queryset.update(**changes, updated_at=Now())
+            if repriced is not None:
+                transaction.on_commit(schedule_rebuild)
+        invalidate(CATALOG_CACHE_NAMESPACE)
+    return updated
+
+
+def sale_products(sale):
+    return select_products(**{key: sale.selection.get(key) or () for key in SELECTION_KEYS})
+
+
+def start_sale(sale):
+    return reprice(sale_products(sale), discount_percentage=sale.discount_percentage, is_on_sale=True)
+
+
+def end_sale(sale):
+    """Take the sale's products off sale, except those whose discount was changed since it started."""
+    products = sale_products(sale).filter(is_on_sale=True, discount_percentage=sale.discount_percentage)
+    return reprice(products, discount_percentage=0, is_on_sale=False)
+
+
+def run_scheduled_sales(now=None):
+    """
+    Start the sales that are due and end the ones that are over; returns `(started, ended)`.
+
+    Rows are locked with SKIP LOCKED where the database supports it, so overlapping runs do
+    not apply a sale twice. A sale whose whole window passed between runs is only marked ended.
+    """
+    now = now or timezone.now()
+    started = ended = 0
+    with transaction.atomic():
+        sales = ScheduledSale.objects.select_for_update(skip_locked=True)
+        for sale in sales.filter(status='scheduled', starts_at__lte=now).order_by('starts_at', 'id'):
+            if sale.ends_at is None or sale.ends_at > now:
+                start_sale(sale)
+                sale.status = 'active'
+                started += 1
+            else:
+                sale.status = 'ended'
+            sale.save(update_fields=['status'])
+        for sale in sales.filter(status='active', ends_at__lte=now).order_by('ends_at', 'id'):
+            end_sale(sale)
+            sale.status = 'ended'
+            sale.save(update_fields=['status'])
+            ended += 1
+    return started, ended
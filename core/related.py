@@ -0,0 +1,230 @@
+import itertools
+import threading
+from bisect import bisect_right
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+
+from django.db import close_old_connections, transaction
+from django.db.models import Case, F, OuterRef, Q, Subquery, Value, When
+from django.db.models.functions import Now
+
+from .cache import CATALOG_CACHE_NAMESPACE, invalidate
+from .models import Product, RelatedProduct
+
+RELATED_PRODUCTS_LIMIT = 4
+# Saves re-rank at most this many other products inline; beyond it a background rebuild does
+REFRESH_NEIGHBOURS_LIMIT = 100
+
+# Scores are additive: a product in the same category always outranks one that only shares the brand
+CATEGORY_WEIGHT = 4
+BRAND_WEIGHT = 2
+PRICE_BAND_WEIGHT = 1
+
+PRICE_BANDS = [0, 25, 50, 100, 250, 500, 1000]
+
+_executor = None
+_rebuild_lock = threading.Lock()
+_rebuild_queued = False
+
+
+def price_band(price):
+    return bisect_right(PRICE_BANDS, Decimal(price)) - 1
+
+
+def _tiers(category_id, brand_id, price):
+    """
+    `(score, condition)` for each group of candidates that score the same against these values,
+    best first. The groups are disjoint; products sharing neither category nor brand are no candidates.
+    """
+    band = price_band(price)
+    in_band = Q(price__gte=PRICE_BANDS[band])
+    if band + 1 < len(PRICE_BANDS):
+        in_band &= Q(price__lt=PRICE_BANDS[band + 1])
+    tiers = []
+    for same_category, same_brand, same_band in itertools.product((True, False), repeat=3):
+        if not (same_category or same_brand) or (same_brand and brand_id is None):
+            continue
+        condition = Q(category_id=category_id) if same_category else ~Q(category_id=category_id)
+        if brand_id is not None:
+            condition &= Q(brand_id=brand_id) if same_brand else ~Q(brand_id=brand_id)
+        condition &= in_band if same_band else ~in_band
+        score = CATEGORY_WEIGHT * same_category + BRAND_WEIGHT * same_brand + PRICE_BAND_WEIGHT * same_band
+        tiers.append((score, condition))
+    return sorted(tiers, key=lambda tier: -tier[0])
+
+
+def rank_related(row, limit=RELATED_PRODUCTS_LIMIT):
+    """
+    Top `limit` neighbours of an `(id, category_id, brand_id, price)` row as `[(id, score)]`, best first.
+
+    Each tier is one `ORDER BY id LIMIT n` query, stopping once the list is full, so it reads at
+    most `limit` rows however big the category is; ties go to the lowest id, as in the rebuild.
+    """
+    product_id, category_id, brand_id, price = row
+    ranked = []
+    for score, condition in _tiers(category_id, brand_id, price):
+        if len(ranked) == limit:
+            break
+        ids = (
+            Product.objects.filter(condition).exclude(pk=product_id)
+            .order_by('id').values_list('id', flat=True)[:limit - len(ranked)]
+        )
+        ranked.extend((related_id, score) for related_id in ids)
+    return ranked
+
+
+def _entrants(row, limit, count):
+    """Up to `count` ids of products whose top `limit` the product in `row` now ranks in."""
+    product_id, category_id, brand_id, price = row
+    last = RelatedProduct.objects.filter(product=OuterRef('pk'), rank=limit - 1)
+    candidates = Q(category_id=category_id) | (Q(brand_id=brand_id) if brand_id is not None else Q())
+    return list(
+        Product.objects.filter(candidates).exclude(pk=product_id)
+        .annotate(
+            score=Case(*[When(condition, then=Value(score)) for score, condition in _tiers(category_id, brand_id, price)]),
+            last_score=Subquery(last.values('score')[:1]),
+            last_id=Subquery(last.values('related_id')[:1]),
+        )
+        .filter(
+            Q(last_score__isnull=True) | Q(last_score__lt=F('score'))
+            | Q(last_score=F('score'), last_id__gt=product_id)
+        )
+        .values_list('id', flat=True)[:count]
+    )
+
+
+def _links(product_id, scored):
+    return [
+        RelatedProduct(product_id=product_id, related_id=related_id, score=score, rank=rank)
+        for rank, (related_id, score) in enumerate(scored)
+    ]
+
+
+def refresh_related_products(product_ids, limit=RELATED_PRODUCTS_LIMIT):
+    """
+    Incrementally refresh the index after the given products changed.
+
+    Their own links are re-ranked, and other products only when their top-K can change: they
+    linked to a changed product, or a changed product now outranks their last link. Ranking
+    happens in SQL a tier at a time, so no category is read into memory. When more than
+    REFRESH_NEIGHBOURS_LIMIT neighbours are affected, a background rebuild takes over for them.
+    """
+    product_ids = set(product_ids)
+    rows = list(Product.objects.filter(id__in=product_ids).values_list('id', 'category_id', 'brand_id', 'price'))
+    count = REFRESH_NEIGHBOURS_LIMIT + 1
+    affected = set(
+        RelatedProduct.objects.filter(related_id__in=product_ids).exclude(product_id__in=product_ids)
+        .values_list('product_id', flat=True)[:count]
+    )
+    for row in rows:
+        if len(affected) > REFRESH_NEIGHBOURS_LIMIT:
+            break
+        affected.update(_entrants(row, limit, count))
+    affected -= product_ids
+
+    neighbours = []
+    if len(affected) > REFRESH_NEIGHBOURS_LIMIT:
+        transaction.on_commit(schedule_rebuild)
+    elif affected:
+        neighbours = list(Product.objects.filter(id__in=affected).values_list('id', 'category_id', 'brand_id', 'price'))
+    ranked = {row[0]: rank_related(row, limit) for row in rows + neighbours}
+
+    with transaction.atomic():
+        RelatedProduct.objects.filter(product_id__in=ranked.keys()).delete()
+        RelatedProduct.objects.bulk_create(
+            [link for product_id, scored in ranked.items() for link in _links(product_id, scored)]
+        )
+        # Neighbours embed stubs of these products, so their representation changed too
+        if neighbours:
+            Product.objects.filter(id__in=affected).update(updated_at=Now())
+        elif affected:
+            Product.objects.filter(related_links__related__in=product_ids).update(updated_at=Now())
+
+
+def _rebuild_in_worker():
+    global _rebuild_queued
+    with _rebuild_lock:
+        _rebuild_queued = False
+    try:
+        rebuild_related_products()
+        invalidate(CATALOG_CACHE_NAMESPACE)
+    finally:
+        close_old_connections()
+
+
+def schedule_rebuild():
+    """Queue a full rebuild on a background worker; one that is queued but not started absorbs later calls."""
+    global _executor, _rebuild_queued
+    with _rebuild_lock:
+        if _rebuild_queued:
+            return None
+        _rebuild_queued = True
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='related-rebuild')
+    return _executor.submit(_rebuild_in_worker)
+
+
+def rebuild_related_products(limit=RELATED_PRODUCTS_LIMIT, batch_size=1000):
+    """
+    Rebuild the whole index in memory.
+
+    Candidates are bucketed by (category, brand, price band) so each product walks the
+    buckets in descending score order instead of comparing itself with the whole catalog.
+    Returns the number of links written.
+    """
+    products = list(Product.objects.order_by('id').values_list('id', 'category_id', 'brand_id', 'price'))
+    buckets = defaultdict(list)
+    for product_id, category_id, brand_id, price in products:
+        band = price_band(price)
+        buckets['cbp', category_id, brand_id, band].append(product_id)
+        buckets['cb', category_id, brand_id].append(product_id)
+        buckets['cp', category_id, band].append(product_id)
+        buckets['c', category_id].append(product_id)
+        buckets['bp', brand_id, band].append(product_id)
+        buckets['b', brand_id].append(product_id)
+
+    tiers = [
+        ('cbp', CATEGORY_WEIGHT + BRAND_WEIGHT + PRICE_BAND_WEIGHT),
+        ('cb', CATEGORY_WEIGHT + BRAND_WEIGHT),
+        ('cp', CATEGORY_WEIGHT + PRICE_BAND_WEIGHT),
+        ('c', CATEGORY_WEIGHT),
+        ('bp', BRAND_WEIGHT + PRICE_BAND_WEIGHT),
+        ('b', BRAND_WEIGHT),
+    ]
+    written = 0
+    with transaction.atomic():
+        RelatedProduct.objects.all().delete()
+        links = []
+        for product_id, category_id, brand_id, price in products:
+            band = price_band(price)
+            keys = {
+                'cbp': ('cbp', category_id, brand_id, band),
+                'cb': ('cb', category_id, brand_id),
+                'cp': ('cp', category_id, band),
+                'c': ('c', category_id),
+                'bp': ('bp', brand_id, band),
+                'b': ('b', brand_id),
+            }
+            seen = {product_id}
+            scored = []
+            for tier, score in tiers:
+                if brand_id is None and 'b' in tier:
+                    continue
+                for candidate in buckets[keys[tier]]:
+                    if candidate in seen:
+                        continue
+                    seen.add(candidate)
+                    scored.append((candidate, score))
+                    if len(scored) == limit:
+                        break
+                if len(scored) == limit:
+                    break
+            links.extend(_links(product_id, scored))
+            if len(links) >= batch_size:
+                RelatedProduct.objects.bulk_create(links)
+                written += len(links)
+                links = []
+        RelatedProduct.objects.bulk_create(links)
+        written += len(links)
+    return written
@@ -0,0 +1,179 @@
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import connection, transaction
+from django.db.models import F, Sum
+from django.db.models.functions import TruncMonth
+from django.utils import timezone
+
+from .models import Category, Order, Product, SalesRollup
+
+ROLLUP_CHUNK_SIZE = 10000
+# Days covered by a sales report when no start date is given
+REPORT_DEFAULT_DAYS = 30
+
+# group_by values accepted by the sales report, and the rollup column or expression behind each
+REPORT_GROUPS = {
+    'day': 'day',
+    'month': TruncMonth('day'),
+    'product': 'product_id',
+    'category': 'category_id',
+    'brand': 'brand_id',
+    'status': 'status',
+}
+
+
+def order_price(order):
+    """The unit price an order is booked at; orders placed before checkout recorded one use today's price."""
+    if order.unit_price is not None:
+        return order.unit_price
+    price = Product.objects.filter(pk=order.product_id).values_list('effective_price', flat=True).first()
+    return price if price is not None else Decimal('0')
+
+
+def add_order(deltas, order_date, product_id, status, quantity, unit_price, sign=1):
+    """Accumulate one order's contribution, or its removal with `sign=-1`, into `deltas`."""
+    delta = deltas[timezone.localdate(order_date), product_id, status]
+    delta[0] += sign * quantity
+    delta[1] += sign * quantity * unit_price
+    delta[2] += sign
+
+
+def new_deltas():
+    return defaultdict(lambda: [0, Decimal('0'), 0])
+
+
+def apply_deltas(deltas):
+    """
+    Add `{(day, product_id, status): [quantity, revenue, orders]}` to the rollups.
+
+    Each row is one `INSERT ... ON CONFLICT DO UPDATE` that increments in place, so concurrent
+    writers never read-modify-write the same row. Rows that drop to zero orders are removed.
+    """
+    deltas = {key: delta for key, delta in deltas.items() if any(delta)}
+    if not deltas:
+        return
+    products = dict(
+        (pk, (category_id, brand_id)) for pk, category_id, brand_id in
+        Product.objects.filter(pk__in={key[1] for key in deltas}).values_list('id', 'category_id', 'brand_id')
+    )
+    rows = [
+        (day, product_id, *products.get(product_id, (None, None)), status, quantity, revenue, orders)
+        for (day, product_id, status), (quantity, revenue, orders) in deltas.items()
+    ]
+    if connection.vendor in ('postgresql', 'sqlite'):
+        table = SalesRollup._meta.db_table
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                f"""
+                INSERT INTO {table} (day, product_id, category_id, brand_id, status, quantity, revenue, order_count)
+                VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+                ON CONFLICT (day, product_id, status) DO UPDATE SET
+                    quantity = {table}.quantity + excluded.quantity,
+                    revenue = {table}.revenue + excluded.revenue,
+                    order_count = {table}.order_count + excluded.order_count
+                """,
+                # A product deleted meanwhile keeps its history under the rows already written
+                [row for row in rows if row[2] is not None],
+            )
+    else:
+        for day, product_id, category_id, brand_id, status, quantity, revenue, orders in rows:
+            updated = SalesRollup.objects.filter(day=day, product_id=product_id, status=status).update(
+                quantity=F('quantity') + quantity, revenue=F('revenue') + revenue,
+                order_count=F('order_count') + orders,
+            )
+            if not updated and category_id is not None:
+                SalesRollup.objects.create(
+                    day=day, product_id=product_id, category_id=category_id, brand_id=brand_id, status=status,
+                    quantity=quantity, revenue=revenue, order_count=orders,
+                )
+    if any(delta[2] < 0 for delta in deltas.values()):
+        SalesRollup.objects.filter(
+            day__in={key[0] for key in deltas}, product_id__in={key[1] for key in deltas}, order_count__lte=0,
+        ).delete()
+
+
+def record_orders(orders):
+    """Count freshly created orders, e.g. the lines of one checkout, in a single batch."""
+    deltas = new_deltas()
+    for order in orders:
+        add_order(deltas, order.order_date, order.product_id, order.status, order.quantity, order_price(order))
+    apply_deltas(deltas)
+
+
+def rollup_orders(queryset, chunk_size=ROLLUP_CHUNK_SIZE):
+    """Add every order in `queryset` to the rollups, reading and writing one id range at a time."""
+    counted = 0
+    last_id = 0
+    while True:
+        rows = list(
+            queryset.filter(id__gt=last_id).order_by('id').values_list(
+                'id', 'order_date', 'product_id', 'status', 'quantity', 'unit_price', 'product__effective_price',
+            )[:chunk_size]
+        )
+        if not rows:
+            return counted
+        deltas = new_deltas()
+        for _, order_date, product_id, status, quantity, unit_price, price in rows:
+            add_order(deltas, order_date, product_id, status, quantity, price if unit_price is None else unit_price)
+        with transaction.atomic():
+            apply_deltas(deltas)
+        counted += len(rows)
+        last_id = rows[-1][0]
+
+
+def rebuild_sales_rollups(chunk_size=ROLLUP_CHUNK_SIZE, since=None):
+    """
+    Recompute the rollups from the orders, for every day or only from `since` onwards.
+
+    Runs in one transaction so readers never see a half-built range. Returns the orders counted.
+    """
+    with transaction.atomic():
+        rollups, orders = SalesRollup.objects.all(), Order.objects.all()
+        if since is not None:
+            rollups = rollups.filter(day__gte=since)
+            orders = orders.filter(order_date__date__gte=since)
+        rollups.delete()
+        return rollup_orders(orders, chunk_size)
+
+
+def sales_report(start, end, group_by=(), status=None, category=None, brand=None, product=None):
+    """
+    Sum quantity, revenue and orders between two dates (inclusive) from the rollups.
+
+    `group_by` names keys of REPORT_GROUPS; `category` also matches its subcategories.
+    Returns `(rows, totals)`.
+    """
+    rollups = SalesRollup.objects.filter(day__range=(start, end))
+    if status:
+        rollups = rollups.filter(status=status)
+    if brand:
+        rollups = rollups.filter(brand_id=brand)
+    if product:
+        rollups = rollups.filter(product_id=product)
+    if category:
+        path = Category.objects.filter(pk=category).values_list('path', flat=True).first() or '-'
+        rollups = rollups.filter(category_id__in=Category.objects.filter(path__startswith=path).values('id'))
+
+    measures = {'quantity': Sum('quantity'), 'revenue': Sum('revenue'), 'orders': Sum('order_count')}
+    columns = [REPORT_GROUPS[name] for name in group_by if isinstance(REPORT_GROUPS[name], str)]
+    expressions = {name: REPORT_GROUPS[name] for name in group_by if not isinstance(REPORT_GROUPS[name], str)}
+    rows = []
+    if group_by:
+        grouped = rollups.values(*columns, **expressions).annotate(**measures).order_by(*columns, *expressions)
+        for row in grouped:
+            rows.append({name: _output(row[name if name in expressions else REPORT_GROUPS[name]])
+                         for name in group_by} | _measures(row))
+    return rows, _measures(rollups.aggregate(**measures))
+
+
+def _output(value):
+    return value.isoformat() if hasattr(value, 'isoformat') else value
+
+
+def _measures(row):
+    return {
+        'quantity': row['quantity'] or 0,
+        'revenue': str(Decimal(row['revenue'] or 0).quantize(Decimal('0.01'))),
+        'orders': row['orders'] or 0,
+    }
@@ -0,0 +1,149 @@
+import re
+
+from django.db import connection
+
+from .models import Product
+
+SEARCH_RESULTS_LIMIT = 50
+
+
+def _within(column, products):
+    """An `AND column IN (...)` clause limiting matches to a Product queryset, applied before the LIMIT."""
+    if products is None:
+        return '', ()
+    sql, params = products.order_by().values('id').query.sql_with_params()
+    return f'AND {column} IN ({sql})', params
+
+
+class PostgresSearchBackend:
+    """
+    Ranked search over a stored `core_product.search_vector` tsvector with a GIN index.
+
+    Product names weigh most, then brand and category names, then the description.
+    """
+
+    def install(self, schema_editor):
+        schema_editor.execute('ALTER TABLE core_product ADD COLUMN search_vector tsvector')
+        schema_editor.execute('CREATE INDEX core_product_search_idx ON core_product USING GIN (search_vector)')
+
+    def uninstall(self, schema_editor):
+        schema_editor.execute('ALTER TABLE core_product DROP COLUMN search_vector')
+
+    def reindex(self, products, cursor):
+        sql, params = products.values('id').query.sql_with_params()
+        cursor.execute(
+            f"""
+            UPDATE core_product p SET search_vector =
+                setweight(to_tsvector('english', p.name), 'A')
+                || setweight(to_tsvector('english', coalesce(
+                    (SELECT b.name FROM core_brand b WHERE b.id = p.brand_id), '')), 'B')
+                || setweight(to_tsvector('english', c.name), 'B')
+                || setweight(to_tsvector('english', p.description), 'C')
+            FROM core_category c
+            WHERE c.id = p.category_id AND p.id IN ({sql})
+            """,
+            params,
+        )
+
+    def remove(self, product_ids, cursor):
+        pass  # The vector lives on the product row and goes with it
+
+    def search(self, query, limit, cursor, products=None):
+        within, params = _within('p.id', products)
+        cursor.execute(
+            f"""
+            SELECT p.id FROM core_product p, websearch_to_tsquery('english', %s) q
+            WHERE p.search_vector @@ q {within}
+            ORDER BY ts_rank(p.search_vector, q) DESC, p.id
+            LIMIT %s
+            """,
+            [query, *params, limit],
+        )
+        return [row[0] for row in cursor.fetchall()]
+
+
+class SQLiteSearchBackend:
+    """The same behaviour on SQLite through an FTS5 table keyed by product id, ranked with bm25."""
+
+    def install(self, schema_editor):
+        schema_editor.execute(
+            "CREATE VIRTUAL TABLE core_product_fts USING fts5("
+            "name, brand, category, description, tokenize='porter unicode61')"
+        )
+
+    def uninstall(self, schema_editor):
+        schema_editor.execute('DROP TABLE core_product_fts')
+
+    def reindex(self, products, cursor):
+        sql, params = products.values('id').query.sql_with_params()
+        cursor.execute(f'DELETE FROM core_product_fts WHERE rowid IN ({sql})', params)
+        cursor.execute(
+            f"""
+            INSERT INTO core_product_fts (rowid, name, brand, category, description)
+            SELECT p.id, p.name, coalesce(b.name, ''), c.name, p.description
+            FROM core_product p
+            JOIN core_category c ON c.id = p.category_id
+            LEFT JOIN core_brand b ON b.id = p.brand_id
+            WHERE p.id IN ({sql})
+            """,
+            params,
+        )
+
+    def remove(self, product_ids, cursor):
+        placeholders = ', '.join(['%s'] * len(product_ids))
+        cursor.execute(f'DELETE FROM core_product_fts WHERE rowid IN ({placeholders})', list(product_ids))
+
+    def search(self, query, limit, cursor, products=None):
+        # Quote every term so user input cannot inject FTS5 syntax; terms are ANDed together
+        terms = re.findall(r'\w+', query)
+        if not terms:
+            return []
+        match = ' '.join('"%s"' % term for term in terms)
+        within, params = _within('rowid', products)
+        cursor.execute(
+            f"""
+            SELECT rowid FROM core_product_fts
+            WHERE core_product_fts MATCH %s {within}
+            ORDER BY bm25(core_product_fts, 10.0, 5.0, 5.0, 1.0), rowid
+            LIMIT %s
+            """,
+            [match, *params, limit],
+        )
+        return [row[0] for row in cursor.fetchall()]
+
+
+BACKENDS = {
+    'postgresql': PostgresSearchBackend,
+    'sqlite': SQLiteSearchBackend,
+}
+
+
+def get_backend(using=connection):
+    backend = BACKENDS.get(using.vendor)
+    return backend() if backend else None
+
+
+def reindex_products(products):
+    """Refresh the search index for a Product queryset in one set-based statement."""
+    backend = get_backend()
+    if backend is not None:
+        with connection.cursor() as cursor:
+            backend.reindex(products, cursor)
+
+
+def remove_products(product_ids):
+    backend = get_backend()
+    if backend is not None and product_ids:
+        with connection.cursor() as cursor:
+            backend.remove(product_ids, cursor)
+
+
+def search_product_ids(query, limit=SEARCH_RESULTS_LIMIT, products=None):
+    """Return matching product ids, best match first, only among `products` when a queryset is given."""
+    backend = get_backend()
+    if backend is None:
+        # Other databases get an unranked substring match
+        matches = Product.objects.all() if products is None else products
+        return list(matches.filter(name__icontains=query).order_by('id').values_list('id', flat=True)[:limit])
+    with connection.cursor() as cursor:
+        return backend.search(query, limit, cursor, products)
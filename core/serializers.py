@@ -1,6 +1,14 @@
+from datetime import timedelta
+from decimal import Decimal
+
 from django.contrib.auth.models import User
+from django.utils import timezone
 from rest_framework import serializers
-from .models import Category, Product, Brand, Review
+
+from .models import Category, Product, Brand, Review, Order, ScheduledSale
+from .pricing import SELECTION_KEYS
+from .reports import REPORT_DEFAULT_DAYS, REPORT_GROUPS
+
 
 class CategorySerializer(serializers.ModelSerializer):
     subcategories = serializers.SerializerMethodField()
@@ -11,8 +19,10 @@ class CategorySerializer(serializers.ModelSerializer):
 
     def get_subcategories(self, obj):
         """Retrieve only direct child categories for better hierarchy control."""
-        subcategories = obj.category_set.all()  # Better than querying the entire Category model
-        return CategorySerializer(subcategories, many=True).data
+        # CategoryViewSet passes the whole tree loaded in one query; fall back to the relation otherwise
+        children = self.context.get('category_children')
+        subcategories = children.get(obj.id, []) if children is not None else obj.subcategories.all()
+        return CategorySerializer(subcategories, many=True, context=self.context).data
 
 
 class BrandSerializer(serializers.ModelSerializer):
@@ -29,37 +39,197 @@ class ReviewSerializer(serializers.ModelSerializer):
         fields = ['id', 'product', 'user', 'rating', 'comment', 'created_at']
 
 
+class RelatedProductSerializer(serializers.ModelSerializer):
+    """Compact product stub used inside `related_products`."""
+    image = serializers.ImageField(use_url=True)
+    # Read from the stored generated column, never recomputed here
+    effective_price = serializers.DecimalField(max_digits=10, decimal_places=2, read_only=True)
+
+    class Meta:
+        model = Product
+        fields = ['id', 'name', 'price', 'is_on_sale', 'discount_percentage', 'effective_price', 'image']
+
+
+# Only the newest reviews are embedded; the full history is paged at /api/products/{id}/reviews/
+EMBEDDED_REVIEWS = 5
+
+# Product output fields that are read straight from one column, and that column
+PRODUCT_COLUMN_FIELDS = {
+    'id': 'id', 'name': 'name', 'category': 'category_id', 'brand': 'brand_id', 'price': 'price',
+    'effective_price': 'effective_price', 'stock': 'stock', 'is_on_sale': 'is_on_sale',
+    'discount_percentage': 'discount_percentage',
+    'image': 'image', 'average_rating': 'average_rating', 'total_reviews': 'rating_count',
+}
+# Nested product fields that cost a query each; sparse requests only get them through ?expand=
+PRODUCT_EXPANDABLE_FIELDS = ['reviews', 'related_products']
+
+
 class ProductSerializer(serializers.ModelSerializer):
     category = serializers.PrimaryKeyRelatedField(queryset=Category.objects.all())
     brand = serializers.PrimaryKeyRelatedField(queryset=Brand.objects.all())
     image = serializers.ImageField(use_url=True)  # Ensures full URL is returned
-    reviews = ReviewSerializer(many=True, read_only=True)
+    image_srcset = serializers.SerializerMethodField()
+    reviews = serializers.SerializerMethodField()
     average_rating = serializers.SerializerMethodField()
-    total_reviews = serializers.SerializerMethodField()
+    total_reviews = serializers.IntegerField(source='rating_count', read_only=True)
+    # Read from the stored generated column, never recomputed here
+    effective_price = serializers.DecimalField(max_digits=10, decimal_places=2, read_only=True)
     related_products = serializers.SerializerMethodField()
 
     class Meta:
         model = Product
         fields = [
-            'id', 'name', 'category', 'brand', 'price',
-            'stock', 'is_on_sale', 'discount_percentage', 'image', 'reviews', 'average_rating', 'total_reviews', 'related_products'
+            'id', 'name', 'category', 'brand', 'price', 'effective_price',
+            'stock', 'is_on_sale', 'discount_percentage', 'image', 'image_srcset', 'reviews', 'average_rating', 'total_reviews', 'related_products'
         ]
 
-    def get_average_rating(self, obj):
-        reviews = obj.reviews.all()
-        if reviews.exists():
-            return round(sum([review.rating for review in reviews]) / reviews.count(), 1)
-        return 0.0  # Default rating if no reviews are available
+    def __init__(self, *args, fields=None, **kwargs):
+        # `fields` keeps only a subset of the output, e.g. ProductViewSet's ?fields= / ?expand=
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+
+    def get_image_srcset(self, obj):
+        """WebP variants keyed like a srcset descriptor, e.g. `{"160w": url, "480w": url}`."""
+        request = self.context.get('request')
+        return {
+            f'{width}w': request.build_absolute_uri(url) if request else url
+            for width, url in sorted(obj.variant_urls().items())
+        }
+
+    def get_reviews(self, obj):
+        # ProductViewSet prefetches the latest reviews for the whole page in one windowed query
+        reviews = getattr(obj, 'latest_reviews', None)
+        if reviews is None:
+            reviews = obj.reviews.select_related('user').order_by('-created_at', 'id')[:EMBEDDED_REVIEWS]
+        return ReviewSerializer(reviews, many=True, context=self.context).data
 
-    def get_total_reviews(self, obj):
-        return obj.reviews.count()
+    def get_average_rating(self, obj):
+        # Stored on the row by the database; 0.0 when there are no reviews yet
+        return round(obj.average_rating or 0.0, 1)
 
     def get_related_products(self, obj):
-        # Filter products in the same category (excluding the current product)
-        return ProductSerializer(
-            Product.objects.filter(category=obj.category).exclude(id=obj.id)[:4],
-            many=True
-        ).data
+        # Read from the precomputed index; ProductViewSet prefetches it for the whole page
+        related = [link.related for link in obj.related_links.all()]
+        return RelatedProductSerializer(related, many=True, context=self.context).data
+
+
+class ProductRowSerializer(serializers.BaseSerializer):
+    """
+    Read-only ProductSerializer output for `values_list(..., named=True)` rows.
+
+    Only covers PRODUCT_COLUMN_FIELDS, which is what lets column-only field sets skip
+    building Product instances; the values match ProductSerializer field for field.
+    """
+
+    def __init__(self, *args, fields=(), **kwargs):
+        super().__init__(*args, **kwargs)
+        self.output = [(name, PRODUCT_COLUMN_FIELDS[name]) for name in ProductSerializer.Meta.fields if name in fields]
+        price = Product._meta.get_field('price')
+        self.price = serializers.DecimalField(max_digits=price.max_digits, decimal_places=price.decimal_places)
+        self.storage = Product._meta.get_field('image').storage
+
+    def to_representation(self, row):
+        data = {}
+        for name, column in self.output:
+            value = getattr(row, column)
+            if name in ('price', 'effective_price'):
+                value = self.price.to_representation(value)
+            elif name == 'image':
+                value = self.image_url(value)
+            elif name == 'average_rating':
+                value = round(value or 0.0, 1)
+            data[name] = value
+        return data
+
+    def image_url(self, name):
+        if not name:
+            return None
+        request = self.context.get('request')
+        url = self.storage.url(name)
+        return request.build_absolute_uri(url) if request else url
+
+
+class OrderSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Order
+        fields = ['id', 'reference', 'product', 'quantity', 'unit_price', 'status', 'order_date']
+
+
+class CheckoutItemSerializer(serializers.Serializer):
+    product = serializers.IntegerField()
+    quantity = serializers.IntegerField(min_value=1)
+
+
+class CheckoutSerializer(serializers.Serializer):
+    items = CheckoutItemSerializer(many=True, allow_empty=False)
+
+
+class SalesReportQuerySerializer(serializers.Serializer):
+    """Query parameters of /api/reports/sales/; the range defaults to the last REPORT_DEFAULT_DAYS days."""
+    start = serializers.DateField(required=False)
+    end = serializers.DateField(required=False)
+    group_by = serializers.CharField(required=False, default='')
+    status = serializers.ChoiceField(choices=Order.STATUS_CHOICES, required=False)
+    category = serializers.IntegerField(required=False)
+    brand = serializers.IntegerField(required=False)
+    product = serializers.IntegerField(required=False)
+
+    def validate_group_by(self, value):
+        names = [name for name in value.split(',') if name]
+        unknown = [name for name in names if name not in REPORT_GROUPS]
+        if unknown:
+            raise serializers.ValidationError(
+                f"Unknown grouping {', '.join(unknown)}; choose from {', '.join(REPORT_GROUPS)}."
+            )
+        return list(dict.fromkeys(names))
+
+    def validate(self, attrs):
+        attrs.setdefault('end', timezone.localdate())
+        attrs.setdefault('start', attrs['end'] - timedelta(days=REPORT_DEFAULT_DAYS - 1))
+        if attrs['start'] > attrs['end']:
+            raise serializers.ValidationError({'start': 'The start date must not be after the end date.'})
+        return attrs
+
+
+class BulkPricingSerializer(serializers.Serializer):
+    """
+    A product selection and the price or sale changes to apply to it.
+
+    With `starts_at` or `ends_at` the discount becomes a ScheduledSale instead of applying now.
+    """
+    categories = serializers.ListField(child=serializers.IntegerField(), required=False)
+    brands = serializers.ListField(child=serializers.IntegerField(), required=False)
+    products = serializers.ListField(child=serializers.IntegerField(), required=False)
+    price = serializers.DecimalField(max_digits=10, decimal_places=2, min_value=Decimal('0'), required=False)
+    price_change_percent = serializers.IntegerField(min_value=-99, max_value=1000, required=False)
+    discount_percentage = serializers.IntegerField(min_value=0, max_value=99, required=False)
+    is_on_sale = serializers.BooleanField(required=False)
+    name = serializers.CharField(max_length=100, required=False, allow_blank=True)
+    starts_at = serializers.DateTimeField(required=False)
+    ends_at = serializers.DateTimeField(required=False)
+
+    def validate(self, attrs):
+        if not any(attrs.get(key) for key in SELECTION_KEYS):
+            raise serializers.ValidationError('Select products by categories, brands or products.')
+        if 'price' in attrs and 'price_change_percent' in attrs:
+            raise serializers.ValidationError('Give either a price or a price change, not both.')
+        if 'starts_at' in attrs or 'ends_at' in attrs:
+            if not attrs.get('discount_percentage') or {'price', 'price_change_percent', 'is_on_sale'} & attrs.keys():
+                raise serializers.ValidationError('A scheduled sale only takes a discount_percentage above 0.')
+            attrs.setdefault('starts_at', timezone.now())
+            if 'ends_at' in attrs and attrs['ends_at'] <= attrs['starts_at']:
+                raise serializers.ValidationError({'ends_at': 'The sale must end after it starts.'})
+        elif not {'price', 'price_change_percent', 'discount_percentage', 'is_on_sale'} & attrs.keys():
+            raise serializers.ValidationError('Nothing to change.')
+        return attrs
+
+
+class ScheduledSaleSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = ScheduledSale
+        fields = ['id', 'name', 'selection', 'discount_percentage', 'starts_at', 'ends_at', 'status']
 
 
 class UserSerializer(serializers.ModelSerializer):
@@ -0,0 +1,134 @@
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models import F
+from django.db.models.functions import Now, Substr
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from .authentication import forget_user
+from .cache import CATALOG_CACHE_NAMESPACE, invalidate
+from .categories import CATEGORY_CACHE_NAMESPACE
+from .images import schedule_variants, variants_are_current
+from .lookups import BRAND_CACHE_NAMESPACE
+from .models import Brand, Category, Order, Product, Review
+from .related import refresh_related_products
+from .reports import add_order, apply_deltas, new_deltas, order_price
+from .search import remove_products, reindex_products
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+@receiver(post_save, sender=Brand)
+@receiver(post_delete, sender=Brand)
+@receiver(post_save, sender=Review)
+@receiver(post_delete, sender=Review)
+def invalidate_catalog_responses(sender, **kwargs):
+    """One O(1) version bump retires every cached catalog response."""
+    invalidate(CATALOG_CACHE_NAMESPACE)
+
+
+@receiver(post_save, sender=Product)
+def update_related_products(sender, instance, raw=False, **kwargs):
+    """Keep the related-products index current as products are created or edited."""
+    if not raw:
+        refresh_related_products([instance.pk])
+
+
+@receiver(post_save, sender=Product)
+def update_search_index(sender, instance, raw=False, **kwargs):
+    if not raw:
+        reindex_products(Product.objects.filter(pk=instance.pk))
+
+
+@receiver(post_save, sender=Product)
+def queue_image_variants(sender, instance, raw=False, **kwargs):
+    """New or replaced uploads get their variants rendered by the worker pool after commit."""
+    if not raw and instance.image and not variants_are_current(instance):
+        transaction.on_commit(lambda: schedule_variants(instance.pk))
+
+
+@receiver(post_delete, sender=Product)
+def remove_from_search_index(sender, instance, **kwargs):
+    remove_products([instance.pk])
+
+
+@receiver(post_save, sender=Category)
+def invalidate_category_tree(sender, instance, raw=False, **kwargs):
+    invalidate(CATEGORY_CACHE_NAMESPACE)
+    if not raw:
+        reindex_products(Product.objects.filter(category=instance))
+
+
+@receiver(post_delete, sender=Category)
+def reroot_orphaned_categories(sender, instance, **kwargs):
+    """Children were detached by SET_NULL, so strip the deleted prefix from their subtree paths."""
+    Category.objects.filter(path__startswith=instance.path).update(
+        path=Substr('path', len(instance.path) + 1),
+        depth=F('depth') - (instance.depth + 1),
+        updated_at=Now(),
+    )
+    invalidate(CATEGORY_CACHE_NAMESPACE)
+
+
+@receiver(post_save, sender=Brand)
+@receiver(post_delete, sender=Brand)
+def invalidate_brand_lookups(sender, instance, **kwargs):
+    invalidate(BRAND_CACHE_NAMESPACE)
+
+
+@receiver(post_save, sender=Brand)
+def reindex_brand_products(sender, instance, raw=False, **kwargs):
+    """Brand names are part of the product search document."""
+    if not raw:
+        reindex_products(Product.objects.filter(brand=instance))
+
+
+@receiver(pre_save, sender=Order)
+def remember_order_rollup(sender, instance, raw=False, **kwargs):
+    """Keep what the stored row contributed to the sales rollups, so the save can move it."""
+    instance._rollup_previous = None
+    instance._rollup_priced = False
+    if raw:
+        return
+    if instance.pk:
+        instance._rollup_previous = Order.objects.filter(pk=instance.pk).first()
+    if instance.unit_price is None:
+        # Book unpriced (admin-created or legacy) orders at today's price once, so what a later
+        # save removes from the rollups is always what this one adds
+        instance.unit_price = order_price(instance)
+        instance._rollup_priced = True
+        if instance._rollup_previous is not None:
+            instance._rollup_previous.unit_price = instance.unit_price
+
+
+@receiver(post_save, sender=Order)
+def update_sales_rollups(sender, instance, raw=False, update_fields=None, **kwargs):
+    if raw:
+        return
+    if getattr(instance, '_rollup_priced', False) and update_fields is not None and 'unit_price' not in update_fields:
+        Order.objects.filter(pk=instance.pk, unit_price=None).update(unit_price=instance.unit_price)
+    deltas = new_deltas()
+    previous = getattr(instance, '_rollup_previous', None)
+    if previous is not None:
+        add_order(deltas, previous.order_date, previous.product_id, previous.status, previous.quantity,
+                  order_price(previous), sign=-1)
+    add_order(deltas, instance.order_date, instance.product_id, instance.status, instance.quantity,
+              order_price(instance))
+    apply_deltas(deltas)
+
+
+@receiver(post_delete, sender=Order)
+def remove_from_sales_rollups(sender, instance, **kwargs):
+    deltas = new_deltas()
+    add_order(deltas, instance.order_date, instance.product_id, instance.status, instance.quantity,
+              order_price(instance), sign=-1)
+    apply_deltas(deltas)
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def forget_cached_user(sender, instance, **kwargs):
+    """Saves cover deactivation, password and permission changes; the next request reloads the row."""
+    forget_user(instance.pk)
@@ -0,0 +1,26 @@
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+
+class QueryBudgetMixin:
+    """TestCase mixin for holding endpoints to a maximum number of SQL queries."""
+
+    def assertQueryBudget(self, endpoint, max_queries, method='get', client=None, **kwargs):
+        """
+        Request `endpoint` and fail when it runs more than `max_queries` queries.
+
+        Extra keyword arguments go to the test client call. Returns the response.
+        """
+        client = client or self.client
+        with CaptureQueriesContext(connection) as queries:
+            response = getattr(client, method)(endpoint, **kwargs)
+            if response.streaming:
+                # Streaming views query as the body is consumed; keep the body readable afterwards
+                response.streaming_content = [b''.join(response.streaming_content)]
+        if len(queries) > max_queries:
+            statements = '\n'.join(f"  {query['sql']}" for query in queries.captured_queries)
+            self.fail(
+                f'{method.upper()} {endpoint} ran {len(queries)} queries, over its budget of '
+                f'{max_queries}:\n{statements}'
+            )
+        return response
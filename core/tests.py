@@ -1,3 +1,1504 @@
-from django.test import TestCase
+import csv
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+import tracemalloc
+from datetime import timedelta
+from decimal import Decimal
+from io import BytesIO, StringIO
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db import DEFAULT_DB_ALIAS, OperationalError, close_old_connections, connection, connections
+from django.db.models import QuerySet
+from django.http import HttpResponse
+from django.test import LiveServerTestCase, RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from PIL import Image
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from .authentication import CachedJWTAuthentication, local_users
+from .benchmark import run_load
+from .cache import CATALOG_CACHE_NAMESPACE, get_version, response_cache_stats
+from .categories import category_paths
+from .checks import check_shared_cache
+from .checkout import OutOfStock, effective_price, place_order
+from .db_router import PrimaryReplicaRouter, begin_request, end_request
+from .images import generate_variants
+from .middleware import REPLICA_PIN_COOKIE, ReplicaRoutingMiddleware
+from .models import (
+    Category, Product, Brand, Review, RelatedProduct, Order, SalesRollup, ScheduledSale, ImportCheckpoint,
+)
+from .pagination import EstimatedCountPaginator
+from .pricing import run_scheduled_sales
+from .related import schedule_rebuild
+from .search import reindex_products
+from .serializers import EMBEDDED_REVIEWS
+from .testing import QueryBudgetMixin
+from .views import ProductViewSet
+
+logger = logging.getLogger(__name__)
+
+
+def make_catalog(products=3, reviews_per_product=2):
+    """Create a small catalog with reviews for the API tests."""
+    category = Category.objects.create(name='Shoes')
+    brand, _ = Brand.objects.get_or_create(name='Nike')
+    users = [User.objects.get_or_create(username=f'user{i}')[0] for i in range(reviews_per_product)]
+    created = []
+    for i in range(products):
+        product = Product.objects.create(
+            name=f'Product {i}', category=category, brand=brand, price='100.00', stock=10
+        )
+        for rating, user in enumerate(users, start=3):
+            Review.objects.create(product=product, user=user, rating=rating)
+            Product.adjust_rating(product.id, rating, 1)
+        created.append(product)
+    return created
+
+
+class ProductRatingQueryTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+
+    def test_list_query_count_does_not_grow_with_page_size(self):
+        # Validator aggregate, page, reviews prefetch and related-products prefetch
+        make_catalog(products=2)
+        with self.assertNumQueries(4):
+            self.client.get('/api/products/')
+
+        make_catalog(products=8)
+        with self.assertNumQueries(4):
+            response = self.client.get('/api/products/')
+        self.assertEqual(len(response.json()['results']), 10)
+
+    def test_detail_reports_the_stored_rating_aggregates(self):
+        product = make_catalog(products=1, reviews_per_product=2)[0]
+        data = self.client.get(f'/api/products/{product.id}/').json()
+        self.assertEqual(data['average_rating'], 3.5)
+        self.assertEqual(data['total_reviews'], 2)
+
+
+class ProductRatingAggregateTests(TestCase):
+    def setUp(self):
+        self.product = make_catalog(products=1, reviews_per_product=0)[0]
+        self.user = User.objects.create_user(username='reviewer')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def assertAggregates(self, rating_sum, rating_count):
+        self.product.refresh_from_db()
+        self.assertEqual((self.product.rating_sum, self.product.rating_count), (rating_sum, rating_count))
+
+    def test_review_writes_move_the_aggregates(self):
+        response = self.client.post('/api/reviews/', {'product': self.product.id, 'rating': 4})
+        self.assertEqual(response.status_code, 201)
+        self.assertAggregates(4, 1)
+        self.assertEqual(self.product.average_rating, 4.0)
+
+        review_id = response.json()['id']
+        self.client.patch(f'/api/reviews/{review_id}/', {'rating': 2})
+        self.assertAggregates(2, 1)
+
+        self.client.delete(f'/api/reviews/{review_id}/')
+        self.assertAggregates(0, 0)
+        self.assertEqual(self.product.average_rating, 0.0)
+
+    def test_reconcile_ratings_fixes_drift(self):
+        Review.objects.create(product=self.product, user=self.user, rating=5)
+        updated_at, version = self.product.updated_at, get_version(CATALOG_CACHE_NAMESPACE)
+        call_command('reconcile_ratings', batch_size=1, stdout=StringIO())
+        self.assertAggregates(5, 1)
+        self.assertGreater(self.product.updated_at, updated_at)
+        self.assertNotEqual(get_version(CATALOG_CACHE_NAMESPACE), version)
+
+    def test_reconcile_keeps_reviews_written_while_it_runs(self):
+        Review.objects.create(product=self.product, user=self.user, rating=5)
+        bulk_update = QuerySet.bulk_update
+
+        def racing(queryset, objs, fields, **kwargs):
+            # A review lands between the reconciler's read and its write
+            Review.objects.create(product=self.product, user=User.objects.create_user('racer'), rating=3)
+            Product.adjust_rating(self.product.id, 3, 1)
+            return bulk_update(queryset, objs, fields, **kwargs)
+
+        with mock.patch.object(QuerySet, 'bulk_update', autospec=True, side_effect=racing):
+            call_command('reconcile_ratings', stdout=StringIO())
+        self.assertAggregates(8, 2)
+
+    def test_products_can_be_sorted_and_filtered_by_rating(self):
+        better = make_catalog(products=1, reviews_per_product=2)[0]
+        Product.adjust_rating(self.product.id, 2, 1)
+        ids = [p['id'] for p in self.client.get('/api/products/?ordering=-average_rating').json()['results']]
+        self.assertEqual(ids, [better.id, self.product.id])
+        ids = [p['id'] for p in self.client.get('/api/products/?min_rating=3').json()['results']]
+        self.assertEqual(ids, [better.id])
+
+
+class KeysetPaginationTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+
+    def walk(self, url):
+        ids, sql = [], []
+        while url:
+            with CaptureQueriesContext(connection) as queries:
+                page = self.client.get(url).json()
+            ids.extend(item['id'] for item in page['results'])
+            sql.append(queries[0]['sql'])
+            url = page['next']
+        return ids, sql
+
+    def test_products_are_walked_by_cursor_without_offsets(self):
+        products = make_catalog(products=7, reviews_per_product=0)
+        ids, sql = self.walk('/api/products/?page_size=2')
+        self.assertEqual(ids, [p.id for p in products])
+        self.assertEqual(len(sql), 4)
+        self.assertFalse(any('OFFSET' in statement for statement in sql))
+
+    def test_tied_orderings_are_broken_by_id(self):
+        category = Category.objects.create(name='Socks')
+        Product.objects.bulk_create([
+            Product(name=f'Sock {i}', category=category, price=5 + i % 2, stock=1) for i in range(7)
+        ])
+        for ordering in ('price', '-price', 'average_rating'):
+            expected = list(Product.objects.order_by(ordering, 'id').values_list('id', flat=True))
+            self.assertEqual(self.walk(f'/api/products/?ordering={ordering}&page_size=2')[0], expected)
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get('/api/products/?ordering=price&page_size=2')
+        page_sql = next(q['sql'] for q in queries if 'LIMIT' in q['sql'])
+        self.assertIn('"core_product"."price" ASC, "core_product"."id" ASC', page_sql)
+
+    def test_reviews_are_newest_first_globally_and_per_product(self):
+        products = make_catalog(products=2, reviews_per_product=3)
+        self.client.force_authenticate(User.objects.first())
+        expected = list(Review.objects.order_by('-created_at', 'id').values_list('id', flat=True))
+        self.assertEqual(self.walk('/api/reviews/?page_size=2')[0], expected)
+
+        expected = list(products[0].reviews.order_by('-created_at', 'id').values_list('id', flat=True))
+        self.assertEqual(self.walk(f'/api/reviews/?product={products[0].id}&page_size=2')[0], expected)
+
+
+class RelatedProductIndexTests(TestCase):
+    def setUp(self):
+        self.shoes = Category.objects.create(name='Shoes')
+        self.shirts = Category.objects.create(name='Shirts')
+        self.nike = Brand.objects.create(name='Nike')
+        self.adidas = Brand.objects.create(name='Adidas')
+
+    def make(self, name, category, brand, price):
+        return Product.objects.create(name=name, category=category, brand=brand, price=price, stock=1)
+
+    def related_ids(self, product):
+        return list(RelatedProduct.objects.filter(product=product).values_list('related_id', flat=True))
+
+    def test_neighbours_are_ranked_by_category_brand_and_price_band(self):
+        product = self.make('Air Max', self.shoes, self.nike, 120)
+        same_brand_band = self.make('Air Force', self.shoes, self.nike, 110)
+        same_category = self.make('Superstar', self.shoes, self.adidas, 20)
+        same_brand_only = self.make('Nike Tee', self.shirts, self.nike, 30)
+        self.make('Adidas Tee', self.shirts, self.adidas, 30)
+
+        product.save()
+        self.assertEqual(self.related_ids(product), [same_brand_band.id, same_category.id, same_brand_only.id])
+
+    def test_rebuild_matches_incremental_updates(self):
+        products = [self.make(f'Shoe {i}', self.shoes, self.nike if i % 2 else self.adidas, 40 * i)
+                    for i in range(8)]
+        for product in products:
+            product.save()
+        # Edits that move products between tiers
+        products[1].category, products[2].brand, products[3].price = self.shirts, None, 400
+        for product in products[1:4]:
+            product.save()
+        incremental = {p.id: self.related_ids(p) for p in products}
+
+        call_command('rebuild_related_products', stdout=StringIO())
+        self.assertEqual({p.id: self.related_ids(p) for p in products}, incremental)
+
+    def test_saves_only_rerank_products_whose_top_k_can_change(self):
+        products = [self.make(f'Shoe {i}', self.shoes, self.nike, 100 + i) for i in range(12)]
+        # Every list is already full of lower ids at the top score, so a newcomer enters none
+        before = timezone.now()
+        newcomer = self.make('Shoe 12', self.shoes, self.nike, 120)
+        self.assertEqual(self.related_ids(newcomer), [p.id for p in products[:4]])
+        self.assertFalse(Product.objects.exclude(pk=newcomer.pk).filter(updated_at__gt=before).exists())
+
+        # Moving a product out of the tier re-ranks the lists that held it
+        products[0].brand = self.adidas
+        products[0].price = 20
+        products[0].save()
+        self.assertEqual(self.related_ids(products[1]), [p.id for p in products[2:6]])
+        call_command('rebuild_related_products', stdout=StringIO())
+        self.assertEqual(self.related_ids(products[1]), [p.id for p in products[2:6]])
+
+    def test_wide_changes_hand_over_to_a_background_rebuild(self):
+        product = self.make('Air Max', self.shoes, self.nike, 120)
+        self.make('Air Force', self.shoes, self.nike, 110)
+        with mock.patch('core.related.REFRESH_NEIGHBOURS_LIMIT', 0), self.captureOnCommitCallbacks() as callbacks:
+            product.save()
+        self.assertIn(schedule_rebuild, callbacks)
+
+    def test_serializer_returns_compact_stubs(self):
+        product = self.make('Air Max', self.shoes, self.nike, 120)
+        other = self.make('Air Force', self.shoes, self.nike, 110)
+        data = APIClient().get(f'/api/products/{product.id}/').json()
+        self.assertEqual([stub['id'] for stub in data['related_products']], [other.id])
+        self.assertNotIn('related_products', data['related_products'][0])
+
+
+class CategoryTreeTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.men = Category.objects.create(name='Men')
+        self.shoes = Category.objects.create(name='Shoes', parent=self.men)
+        self.sneakers = Category.objects.create(name='Sneakers', parent=self.shoes)
+        self.women = Category.objects.create(name='Women')
+
+    def test_paths_follow_moves_and_deletes(self):
+        self.shoes.parent = self.women
+        self.shoes.save()
+        self.sneakers.refresh_from_db()
+        self.assertTrue(self.sneakers.path.startswith(self.women.path))
+        self.assertEqual(self.sneakers.depth, 2)
+
+        self.women.delete()
+        self.sneakers.refresh_from_db()
+        self.assertEqual(self.sneakers.path, f'{self.shoes.id:010d}/{self.sneakers.id:010d}/')
+        self.assertEqual(self.sneakers.depth, 1)
+
+    def test_tree_is_built_from_one_query_and_cached(self):
+        with self.assertNumQueries(1):
+            tree = self.client.get('/api/categories/tree/').json()
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get('/api/categories/tree/').json(), tree)
+
+        self.assertEqual([node['name'] for node in tree], ['Men', 'Women'])
+        self.assertEqual(tree[0]['subcategories'][0]['subcategories'][0]['name'], 'Sneakers')
+
+        Category.objects.create(name='Kids')
+        self.assertEqual(len(self.client.get('/api/categories/tree/').json()), 3)
+
+    def test_list_loads_the_tree_in_one_query(self):
+        with self.assertNumQueries(2):  # Validator aggregate plus the tree
+            data = self.client.get('/api/categories/').json()
+        self.assertEqual(data[0]['subcategories'][0]['name'], 'Shoes')
+
+    def test_products_can_be_filtered_by_subtree(self):
+        sneaker = Product.objects.create(name='Air Max', category=self.sneakers, price=100, stock=1)
+        Product.objects.create(name='Heels', category=self.women, price=100, stock=1)
+        data = self.client.get(f'/api/products/?category_tree={self.men.id}').json()
+        self.assertEqual([p['id'] for p in data['results']], [sneaker.id])
+
+
+class ProductExportTests(TestCase):
+    def setUp(self):
+        self.category = Category.objects.create(name='Shoes')
+
+    def add_products(self, count):
+        Product.objects.bulk_create(
+            Product(name=f'Product {i}', category=self.category, price='19.99', stock=i, description='x' * 200)
+            for i in range(count)
+        )
+
+    def stream_peak(self, **params):
+        tracemalloc.start()
+        try:
+            response = self.client.get('/api/products/export/', params)
+            size = sum(len(chunk) for chunk in response.streaming_content)
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+        return size, peak
+
+    def test_json_and_ndjson_formats(self):
+        self.add_products(3)
+        response = self.client.get('/api/products/export/')
+        rows = json.loads(b''.join(response.streaming_content))
+        self.assertEqual([row['stock'] for row in rows], [0, 1, 2])
+
+        response = self.client.get('/api/products/export/', {'format': 'ndjson'})
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual([json.loads(line)['stock'] for line in lines], [0, 1, 2])
+
+    @mock.patch('core.views.EXPORT_CHUNK_SIZE', 200)
+    def test_peak_memory_does_not_grow_with_catalog_size(self):
+        self.add_products(1000)
+        small_size, small_peak = self.stream_peak()
+        self.add_products(9000)
+        large_size, large_peak = self.stream_peak()
+
+        self.assertGreater(large_size, small_size * 9)
+        self.assertLess(large_peak, small_peak * 2)
+
+
+class ProductFilterTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.shoes = Category.objects.create(name='Shoes')
+        self.nike = Brand.objects.create(name='Nike')
+        self.sale = Product.objects.create(name='Sale', category=self.shoes, brand=self.nike, price=50,
+                                           stock=3, is_on_sale=True, discount_percentage=20)
+        self.sold_out = Product.objects.create(name='Sold out', category=self.shoes, price=80, stock=0)
+
+    def ids(self, query):
+        return [p['id'] for p in self.client.get(f'/api/products/?{query}').json()['results']]
+
+    def test_names_resolve_case_insensitively_without_joins(self):
+        self.assertEqual(self.ids('category=shoes'), [self.sale.id, self.sold_out.id])
+        self.assertEqual(self.ids('brand=NIKE'), [self.sale.id])
+        self.assertEqual(self.ids('brand=adidas'), [])
+
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get('/api/products/?category=Shoes&brand=Nike')
+        product_sql = next(q['sql'] for q in queries if 'FROM "core_product"' in q['sql'])
+        self.assertNotIn('core_brand', product_sql.split('WHERE')[1])
+
+    def test_lookup_map_is_invalidated_on_save(self):
+        self.assertEqual(self.ids('brand=Adidas'), [])
+        self.nike.name = 'Adidas'
+        self.nike.save()
+        self.assertEqual(self.ids('brand=Adidas'), [self.sale.id])
+
+    def test_sale_and_stock_filters(self):
+        self.assertEqual(self.ids('is_on_sale=true'), [self.sale.id])
+        self.assertEqual(self.ids('in_stock=true'), [self.sale.id])
+        self.assertEqual(self.ids('in_stock=false'), [self.sold_out.id])
+
+    def test_effective_price_is_stored_filtered_and_ordered(self):
+        product = self.client.get(f'/api/products/{self.sale.id}/').json()
+        self.assertEqual((product['price'], product['effective_price']), ('50.00', '40.00'))
+        self.assertEqual(self.ids('price_max=45'), [])
+        self.assertEqual(self.ids('effective_price_max=45'), [self.sale.id])
+        self.assertEqual(self.ids('effective_price_min=45'), [self.sold_out.id])
+        self.assertEqual(self.ids('ordering=-effective_price'), [self.sold_out.id, self.sale.id])
+        sparse = self.client.get('/api/products/?fields=effective_price').json()['results']
+        self.assertEqual(sparse[0], {'id': self.sale.id, 'effective_price': '40.00'})
+
+    def test_write_responses_carry_the_new_effective_price(self):
+        client = APIClient()
+        client.force_authenticate(User.objects.create_user(username='staff', is_staff=True))
+        response = client.patch(f'/api/products/{self.sale.id}/', {'price': '12.00'}, format='json')
+        self.assertEqual((response.json()['price'], response.json()['effective_price']), ('12.00', '9.60'))
+
+    def test_stored_effective_price_matches_checkout(self):
+        for price, discount in [('19.99', 15), ('7.49', 33), ('120.00', 50), ('0.99', 10)]:
+            product = Product.objects.create(name='Priced', category=self.shoes, price=price, stock=1,
+                                             is_on_sale=True, discount_percentage=discount)
+            product.refresh_from_db()
+            self.assertEqual(product.effective_price, effective_price(Decimal(price), True, discount))
+
+
+class ProductSearchTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.shoes = Category.objects.create(name='Shoes')
+        self.nike = Brand.objects.create(name='Nike')
+        self.runner = Product.objects.create(name='Trail runner', category=self.shoes, price=90, stock=1,
+                                             description='Lightweight shoe')
+        self.boot = Product.objects.create(name='Hiking boot', category=self.shoes, brand=self.nike, price=120,
+                                           stock=1, description='Waterproof boot for trail running')
+
+    def search(self, query):
+        return [p['id'] for p in self.client.get('/api/products/search/', {'q': query}).json()]
+
+    def test_results_are_ranked_by_field_weight(self):
+        self.assertEqual(self.search('trail'), [self.runner.id, self.boot.id])
+        self.assertEqual(self.search('waterproof boots'), [self.boot.id])
+        self.assertEqual(self.search('sandal'), [])
+
+    def test_index_follows_product_brand_and_category_changes(self):
+        self.assertEqual(self.search('nike'), [self.boot.id])
+        self.nike.name = 'Adidas'
+        self.nike.save()
+        self.assertEqual(self.search('nike'), [])
+        self.assertEqual(self.search('adidas'), [self.boot.id])
+
+        self.shoes.name = 'Footwear'
+        self.shoes.save()
+        self.assertEqual(sorted(self.search('footwear')), [self.runner.id, self.boot.id])
+
+        self.runner.name = 'Road racer'
+        self.runner.save()
+        self.assertEqual(self.search('racer'), [self.runner.id])
+        self.runner.delete()
+        self.assertEqual(self.search('racer'), [])
+
+    def test_query_is_required_and_filters_apply(self):
+        self.assertEqual(self.client.get('/api/products/search/').status_code, 400)
+        self.assertEqual(self.client.get('/api/products/search/', {'q': 'trail', 'brand': 'nike'}).json()[0]['id'],
+                         self.boot.id)
+
+    def test_filters_apply_before_the_result_limit(self):
+        Product.objects.bulk_create([
+            Product(name=f'Cheap runner {i}', category=self.shoes, price=10, stock=1, description='') for i in range(60)
+        ])
+        reindex_products(Product.objects.all())
+        found = self.client.get('/api/products/search/', {'q': 'runner', 'price_min': 50}).json()
+        self.assertEqual([p['id'] for p in found], [self.runner.id])
+
+    def test_limit_is_clamped(self):
+        Product.objects.bulk_create([
+            Product(name=f'Cheap runner {i}', category=self.shoes, price=10, stock=1, description='') for i in range(60)
+        ])
+        reindex_products(Product.objects.all())
+        self.assertEqual(len(self.client.get('/api/products/search/', {'q': 'runner', 'limit': -1}).json()), 1)
+        self.assertEqual(len(self.client.get('/api/products/search/', {'q': 'runner', 'limit': 500}).json()), 50)
+
+
+class ResponseCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.product = make_catalog(products=2, reviews_per_product=1)[0]
+
+    def test_anonymous_reads_are_served_from_cache_until_the_catalog_changes(self):
+        first = self.client.get('/api/products/?category=Shoes&is_on_sale=false')
+        self.assertEqual(first['X-Cache'], 'MISS')
+        with self.assertNumQueries(0):
+            second = self.client.get('/api/products/?is_on_sale=false&category=Shoes&brand=')
+        self.assertEqual(second['X-Cache'], 'HIT')
+        self.assertEqual(second.json(), first.json())
+        self.assertEqual(response_cache_stats(), {'hits': 1, 'misses': 1})
+
+        Review.objects.create(product=self.product, user=User.objects.create_user('late'), rating=1)
+        self.assertEqual(self.client.get('/api/products/?category=Shoes&is_on_sale=false')['X-Cache'], 'MISS')
+
+    def test_process_local_caches_are_flagged_for_several_workers(self):
+        self.assertEqual(check_shared_cache(None), [])
+        with mock.patch.dict(os.environ, {'WEB_CONCURRENCY': '4'}):
+            self.assertEqual([warning.id for warning in check_shared_cache(None)], ['core.W001'])
+            redis = {'default': {'BACKEND': 'django.core.cache.backends.redis.RedisCache', 'LOCATION': ''}}
+            with override_settings(CACHES=redis):
+                self.assertEqual(check_shared_cache(None), [])
+
+    @override_settings(ALLOWED_HOSTS=['testserver', 'shop.example.com'])
+    def test_each_origin_gets_its_own_entry(self):
+        self.client.get('/api/products/')
+        self.assertEqual(self.client.get('/api/products/')['X-Cache'], 'HIT')
+        other_host = self.client.get('/api/products/', HTTP_HOST='shop.example.com')
+        self.assertEqual(other_host['X-Cache'], 'MISS')
+        self.assertEqual(self.client.get('/api/products/', secure=True)['X-Cache'], 'MISS')
+
+    def test_brands_and_categories_are_cached(self):
+        for url in ('/api/brands/', '/api/categories/'):
+            self.client.get(url)
+            self.assertEqual(self.client.get(url)['X-Cache'], 'HIT')
+        Brand.objects.create(name='Puma')
+        self.assertEqual(len(self.client.get('/api/brands/').json()), 2)
+
+    def test_authenticated_requests_bypass_the_cache(self):
+        self.client.force_authenticate(User.objects.first())
+        self.client.get('/api/products/')
+        self.assertNotIn('X-Cache', self.client.get('/api/products/'))
+
+
+class ConditionalGetTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.product = make_catalog(products=2, reviews_per_product=1)[0]
+        self.client.force_authenticate(User.objects.first())  # Skip the response cache
+
+    def test_detail_etag_and_last_modified(self):
+        url = f'/api/products/{self.product.id}/'
+        response = self.client.get(url)
+        with self.assertNumQueries(1):
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+        with self.assertNumQueries(1):
+            self.assertEqual(self.client.get(url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified']).status_code, 304)
+
+        review = self.product.reviews.get()
+        self.client.patch(f'/api/reviews/{review.id}/', {'comment': 'Changed my mind'})
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 200)
+
+    def test_collection_etag_tracks_filters_and_deletes(self):
+        response = self.client.get('/api/products/')
+        self.assertEqual(self.client.get('/api/products/', HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+        self.assertEqual(
+            self.client.get('/api/products/?in_stock=true', HTTP_IF_NONE_MATCH=response['ETag']).status_code, 200
+        )
+        Product.objects.last().delete()
+        self.assertEqual(self.client.get('/api/products/', HTTP_IF_NONE_MATCH=response['ETag']).status_code, 200)
+
+    def test_collection_validators_follow_rows_not_the_cache_version(self):
+        response = self.client.get('/api/products/')
+        self.assertIn('Last-Modified', response)
+        self.assertEqual(
+            self.client.get('/api/products/', HTTP_IF_MODIFIED_SINCE=response['Last-Modified']).status_code, 304
+        )
+        # A queryset update fires no signal, e.g. a write seen by another worker's cache
+        version = get_version(CATALOG_CACHE_NAMESPACE)
+        Product.objects.filter(pk=self.product.pk).update(stock=0, updated_at=timezone.now() + timedelta(seconds=5))
+        self.assertEqual(get_version(CATALOG_CACHE_NAMESPACE), version)
+        self.assertEqual(self.client.get('/api/products/', HTTP_IF_NONE_MATCH=response['ETag']).status_code, 200)
+        self.assertEqual(
+            self.client.get('/api/products/', HTTP_IF_MODIFIED_SINCE=response['Last-Modified']).status_code, 200
+        )
+
+    def test_cached_anonymous_responses_still_answer_304_without_queries(self):
+        self.client.force_authenticate(None)
+        response = self.client.get('/api/brands/')
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get('/api/brands/', HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+
+
+class CheckoutTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='buyer')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        category = Category.objects.create(name='Shoes')
+        self.shoe = Product.objects.create(name='Shoe', category=category, price=100, stock=5,
+                                           is_on_sale=True, discount_percentage=25)
+        self.sock = Product.objects.create(name='Sock', category=category, price='4.99', stock=1)
+
+    def test_cart_reserves_stock_and_records_prices(self):
+        response = self.client.post('/api/checkout/', {'items': [
+            {'product': self.shoe.id, 'quantity': 2},
+            {'product': self.sock.id, 'quantity': 1},
+        ]}, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual({o['product']: o['unit_price'] for o in response.json()},
+                         {self.shoe.id: '75.00', self.sock.id: '4.99'})
+        self.assertEqual(len({o['reference'] for o in response.json()}), 1)
+        self.assertEqual(list(Product.objects.order_by('id').values_list('stock', flat=True)), [3, 0])
+
+    def test_one_short_line_rolls_back_the_whole_cart(self):
+        response = self.client.post('/api/checkout/', {'items': [
+            {'product': self.shoe.id, 'quantity': 1},
+            {'product': self.sock.id, 'quantity': 2},
+        ]}, format='json')
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json()['product'], self.sock.id)
+        self.assertEqual(list(Product.objects.order_by('id').values_list('stock', flat=True)), [5, 1])
+        self.assertFalse(Order.objects.exists())
+
+    def test_unknown_products_are_rejected_by_id(self):
+        response = self.client.post('/api/checkout/', {'items': [
+            {'product': self.shoe.id, 'quantity': 1},
+            {'product': 998, 'quantity': 1},
+            {'product': 999, 'quantity': 1},
+        ]}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['products'], [998, 999])
+        self.assertEqual(Product.objects.get(pk=self.shoe.pk).stock, 5)
+        self.assertFalse(Order.objects.exists())
+
+
+class CheckoutContentionTests(TransactionTestCase):
+    STOCK = 20
+
+    def setUp(self):
+        category = Category.objects.create(name='Flash sale')
+        self.products = [Product.objects.create(name=f'Deal {i}', category=category, price=10, stock=self.STOCK)
+                         for i in range(2)]
+        self.users = [User.objects.create_user(username=f'shopper{i}') for i in range(8)]
+
+    def run_buyers(self, threads, attempts):
+        sold = []
+        lock = threading.Lock()
+
+        def buyer(user):
+            try:
+                for _ in range(attempts):
+                    # Both products in opposite orders exercises the deterministic locking order
+                    items = [(p.id, 1) for p in (self.products if len(sold) % 2 else self.products[::-1])]
+                    while True:
+                        try:
+                            place_order(user, items)
+                        except OutOfStock:
+                            break
+                        except OperationalError:
+                            continue  # SQLite serializes writers; retry when the database is locked
+                        with lock:
+                            sold.append(user.id)
+                        break
+            finally:
+                close_old_connections()
+
+        workers = [threading.Thread(target=buyer, args=(user,)) for user in self.users[:threads]]
+        started = time.perf_counter()
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        return len(sold), time.perf_counter() - started
+
+    def test_concurrent_checkouts_never_oversell(self):
+        for threads in (1, 4, 8):
+            with self.subTest(threads=threads):
+                Product.objects.update(stock=self.STOCK)
+                Order.objects.all().delete()
+                sold, elapsed = self.run_buyers(threads, attempts=10)
+                logger.info('checkout: %d threads, %.1f carts/s', threads, sold / elapsed)
+
+                self.assertEqual(sold, min(self.STOCK, threads * 10))
+                self.assertEqual(list(Product.objects.values_list('stock', flat=True)), [self.STOCK - sold] * 2)
+                self.assertEqual(Order.objects.count(), sold * 2)
+
+
+class CatalogImportExportTests(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+
+    def write(self, name, lines):
+        path = os.path.join(self.tmp.name, name)
+        with open(path, 'w') as handle:
+            handle.write('\n'.join(lines) + '\n')
+        return path
+
+    def test_import_creates_lookups_in_bulk_and_indexes_products(self):
+        path = self.write('catalog.csv', [
+            'name,category,brand,price,stock,is_on_sale,discount_percentage,description',
+            'Air Max,Shoes,Nike,120.00,5,true,10,Running shoe',
+            'Superstar,shoes,Adidas,80.00,0,false,0,',
+            'Plain tee,Shirts,,15.00,40,false,0,Cotton',
+        ])
+        call_command('import_catalog', path, batch_size=2, stdout=StringIO())
+
+        self.assertEqual(sorted(Category.objects.values_list('name', flat=True)), ['Shirts', 'Shoes'])
+        self.assertEqual(Product.objects.filter(category__name='Shoes').count(), 2)
+        self.assertTrue(all(Category.objects.values_list('path', flat=True)))
+        tee = Product.objects.get(name='Plain tee')
+        self.assertIsNone(tee.brand_id)
+        found = APIClient().get('/api/products/search/', {'q': 'cotton'}).json()
+        self.assertEqual([p['id'] for p in found], [tee.id])
+
+    def test_export_round_trips_through_import_as_updates(self):
+        make_catalog(products=3, reviews_per_product=0)
+        path = os.path.join(self.tmp.name, 'catalog.jsonl')
+        call_command('export_catalog', path, stdout=StringIO(), stderr=StringIO())
+        Product.objects.update(stock=0)
+
+        call_command('import_catalog', path, stdout=StringIO())
+        self.assertEqual(Product.objects.count(), 3)
+        self.assertEqual(set(Product.objects.values_list('stock', flat=True)), {10})
+
+    def test_failed_import_resumes_from_last_committed_batch(self):
+        lines = ['name,category,price,stock'] + [f'Item {i},Misc,1.00,1' for i in range(4)]
+        path = self.write('catalog.csv', lines[:3] + ['Broken,Misc,not-a-price,1'] + lines[4:])
+        with self.assertRaisesMessage(CommandError, "Line 4 (row 3): price 'not-a-price' is not a number."):
+            call_command('import_catalog', path, batch_size=2, stdout=StringIO())
+        self.assertEqual(Product.objects.count(), 2)
+        self.assertEqual(ImportCheckpoint.objects.get().position, 2)
+
+        self.write('catalog.csv', lines)
+        output = StringIO()
+        call_command('import_catalog', path, batch_size=2, stdout=output)
+        self.assertIn('Resuming after row 2', output.getvalue())
+        self.assertEqual(sorted(Product.objects.values_list('name', flat=True)), [f'Item {i}' for i in range(4)])
+        self.assertFalse(ImportCheckpoint.objects.exists())
+
+    def test_rows_missing_required_columns_name_their_line(self):
+        for line, message in [
+            ('Shirt,,1.00,1', 'category is missing'),
+            (',Misc,1.00,1', 'name is missing'),
+            ('Shirt,Misc,,1', 'price is missing'),
+            ('Shirt,Misc,1.00,-2', "stock '-2' is negative"),
+        ]:
+            path = self.write('catalog.csv', ['name,category,price,stock', 'Item,Misc,1.00,1', line])
+            with self.assertRaisesMessage(CommandError, f'Line 3 (row 2): {message}.'):
+                call_command('import_catalog', path, stdout=StringIO())
+        self.assertFalse(Product.objects.exists())
+
+        path = self.write('catalog.jsonl', ['{"name": "Item", "category": "Misc", "price": "1.00"}', '[1]'])
+        with self.assertRaisesMessage(CommandError, 'Line 2: expected a JSON object.'):
+            call_command('import_catalog', path, stdout=StringIO())
+
+    def test_copy_rows_fill_every_required_column(self):
+        from .management.commands.import_catalog import COPY_COLUMNS, Command, clean_row, copy_rows
+        required = {
+            field.attname for field in Product._meta.concrete_fields
+            if not field.null and not field.primary_key and not field.generated and not field.has_db_default()
+        }
+        self.assertEqual(required - set(COPY_COLUMNS), set())
+
+        command = Command()
+        command.categories, command.brands = {'shoes': 1}, {}
+        product = command.build(clean_row({'name': 'Air, Max', 'category': 'Shoes', 'price': '120.00', 'stock': '5'}))
+        rows = list(csv.reader(StringIO(copy_rows([product]))))
+        self.assertEqual(len(rows[0]), len(COPY_COLUMNS))
+        row = dict(zip(COPY_COLUMNS, rows[0]))
+        self.assertEqual((row['name'], row['brand_id'], row['image_variants']), ('Air, Max', r'\N', '{}'))
+
+
+class ImageVariantTests(TestCase):
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        media_root = override_settings(MEDIA_ROOT=media.name)
+        media_root.enable()
+        self.addCleanup(media_root.disable)
+        buffer = BytesIO()
+        Image.new('RGB', (1200, 800), 'red').save(buffer, 'PNG')
+        category = Category.objects.create(name='Shoes')
+        self.product = Product.objects.create(
+            name='Air Max', category=category, price=100, stock=1,
+            image=SimpleUploadedFile('air.png', buffer.getvalue(), content_type='image/png'),
+        )
+
+    def test_variants_are_resized_webp_files(self):
+        generate_variants(self.product)
+        self.product.refresh_from_db()
+        variants = self.product.variant_urls()
+        self.assertEqual(sorted(variants), [160, 480, 960])
+        with self.product.image.storage.open(self.product.image_variants['widths']['480']) as handle:
+            image = Image.open(handle)
+            self.assertEqual((image.format, image.size), ('WEBP', (480, 320)))
+        self.assertIn('_160.webp', self.product.image_tag())
+
+    def test_serializer_exposes_srcset_only_for_the_current_image(self):
+        url = f'/api/products/{self.product.id}/'
+        self.assertEqual(APIClient().get(url).json()['image_srcset'], {})
+        call_command('generate_image_variants', workers=1, stdout=StringIO())
+        srcset = APIClient().get(url).json()['image_srcset']
+        self.assertEqual(list(srcset), ['160w', '480w', '960w'])
+        self.assertTrue(srcset['160w'].startswith('http://testserver/media/'))
+
+        self.product.image = SimpleUploadedFile('new.png', b'', content_type='image/png')
+        self.assertEqual(self.product.variant_urls(), {})
+
+
+class AsyncReadPathTests(TestCase):
+    def setUp(self):
+        self.products = make_catalog(products=3, reviews_per_product=1)
+
+    async def test_async_product_list_matches_the_sync_payload(self):
+        sync_page = await sync_to_async(lambda: APIClient().get('/api/products/').json())()
+        page = (await self.async_client.get('/api/async/products/', {'page_size': 2})).json()
+        self.assertEqual(page['results'], sync_page['results'][:2])
+
+        rest = (await self.async_client.get(page['next'])).json()
+        self.assertEqual([p['id'] for p in rest['results']], [self.products[2].id])
+        self.assertIsNone(rest['next'])
+
+    async def test_async_detail_filters_and_categories(self):
+        product = self.products[0]
+        response = await self.async_client.get(f'/api/async/products/{product.id}/')
+        self.assertEqual(response.json()['total_reviews'], 1)
+        self.assertEqual((await self.async_client.get('/api/async/products/999/')).status_code, 404)
+
+        page = (await self.async_client.get('/api/async/products/', {'brand': 'nike', 'in_stock': 'false'})).json()
+        self.assertEqual(page['results'], [])
+        categories = (await self.async_client.get('/api/async/categories/')).json()
+        self.assertEqual([c['name'] for c in categories], ['Shoes'])
+
+
+class BenchmarkHelperTests(LiveServerTestCase):
+    def test_run_load_reports_latency_and_throughput(self):
+        Category.objects.create(name='Shoes')
+        result = run_load(f'{self.live_server_url}/api/categories/', concurrency=2, requests=10)
+        self.assertEqual((result['requests'], result['errors']), (10, 0))
+        self.assertGreater(result['rps'], 0)
+        self.assertLessEqual(result['p50_ms'], result['p99_ms'])
+
+
+class EmbeddedReviewTests(TestCase):
+    def setUp(self):
+        self.products = make_catalog(products=3, reviews_per_product=EMBEDDED_REVIEWS + 3)
+        self.client = APIClient()
+
+    def test_payload_embeds_only_the_latest_reviews(self):
+        product = self.products[0]
+        data = self.client.get(f'/api/products/{product.id}/').json()
+        latest = list(product.reviews.order_by('-created_at', 'id').values_list('id', flat=True)[:EMBEDDED_REVIEWS])
+        self.assertEqual([review['id'] for review in data['reviews']], latest)
+        self.assertEqual(data['total_reviews'], EMBEDDED_REVIEWS + 3)
+
+    def test_latest_reviews_for_a_page_come_from_one_windowed_query(self):
+        with CaptureQueriesContext(connection) as queries:
+            page = self.client.get('/api/products/').json()['results']
+        self.assertTrue(all(len(product['reviews']) == EMBEDDED_REVIEWS for product in page))
+        review_queries = [q['sql'] for q in queries if 'FROM "core_review"' in q['sql']]
+        self.assertEqual(len(review_queries), 1)
+        self.assertIn('ROW_NUMBER()', review_queries[0])
+
+    def test_nested_reviews_endpoint_pages_the_full_history(self):
+        product = self.products[1]
+        url, seen = f'/api/products/{product.id}/reviews/?page_size=3', []
+        with self.assertNumQueries(2):  # Product existence check plus one page with usernames joined
+            page = self.client.get(url).json()
+        while True:
+            seen.extend(review['id'] for review in page['results'])
+            if not page['next']:
+                break
+            page = self.client.get(page['next']).json()
+        self.assertEqual(seen, list(product.reviews.order_by('-created_at', 'id').values_list('id', flat=True)))
+        self.assertEqual(self.client.get('/api/products/999/reviews/').status_code, 404)
+
+
+class SparseFieldsetTests(TestCase):
+    def setUp(self):
+        self.products = make_catalog(products=3, reviews_per_product=2)
+        self.client = APIClient()
+
+    def test_flat_fields_come_from_a_single_column_only_query(self):
+        full = self.client.get('/api/products/').json()['results']
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/products/?fields=name,price,discount_percentage,image,average_rating')
+        self.assertEqual(len(queries), 2)  # Validator aggregate and the page itself
+        self.assertNotIn('description', queries[1]['sql'])
+        self.assertNotIn('JOIN', queries[1]['sql'])
+        expected = [
+            {name: item[name] for name in ('id', 'name', 'price', 'discount_percentage', 'image', 'average_rating')}
+            for item in full
+        ]
+        self.assertEqual(response.json()['results'], expected)
+
+    def test_expand_adds_only_the_requested_nested_fields(self):
+        with self.assertNumQueries(3):
+            results = self.client.get('/api/products/?fields=name&expand=reviews').json()['results']
+        self.assertEqual(set(results[0]), {'id', 'name', 'reviews'})
+        self.assertEqual(len(results[0]['reviews']), 2)
+
+        detail = self.client.get(f'/api/products/{self.products[0].id}/?expand=related_products').json()
+        self.assertIn('related_products', detail)
+        self.assertIn('image_srcset', detail)
+        self.assertNotIn('reviews', detail)
+        detail = self.client.get(f'/api/products/{self.products[0].id}/?fields=name').json()
+        self.assertEqual(detail, {'id': self.products[0].id, 'name': 'Product 0'})
+
+    def test_fast_path_keeps_cursor_pagination_and_ordering(self):
+        Product.objects.filter(pk=self.products[0].pk).update(price='150.00')
+        page = self.client.get('/api/products/?fields=price&ordering=-price&page_size=2').json()
+        ids = [item['id'] for item in page['results']]
+        ids += [item['id'] for item in self.client.get(page['next']).json()['results']]
+        self.assertEqual(ids, [self.products[0].id, self.products[1].id, self.products[2].id])
+
+    def test_unknown_fields_are_rejected(self):
+        response = self.client.get('/api/products/?fields=name,secret')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.client.get('/api/products/?expand=price').status_code, 400)
+
+    def test_benchmark_reports_every_field_set(self):
+        out = StringIO()
+        call_command('benchmark_product_fields', page_size=3, repeat=2, stdout=out)
+        self.assertEqual(len(out.getvalue().splitlines()), 7)
+
+
+# Query budget of every named route in core.urls, as (method, path, max queries). Paths are
+# formatted with the fixture ids; EndpointQueryBudgetTests fails for routes missing here.
+QUERY_BUDGETS = {
+    'api-root': ('get', '/api/', 0),
+    'product_list': ('get', '/api/products/export/', 1),
+    'checkout': ('post', '/api/checkout/', 7),
+    'bulk_pricing': ('post', '/api/products/pricing/', 4),
+    'sales_report': ('get', '/api/reports/sales/?group_by=category,status', 2),
+    'async_product_list': ('get', '/api/async/products/', 3),
+    'async_product_detail': ('get', '/api/async/products/{product}/', 3),
+    'async_category_list': ('get', '/api/async/categories/', 1),
+    'category-list': ('get', '/api/categories/', 2),
+    'category-tree': ('get', '/api/categories/tree/', 1),
+    'category-detail': ('get', '/api/categories/{category}/', 3),
+    'brand-list': ('get', '/api/brands/', 2),
+    'brand-detail': ('get', '/api/brands/{brand}/', 2),
+    'product-list': ('get', '/api/products/', 4),
+    'product-search': ('get', '/api/products/search/?q=product', 4),
+    'product-facets': ('get', '/api/products/facets/', 2),
+    'product-detail': ('get', '/api/products/{product}/', 4),
+    'product-reviews': ('get', '/api/products/{product}/reviews/', 2),
+    'review-list': ('get', '/api/reviews/', 1),
+    'review-detail': ('get', '/api/reviews/{review}/', 1),
+}
+# Bodies of the POST routes above, built from the sample ids
+QUERY_BUDGET_BODIES = {
+    'checkout': lambda ids: {'items': [{'product': ids['product'], 'quantity': 1}]},
+    'bulk_pricing': lambda ids: {'brands': [ids['brand']], 'discount_percentage': 20, 'is_on_sale': True},
+}
+
+
+class EndpointQueryBudgetTests(QueryBudgetMixin, TestCase):
+    def setUp(self):
+        cache.clear()
+        self.products = make_catalog(products=6, reviews_per_product=3)
+        self.client = APIClient()
+        # Authenticated, so every request renders instead of hitting the response cache
+        self.client.force_authenticate(User.objects.create_user(username='budget', is_staff=True))
+        self.ids = {
+            'product': self.products[0].id,
+            'category': self.products[0].category_id,
+            'brand': self.products[0].brand_id,
+            'review': self.products[0].reviews.first().id,
+        }
+
+    def test_every_core_route_declares_a_budget(self):
+        from .urls import urlpatterns
+        self.assertEqual(sorted({pattern.name for pattern in urlpatterns} - QUERY_BUDGETS.keys()), [])
+
+    def test_endpoints_stay_within_their_query_budgets(self):
+        for name, (method, path, budget) in QUERY_BUDGETS.items():
+            with self.subTest(name):
+                kwargs = {}
+                if method == 'post':
+                    kwargs = {'data': QUERY_BUDGET_BODIES[name](self.ids), 'format': 'json'}
+                response = self.assertQueryBudget(path.format(**self.ids), budget, method, **kwargs)
+                self.assertLess(response.status_code, 300)
+
+    def test_helper_reports_the_statements_over_budget(self):
+        with self.assertRaises(AssertionError) as raised:
+            self.assertQueryBudget('/api/products/', 1)
+        self.assertIn('ran 4 queries, over its budget of 1', str(raised.exception))
+        self.assertIn('core_review', str(raised.exception))
+
+
+class QueryInstrumentationTests(TestCase):
+    def setUp(self):
+        self.products = make_catalog(products=4, reviews_per_product=1)
+        self.client = APIClient()
+
+    def test_server_timing_and_log_line_per_request(self):
+        with self.assertLogs('core.queries', level='INFO') as logs:
+            response = self.client.get(f'/api/products/{self.products[0].id}/')
+        self.assertRegex(response['Server-Timing'], r'^db;dur=[\d.]+;desc="4 queries", total;dur=[\d.]+$')
+        entry = json.loads(logs.records[-1].getMessage())
+        self.assertEqual((entry['path'], entry['status'], entry['queries']), (response.wsgi_request.path, 200, 4))
+        self.assertEqual(entry['repeated'], [])
+        self.assertEqual(logs.records[-1].levelname, 'INFO')
+
+    def test_streamed_bodies_are_measured_once_consumed(self):
+        with self.assertLogs('core.queries', level='INFO') as logs:
+            response = self.client.get('/api/products/export/')
+            logging.getLogger('core.queries').info('headers sent')
+            rows = json.loads(b''.join(response.streaming_content))
+        self.assertEqual(len(rows), 4)
+        self.assertEqual(logs.records[0].getMessage(), 'headers sent')
+        entry = json.loads(logs.records[-1].getMessage())
+        self.assertEqual((entry['path'], entry['queries']), ('/api/products/export/', 1))
+
+    def test_repeated_statements_are_flagged(self):
+        # Without the prefetches each product queries its reviews and related links, and each link its product
+        with mock.patch.object(ProductViewSet, 'queryset', Product.objects.order_by('id')):
+            with self.assertLogs('core.queries', level='WARNING') as logs:
+                self.client.get('/api/products/')
+        entry = json.loads(logs.records[-1].getMessage())
+        self.assertEqual(sorted(item['count'] for item in entry['repeated']), [4, 4, 12])
+        self.assertTrue(any('core_review' in item['sql'] for item in entry['repeated']))
+
+
+class GenerateCatalogTests(TestCase):
+    def test_generates_a_consistent_skewed_catalog(self):
+        call_command('generate_catalog', categories=13, branching=3, depth=3, brands=4, products=60, users=30,
+                     reviews=300, orders=400, seed=7, batch_size=50, stdout=StringIO())
+        self.assertEqual(
+            (Category.objects.count(), Brand.objects.count(), Product.objects.count(), Order.objects.count()),
+            (13, 4, 60, 400),
+        )
+        for category in Category.objects.select_related('parent'):
+            parent_path = category.parent.path if category.parent else ''
+            self.assertEqual(category.path, f'{parent_path}{category.pk:010d}/')
+        self.assertFalse(Product.objects.filter(category__subcategories__isnull=False).exists())
+
+        out = StringIO()
+        call_command('reconcile_ratings', stdout=out)
+        self.assertIn('fixed 0', out.getvalue())
+        self.assertTrue(RelatedProduct.objects.exists())
+        self.assertEqual(self.client.get('/api/products/search/', {'q': 'runner'}).status_code, 200)
+
+        per_product = sorted(
+            (Order.objects.filter(product=p).count() for p in Product.objects.all()), reverse=True,
+        )
+        self.assertGreater(per_product[0], 5 * per_product[len(per_product) // 2])
+        self.assertGreater(len(set(Order.objects.dates('order_date', 'day'))), 30)
+
+    def test_benchmark_covers_every_route_and_leaves_no_trace(self):
+        make_catalog(products=5, reviews_per_product=2)
+        users = User.objects.count()
+        with tempfile.TemporaryDirectory() as folder:
+            output = os.path.join(folder, 'benchmark.json')
+            with self.assertLogs('core.queries'):  # Keeps the per-request log lines out of the test output
+                call_command('benchmark_endpoints', output=output, repeat=2, stdout=StringIO())
+            with open(output) as handle:
+                report = json.load(handle)
+
+        from .urls import urlpatterns
+        routes = report['routes']
+        self.assertLessEqual({pattern.name for pattern in urlpatterns} | {'register', 'token_refresh'}, routes.keys())
+        self.assertTrue(any(name.startswith('admin:') for name in routes))
+        for name in {pattern.name for pattern in urlpatterns} | {'register', 'token_obtain_pair', 'admin:index'}:
+            with self.subTest(name):
+                self.assertLess(routes[name]['status'], 300)
+                self.assertGreater(routes[name]['bytes'], 0)
+        self.assertEqual(routes['product-list']['queries'], 4)
+        self.assertEqual(report['catalog']['product'], 5)
+        self.assertEqual((Order.objects.count(), User.objects.count()), (0, users))
+
+
+# Query budget per admin changelist; it must not grow with the number of rows listed
+ADMIN_CHANGELIST_BUDGETS = {
+    '/admin/core/category/': 6,
+    '/admin/core/brand/': 5,
+    '/admin/core/product/': 6,
+    '/admin/core/order/': 7,
+    '/admin/core/review/': 5,
+}
+
+
+class AdminChangelistTests(QueryBudgetMixin, TestCase):
+    def setUp(self):
+        self.admin = User.objects.create_superuser('admin', password='x')
+        self.client.force_login(self.admin)
+
+    def add_rows(self, count):
+        root = Category.objects.create(name=f'Dept {Category.objects.count()}')
+        child = Category.objects.create(name='Child', parent=root)
+        for product in make_catalog(products=count, reviews_per_product=2):
+            product.category = Category.objects.create(name='Leaf', parent=child)
+            product.save()
+            Order.objects.create(user=self.admin, product=product, quantity=1)
+        return root
+
+    def test_changelists_stay_within_budget_as_rows_grow(self):
+        for count in (2, 12):
+            self.add_rows(count)
+            for url, budget in ADMIN_CHANGELIST_BUDGETS.items():
+                with self.subTest(url=url, rows=count):
+                    response = self.assertQueryBudget(url, budget)
+                    self.assertEqual(response.status_code, 200)
+
+    def test_category_filter_lists_roots_and_matches_whole_subtrees(self):
+        root = self.add_rows(3)
+        other = self.add_rows(2)
+        # One extra query resolves the chosen root's path
+        budget = ADMIN_CHANGELIST_BUDGETS['/admin/core/order/'] + 1
+        response = self.assertQueryBudget(f'/admin/core/order/?category_tree={root.id}', budget)
+        self.assertEqual(response.context['cl'].result_count, 3)
+        choices = [choice['display'] for choice in response.context['cl'].filter_specs[1].choices(response.context['cl'])]
+        roots = Category.objects.filter(parent=None).order_by('name').values_list('name', flat=True)
+        self.assertEqual(choices, ['All', *roots])
+        self.assertIn(other.name, choices)
+
+    def test_date_hierarchy_drills_down_by_range(self):
+        self.add_rows(2)
+        today = Order.objects.first().order_date
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(f'/admin/core/order/?order_date__year={today.year}&order_date__month={today.month}')
+        self.assertEqual(response.context['cl'].result_count, 2)
+        self.assertTrue(any('"core_order"."order_date" >=' in q['sql'] for q in queries))
+
+    def test_paginator_estimates_only_large_unfiltered_postgresql_tables(self):
+        self.add_rows(3)
+        self.assertEqual(EstimatedCountPaginator(Order.objects.order_by('id'), 2).count, 3)
+        with mock.patch.object(connection, 'vendor', 'postgresql'):
+            with mock.patch.object(EstimatedCountPaginator, 'estimate', return_value=2500000):
+                self.assertEqual(EstimatedCountPaginator(Order.objects.order_by('id'), 2).count, 2500000)
+                filtered = Order.objects.filter(quantity__gte=1).order_by('id')
+                self.assertEqual(EstimatedCountPaginator(filtered, 2).count, 3)
+            with mock.patch.object(EstimatedCountPaginator, 'estimate', return_value=40):
+                self.assertEqual(EstimatedCountPaginator(Order.objects.order_by('id'), 2).count, 3)
+
+
+class SalesRollupTests(TestCase):
+    def setUp(self):
+        self.buyer = User.objects.create_user(username='buyer')
+        self.staff = User.objects.create_user(username='analyst', is_staff=True)
+        self.client = APIClient()
+        self.client.force_authenticate(self.staff)
+        self.root = Category.objects.create(name='Apparel')
+        self.shoes = Category.objects.create(name='Shoes', parent=self.root)
+        self.nike = Brand.objects.create(name='Nike')
+        self.shoe = Product.objects.create(name='Shoe', category=self.shoes, brand=self.nike, price=100, stock=50,
+                                           is_on_sale=True, discount_percentage=25)
+        self.hat = Product.objects.create(name='Hat', category=self.root, price='10.00', stock=50)
+
+    def snapshot(self):
+        return sorted(SalesRollup.objects.values_list(
+            'day', 'product_id', 'category_id', 'brand_id', 'status', 'quantity', 'revenue', 'order_count',
+        ))
+
+    def test_rollups_follow_checkout_status_changes_and_deletes(self):
+        place_order(self.buyer, [(self.shoe.id, 2), (self.hat.id, 1)])
+        place_order(self.buyer, [(self.shoe.id, 1)])
+        today = timezone.localdate()
+        self.assertEqual(self.snapshot(), [
+            (today, self.shoe.id, self.shoes.id, self.nike.id, 'pending', 3, Decimal('225.00'), 2),
+            (today, self.hat.id, self.root.id, None, 'pending', 1, Decimal('10.00'), 1),
+        ])
+
+        order = Order.objects.get(product=self.hat)
+        order.status = 'delivered'
+        order.save()
+        self.assertEqual(
+            list(SalesRollup.objects.filter(product=self.hat).values_list('status', 'quantity', 'revenue')),
+            [('delivered', 1, Decimal('10.00'))],
+        )
+        order.delete()
+        self.assertFalse(SalesRollup.objects.filter(product=self.hat).exists())
+
+    def test_unpriced_orders_keep_their_booked_price_across_price_changes(self):
+        order = Order.objects.create(user=self.buyer, product=self.hat, quantity=2)
+        self.assertEqual(Order.objects.get(pk=order.pk).unit_price, Decimal('10.00'))
+        Product.objects.filter(pk=self.hat.pk).update(price='25.00')
+
+        order.status = 'delivered'
+        order.save(update_fields=['status'])
+        self.assertEqual(
+            list(SalesRollup.objects.filter(product=self.hat).values_list('status', 'quantity', 'revenue')),
+            [('delivered', 2, Decimal('20.00'))],
+        )
+
+        # Legacy rows stored without a price are pinned on their next save, even a partial one
+        Order.objects.filter(pk=order.pk).update(unit_price=None)
+        order = Order.objects.get(pk=order.pk)
+        order.status = 'processing'
+        order.save(update_fields=['status'])
+        self.assertEqual(Order.objects.get(pk=order.pk).unit_price, Decimal('25.00'))
+        self.assertFalse(SalesRollup.objects.filter(revenue__lt=0).exists())
+        self.assertEqual(
+            list(SalesRollup.objects.filter(product=self.hat, order_count__gt=0).values_list('status')), [('processing',)],
+        )
+
+    def test_rebuild_matches_incremental_maintenance(self):
+        place_order(self.buyer, [(self.shoe.id, 2), (self.hat.id, 3)])
+        # An order created without a price is booked at the current effective price
+        legacy = Order.objects.create(user=self.buyer, product=self.shoe, quantity=1, status='delivered')
+        incremental = self.snapshot()
+        self.assertEqual(len(incremental), 3)
+        call_command('rebuild_rollups', chunk_size=1, stdout=StringIO())
+        self.assertEqual(self.snapshot(), incremental)
+        self.assertEqual(SalesRollup.objects.get(status='delivered').revenue, Decimal('75.00'))
+
+        # Out-of-band edits are repaired by rebuilding the affected range
+        last_month = timezone.now() - timedelta(days=40)
+        Order.objects.filter(pk=legacy.pk).update(order_date=last_month)
+        call_command('rebuild_rollups', since=str((last_month - timedelta(days=1)).date()), stdout=StringIO())
+        self.assertEqual(SalesRollup.objects.get(status='delivered').day, timezone.localdate(last_month))
+        self.assertEqual(SalesRollup.objects.count(), 3)
+
+    def test_report_groups_filters_and_validates(self):
+        place_order(self.buyer, [(self.shoe.id, 2), (self.hat.id, 1)])
+        today = timezone.localdate().isoformat()
+        with self.assertNumQueries(2):
+            data = self.client.get('/api/reports/sales/', {'group_by': 'day,category'}).json()
+        self.assertEqual(data['results'], [
+            {'day': today, 'category': self.root.id, 'quantity': 1, 'revenue': '10.00', 'orders': 1},
+            {'day': today, 'category': self.shoes.id, 'quantity': 2, 'revenue': '150.00', 'orders': 1},
+        ])
+        self.assertEqual(data['totals'], {'quantity': 3, 'revenue': '160.00', 'orders': 2})
+
+        data = self.client.get('/api/reports/sales/', {'category': self.root.id, 'group_by': 'month'}).json()
+        self.assertEqual(data['totals']['revenue'], '160.00')
+        self.assertEqual(len(data['results']), 1)
+        data = self.client.get('/api/reports/sales/', {'brand': self.nike.id, 'status': 'delivered'}).json()
+        self.assertEqual((data['results'], data['totals']['orders']), ([], 0))
+
+        self.assertEqual(self.client.get('/api/reports/sales/', {'group_by': 'colour'}).status_code, 400)
+        self.assertEqual(self.client.get('/api/reports/sales/', {'start': today, 'end': '2000-01-01'}).status_code, 400)
+        self.client.force_authenticate(self.buyer)
+        self.assertEqual(self.client.get('/api/reports/sales/').status_code, 403)
+
+
+class ReplicaRoutingTests(TestCase):
+    def setUp(self):
+        self.router = PrimaryReplicaRouter(primary='default', replicas=['replica'])
+        self.factory = RequestFactory()
+        self.seen = []
+
+    def view(self, request):
+        # Which alias a core read and an auth read would use at this point of the request
+        self.seen.append((Product.objects.all().db, User.objects.all().db))
+        if request.method == 'POST':
+            Brand.objects.create(name='Written')
+            self.seen.append((Product.objects.all().db, User.objects.all().db))
+        return HttpResponse()
+
+    def request(self, method, cookies=None):
+        request = getattr(self.factory, method)('/api/products/')
+        request.COOKIES.update(cookies or {})
+        with override_settings(DATABASE_ROUTERS=[self.router]):
+            return ReplicaRoutingMiddleware(self.view)(request)
+
+    def test_safe_reads_of_core_models_go_to_a_replica(self):
+        response = self.request('get')
+        self.assertEqual(self.seen, [('replica', 'default')])
+        self.assertNotIn(REPLICA_PIN_COOKIE, response.cookies)
+
+    def test_writes_pin_the_request_and_the_client_to_the_primary(self):
+        response = self.request('post')
+        self.assertEqual(self.seen, [('default', 'default'), ('default', 'default')])
+        self.assertEqual(response.cookies[REPLICA_PIN_COOKIE]['max-age'], 5)
+
+        self.seen.clear()
+        self.request('get', cookies={REPLICA_PIN_COOKIE: '1'})
+        self.assertEqual(self.seen, [('default', 'default')])
+
+    def test_a_write_during_a_read_request_switches_later_reads(self):
+        state, token = begin_request(replica_reads=True)
+        try:
+            self.assertEqual(self.router.db_for_read(Product), 'replica')
+            self.assertEqual(self.router.db_for_write(Product), 'default')
+            self.assertEqual(self.router.db_for_read(Product), 'default')
+        finally:
+            end_request(token)
+        self.assertTrue(state.wrote)
+
+    def test_outside_requests_and_without_replicas_everything_uses_the_primary(self):
+        self.assertEqual(self.router.db_for_read(Product), 'default')
+        state, token = begin_request(replica_reads=True)
+        try:
+            self.assertEqual(PrimaryReplicaRouter(replicas=[]).db_for_read(Product), 'default')
+        finally:
+            end_request(token)
+        self.assertIs(self.router.allow_migrate('replica', 'core'), False)
+        self.assertIsNone(self.router.allow_migrate('default', 'core'))
+
+
+@override_settings(DATABASE_ROUTERS=[PrimaryReplicaRouter(primary=DEFAULT_DB_ALIAS, replicas=['replica'])])
+class ReplicaConnectionTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        # A second alias mirroring the test database, so routing can be checked against real
+        # connections; it only exists while this class runs
+        primary = connections[DEFAULT_DB_ALIAS].settings_dict
+        connections.settings['replica'] = {**primary, 'TEST': {**primary['TEST'], 'MIRROR': DEFAULT_DB_ALIAS}}
+        cls.databases = {DEFAULT_DB_ALIAS, 'replica'}
+        cls.addClassCleanup(cls.remove_replica)
+        super().setUpClass()
+
+    @classmethod
+    def remove_replica(cls):
+        connections['replica'].close()
+        del connections['replica']
+        del connections.settings['replica']
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+
+    def queries_by_alias(self, **kwargs):
+        with CaptureQueriesContext(connections['default']) as primary:
+            with CaptureQueriesContext(connections['replica']) as replica:
+                self.assertEqual(self.client.get('/api/brands/', **kwargs).status_code, 200)
+        return len(primary), len(replica)
+
+    def test_safe_reads_run_on_the_replica_connection(self):
+        primary, replica = self.queries_by_alias()
+        self.assertEqual(primary, 0)
+        self.assertGreater(replica, 0)
+
+    def test_pinned_clients_read_from_the_primary_connection(self):
+        self.client.cookies[REPLICA_PIN_COOKIE] = '1'
+        primary, replica = self.queries_by_alias()
+        self.assertGreater(primary, 0)
+        self.assertEqual(replica, 0)
+
+
+class CachedJWTAuthenticationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        local_users.clear()
+        self.user = User.objects.create_user(username='admin', password='Admin-pass-123', is_staff=True)
+        self.client = APIClient()
+        response = self.client.post('/api/auth/login/', {'username': 'admin', 'password': 'Admin-pass-123'})
+        self.token = response.json()['access']
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.token}')
+
+    def user_queries(self):
+        with CaptureQueriesContext(connection) as captured:
+            response = self.client.get('/api/reports/sales/')
+        return response, [query for query in captured if 'auth_user' in query['sql']]
+
+    def test_tokens_carry_no_privilege_claims(self):
+        # Permissions come from the cached row, which a demotion clears; a token claim could not be revoked
+        token = AccessToken(self.token)
+        self.assertEqual(token['user_id'], str(self.user.pk))
+        for claim in ('username', 'is_staff', 'is_superuser'):
+            self.assertNotIn(claim, token)
+
+    def test_warm_requests_run_no_user_query(self):
+        response, queries = self.user_queries()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(queries), 1)
+
+        response, queries = self.user_queries()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(queries, [])
+
+        # Another process starts with an empty LRU but shares the cache
+        local_users.clear()
+        response, queries = self.user_queries()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(queries, [])
+
+    def test_saving_the_user_drops_the_cached_row(self):
+        self.user_queries()
+        self.user.is_staff = False
+        self.user.save()
+        self.assertEqual(self.user_queries()[0].status_code, 403)
+
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(self.user_queries()[0].status_code, 401)
+
+    def test_cached_users_save_only_the_loaded_fields(self):
+        self.user_queries()
+        User.objects.filter(pk=self.user.pk).update(email='admin@example.com')
+        request = RequestFactory().get('/', HTTP_AUTHORIZATION=f'Bearer {self.token}')
+        user, _ = CachedJWTAuthentication().authenticate(request)
+        user.first_name = 'Ada'
+        user.save()
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.email, 'admin@example.com')
+        self.assertEqual(user.email, 'admin@example.com')
+
+
+class BulkPricingTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user(username='staff', is_staff=True))
+        self.root = Category.objects.create(name='Apparel')
+        self.child = Category.objects.create(name='Jackets', parent=self.root)
+        self.other = Category.objects.create(name='Garden')
+        self.nike = Brand.objects.create(name='Nike')
+        self.jacket = Product.objects.create(name='Jacket', category=self.child, brand=self.nike, price='40.00', stock=1)
+        self.shirt = Product.objects.create(name='Shirt', category=self.root, price='30.00', stock=1)
+        self.hose = Product.objects.create(name='Hose', category=self.other, brand=self.nike, price='20.00', stock=1)
+
+    def post(self, data):
+        return self.client.post('/api/products/pricing/', data, format='json')
+
+    def sale(self, product):
+        product.refresh_from_db()
+        return product.is_on_sale, product.discount_percentage, product.effective_price
+
+    def test_selection_is_updated_with_one_statement(self):
+        vest = Product.objects.create(name='Vest', category=self.other, brand=self.nike, price='45.00', stock=1)
+        Product.objects.filter(pk=vest.pk).update(updated_at=timezone.now() - timedelta(days=1))
+        touched = Product.objects.get(pk=vest.pk).updated_at
+        with CaptureQueriesContext(connection) as queries:
+            response = self.post({'categories': [self.root.id], 'discount_percentage': 25, 'is_on_sale': True})
+        self.assertEqual(response.json(), {'updated': 2})
+        self.assertEqual(self.sale(self.jacket), (True, 25, Decimal('30.00')))
+        self.assertEqual(self.sale(self.shirt), (True, 25, Decimal('22.50')))
+        self.assertEqual(self.sale(self.hose), (False, 0, Decimal('20.00')))
+        # One UPDATE for the selection, one touching the products that embed it as a related stub
+        updates = [q['sql'] for q in queries if q['sql'].startswith('UPDATE "core_product"')]
+        self.assertEqual(len(updates), 2)
+        self.assertGreater(Product.objects.get(pk=vest.pk).updated_at, touched)
+
+        # Criteria narrow each other
+        self.assertEqual(self.post({'categories': [self.root.id], 'brands': [self.nike.id], 'is_on_sale': False}).json(),
+                         {'updated': 1})
+        self.assertEqual(self.post({'products': [self.hose.id, self.shirt.id], 'price_change_percent': -10}).json(),
+                         {'updated': 2})
+        self.hose.refresh_from_db()
+        self.assertEqual(self.hose.price, Decimal('18.00'))
+
+    def test_price_changes_refresh_the_related_index(self):
+        vest = Product.objects.create(name='Vest', category=self.child, price='45.00', stock=1)
+        self.assertEqual(RelatedProduct.objects.get(product=vest, related=self.jacket).score, 5)
+        self.post({'products': [self.jacket.id], 'price': '300.00'})
+        self.assertEqual(RelatedProduct.objects.get(product=vest, related=self.jacket).score, 4)
+
+    def test_staff_only_and_validated(self):
+        self.assertEqual(self.post({'is_on_sale': True}).status_code, 400)
+        self.assertEqual(self.post({'brands': [self.nike.id]}).status_code, 400)
+        self.assertEqual(self.post({'brands': [self.nike.id], 'price': '1.00', 'price_change_percent': 5}).status_code, 400)
+        self.client.force_authenticate(User.objects.create_user(username='shopper'))
+        self.assertEqual(self.post({'brands': [self.nike.id], 'is_on_sale': True}).status_code, 403)
+
+    def test_scheduled_sales_start_and_end(self):
+        now = timezone.now()
+        response = self.post({'name': 'Nike week', 'brands': [self.nike.id], 'discount_percentage': 50,
+                              'starts_at': now.isoformat(), 'ends_at': (now + timedelta(days=7)).isoformat()})
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()['status'], 'scheduled')
+        self.assertEqual(self.sale(self.hose)[0], False)
+
+        self.assertEqual(run_scheduled_sales(now + timedelta(minutes=1)), (1, 0))
+        self.assertEqual(self.sale(self.hose), (True, 50, Decimal('10.00')))
+        self.assertEqual(self.sale(self.jacket), (True, 50, Decimal('20.00')))
+        # A discount changed by hand during the sale is left alone when it ends
+        Product.objects.filter(pk=self.jacket.pk).update(discount_percentage=30)
+
+        self.assertEqual(run_scheduled_sales(now + timedelta(days=8)), (0, 1))
+        self.assertEqual(self.sale(self.hose), (False, 0, Decimal('20.00')))
+        self.assertEqual(self.sale(self.jacket), (True, 30, Decimal('28.00')))
+        self.assertEqual(ScheduledSale.objects.get().status, 'ended')
+        self.assertEqual(run_scheduled_sales(now + timedelta(days=9)), (0, 0))
+
+    def test_missed_sales_are_only_marked_ended(self):
+        now = timezone.now()
+        ScheduledSale.objects.create(selection={'products': [self.shirt.id]}, discount_percentage=20,
+                                     starts_at=now - timedelta(days=2), ends_at=now - timedelta(days=1))
+        out = StringIO()
+        call_command('run_scheduled_sales', stdout=out)
+        self.assertIn('Started 0 and ended 0', out.getvalue())
+        self.assertEqual(self.sale(self.shirt)[0], False)
+        self.assertEqual(ScheduledSale.objects.get().status, 'ended')
+
+    def test_admin_actions_reprice_the_selection(self):
+        admin_user = User.objects.create_superuser('admin', password='x')
+        self.client.force_login(admin_user)
+        response = self.client.post('/admin/core/product/', {
+            'action': 'start_sale_20', '_selected_action': [self.jacket.id, self.hose.id],
+        })
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(self.sale(self.jacket), (True, 20, Decimal('32.00')))
+        self.assertEqual(self.sale(self.shirt)[0], False)
+        self.client.post('/admin/core/product/', {'action': 'end_sale', '_selected_action': [self.jacket.id]})
+        self.assertEqual(self.sale(self.jacket), (False, 0, Decimal('40.00')))
+
+
+class ProductFacetTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.root = Category.objects.create(name='Apparel')
+        self.child = Category.objects.create(name='Jackets', parent=self.root)
+        self.other = Category.objects.create(name='Garden')
+        self.nike = Brand.objects.create(name='Nike')
+        self.puma = Brand.objects.create(name='Puma')
+        self.jacket = Product.objects.create(name='Jacket', category=self.child, brand=self.nike, price='120.00',
+                                             stock=1, is_on_sale=True, discount_percentage=50)
+        Product.objects.create(name='Shirt', category=self.root, brand=self.nike, price='30.00', stock=1)
+        Product.objects.create(name='Hose', category=self.other, brand=self.puma, price='20.00', stock=0)
+        Product.objects.create(name='Rake', category=self.other, price='600.00', stock=1)
+
+    def facets(self, query=''):
+        return self.client.get(f'/api/products/facets/?{query}')
+
+    def test_counts_every_facet_in_one_grouped_query(self):
+        category_paths()  # Cached separately, and already warm on a busy site
+        with self.assertNumQueries(1):
+            data = self.facets().json()
+        self.assertEqual(data['count'], 4)
+        self.assertEqual(data['brands'], [{'id': self.nike.id, 'count': 2}, {'id': self.puma.id, 'count': 1}])
+        # Parents count their subcategories' products too
+        self.assertEqual(data['categories'], [
+            {'id': self.root.id, 'count': 2}, {'id': self.other.id, 'count': 2}, {'id': self.child.id, 'count': 1},
+        ])
+        # Bands follow the price after discount: the jacket is 60.00
+        self.assertEqual([band['count'] for band in data['price_bands']], [1, 1, 1, 0, 0, 1, 0])
+        self.assertEqual(data['price_bands'][2], {'min': 50, 'max': 100, 'count': 1})
+        self.assertIsNone(data['price_bands'][-1]['max'])
+
+    def test_product_filters_apply(self):
+        data = self.facets('in_stock=true&category_tree=%d' % self.root.id).json()
+        self.assertEqual(data['count'], 2)
+        self.assertEqual(data['brands'], [{'id': self.nike.id, 'count': 2}])
+        self.assertEqual(self.facets('effective_price_max=25').json()['count'], 1)
+        self.assertEqual(self.facets('price_min=abc').status_code, 400)
+
+    def test_cached_until_the_catalog_changes(self):
+        self.facets('brand=nike&ordering=price')
+        with self.assertNumQueries(0):
+            self.assertEqual(self.facets('ordering=-id&brand=nike').json()['count'], 2)
+        self.jacket.brand = self.puma
+        self.jacket.save()
+        self.assertEqual(self.facets('brand=nike').json()['count'], 1)
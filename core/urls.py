@@ -1,7 +1,7 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 from .views import CategoryViewSet, ProductViewSet, BrandViewSet, ReviewViewSet
-from . import views
+from . import async_views, views
 
 # Initialize the router for API endpoints
 router = DefaultRouter()
@@ -11,8 +11,14 @@ router.register(r'products', ProductViewSet, basename='product')
 router.register(r'reviews', ReviewViewSet, basename='review')
 
 # Correct URL patterns without the extra 'api/' prefix
-urlpatterns = router.urls
-
+# The raw product dump lives under /export/ so it no longer shadows the product API
 urlpatterns = [
-    path('products/', views.product_list, name='product_list'),
-]
+    path('products/export/', views.product_list, name='product_list'),
+    path('products/pricing/', views.BulkPricingView.as_view(), name='bulk_pricing'),
+    path('checkout/', views.CheckoutView.as_view(), name='checkout'),
+    path('reports/sales/', views.SalesReportView.as_view(), name='sales_report'),
+    # Async read path, served natively under backend.asgi
+    path('async/products/', async_views.product_list, name='async_product_list'),
+    path('async/products/<int:pk>/', async_views.product_detail, name='async_product_detail'),
+    path('async/categories/', async_views.category_list, name='async_category_list'),
+] + router.urls
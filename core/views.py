@@ -1,59 +1,311 @@
-from django.shortcuts import render
-from rest_framework import viewsets, generics, status
+from rest_framework import viewsets, generics, status, filters
+from rest_framework.decorators import action
+from rest_framework.exceptions import ParseError
 from rest_framework.response import Response
-from rest_framework.permissions import IsAuthenticated
-from .models import Category, Product, Brand, Review
-from django.http import JsonResponse
+from rest_framework.permissions import IsAdminUser, IsAuthenticated, SAFE_METHODS
+from .models import Category, Product, Brand, Review, RelatedProduct, ScheduledSale
+from django.db import transaction
+from django.db.models import Prefetch
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import StreamingHttpResponse
 from .serializers import (
     CategorySerializer, 
     ProductSerializer, 
+    ProductRowSerializer,
     UserSerializer, 
     BrandSerializer, 
-    ReviewSerializer
+    ReviewSerializer,
+    OrderSerializer,
+    CheckoutSerializer,
+    SalesReportQuerySerializer,
+    BulkPricingSerializer,
+    ScheduledSaleSerializer,
+    EMBEDDED_REVIEWS,
+    PRODUCT_COLUMN_FIELDS,
+    PRODUCT_EXPANDABLE_FIELDS,
 )
 from django.contrib.auth.models import User
 from django_filters.rest_framework import DjangoFilterBackend
+from .facets import cached_facets
 from .filters import ProductFilter
+from .categories import load_category_tree, category_tree
+from .pagination import ProductCursorPagination, ReviewCursorPagination
+from .search import SEARCH_RESULTS_LIMIT, search_product_ids
+from .mixins import CatalogCacheMixin, ConditionalGetMixin
+from .cache import cached_response
+from .checkout import OutOfStock, UnknownProducts, place_order
+from .reports import sales_report
+from .pricing import SELECTION_KEYS, reprice, select_products
 
 
 
+EXPORT_CHUNK_SIZE = 2000
+
+
+def _export_chunks(rows, start, separator, end):
+    """Encode rows one database chunk at a time so memory stays flat however big the catalog is."""
+    encode = DjangoJSONEncoder().encode
+    yield start
+    batch = []
+    first = True
+    for row in rows:
+        batch.append(encode(row))
+        if len(batch) == EXPORT_CHUNK_SIZE:
+            yield ('' if first else separator) + separator.join(batch)
+            first = False
+            batch = []
+    if batch:
+        yield ('' if first else separator) + separator.join(batch)
+    yield end
+
+
 def product_list(request):
-    products = list(Product.objects.values())  # Convert queryset to list of dicts
-    return JsonResponse(products, safe=False)
+    """Stream every product as a JSON array, or as NDJSON with ?format=ndjson."""
+    rows = Product.objects.order_by('id').values().iterator(chunk_size=EXPORT_CHUNK_SIZE)
+    if request.GET.get('format') == 'ndjson' or 'application/x-ndjson' in request.headers.get('Accept', ''):
+        return StreamingHttpResponse(_export_chunks(rows, '', '\n', '\n'), content_type='application/x-ndjson')
+    return StreamingHttpResponse(_export_chunks(rows, '[', ',', ']'), content_type='application/json')
 
 # Category ViewSet - Shows only main categories with their subcategories
-class CategoryViewSet(viewsets.ModelViewSet):
+class CategoryViewSet(CatalogCacheMixin, ConditionalGetMixin, viewsets.ModelViewSet):
     queryset = Category.objects.all()
     serializer_class = CategorySerializer
 
     def get_queryset(self):
         # Display only top-level categories in the list
-        return Category.objects.filter(parent=None)
+        if self.action == 'list':
+            return Category.objects.filter(parent=None)
+        return Category.objects.all()
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        if self.action == 'retrieve':
+            context['category_children'] = load_category_tree()[1]
+        return context
+
+    def get_conditional_state(self, detail=False):
+        # Both list and detail embed subcategories, so fingerprint the whole tree
+        return super().get_conditional_state(detail=False)
+
+    def get_conditional_queryset(self):
+        return Category.objects.all()
+
+    def list(self, request, *args, **kwargs):
+        # Roots and their subtrees come from the same single query
+        def build_response():
+            roots, children = load_category_tree()
+            serializer = self.get_serializer(roots, many=True)
+            serializer.context['category_children'] = children
+            return Response(serializer.data)
+        return cached_response(request, lambda: self.conditional_response(request, build_response))
+
+    @action(detail=False)
+    def tree(self, request):
+        """Full category hierarchy, cached until any category changes."""
+        def build():
+            roots, children = load_category_tree()
+            context = {**self.get_serializer_context(), 'category_children': children}
+            return CategorySerializer(roots, many=True, context=context).data
+        return Response(category_tree(build))
 
 
 
 # Brand ViewSet - Includes all brands
-class BrandViewSet(viewsets.ModelViewSet):
+class BrandViewSet(CatalogCacheMixin, ConditionalGetMixin, viewsets.ModelViewSet):
     queryset = Brand.objects.all()
     serializer_class = BrandSerializer
 
+# The sliced review prefetch runs as a single windowed query for the whole page
+LATEST_REVIEWS = Prefetch(
+    'reviews',
+    queryset=Review.objects.select_related('user').order_by('-created_at', 'id')[:EMBEDDED_REVIEWS],
+    to_attr='latest_reviews',
+)
+RELATED_LINKS = Prefetch('related_links', queryset=RelatedProduct.objects.select_related('related'))
+
+
 # Product ViewSet - Optimized for better performance
-class ProductViewSet(viewsets.ModelViewSet):
-    queryset = Product.objects.select_related('category', 'brand').prefetch_related('reviews').all()
+class ProductViewSet(CatalogCacheMixin, ConditionalGetMixin, viewsets.ModelViewSet):
+    # Ratings are stored on the product row, while the latest reviews (with their authors)
+    # and related-product stubs come in with one prefetch each, so the page costs a fixed
+    # number of queries. Category and brand are only output as ids, so they need no join.
+    queryset = Product.objects.prefetch_related(LATEST_REVIEWS, RELATED_LINKS).order_by('id')
     serializer_class = ProductSerializer
-    filter_backends = [DjangoFilterBackend]
+    filter_backends = [DjangoFilterBackend, filters.OrderingFilter]
     filterset_class = ProductFilter
+    ordering_fields = ['id', 'price', 'effective_price', 'average_rating', 'rating_count']
+    pagination_class = ProductCursorPagination
+
+    def get_sparse_fields(self):
+        """
+        Output fields picked with `?fields=` and `?expand=` on reads, or None for the full product.
+
+        `fields` picks from the flat fields (all of them by default) and `expand` adds nested
+        ones, e.g. `?fields=name,price&expand=reviews`. The id is always included.
+        """
+        if self.request.method not in SAFE_METHODS:
+            return None
+        params = self.request.query_params
+        if 'fields' not in params and 'expand' not in params:
+            return None
+        flat = [name for name in ProductSerializer.Meta.fields if name not in PRODUCT_EXPANDABLE_FIELDS]
+        fields = {name for name in params.get('fields', '').split(',') if name} or set(flat)
+        expand = {name for name in params.get('expand', '').split(',') if name}
+        unknown = sorted((fields - set(ProductSerializer.Meta.fields)) | (expand - set(PRODUCT_EXPANDABLE_FIELDS)))
+        if unknown:
+            raise ParseError(f"Unknown product fields: {', '.join(unknown)}.")
+        return fields | expand | {'id'}
+
+    def get_queryset(self):
+        fields = self.get_sparse_fields()
+        if fields is None:
+            return super().get_queryset()
+        # Load only the columns behind the requested fields, plus what the cursor orders by
+        columns = {PRODUCT_COLUMN_FIELDS[name] for name in fields if name in PRODUCT_COLUMN_FIELDS}
+        columns.update(self.ordering_fields)
+        if fields <= PRODUCT_COLUMN_FIELDS.keys():
+            return Product.objects.values_list(*sorted(columns), named=True).order_by('id')
+        if 'image_srcset' in fields:
+            columns.update(['image', 'image_variants'])
+        queryset = Product.objects.only(*columns).order_by('id')
+        if 'reviews' in fields:
+            queryset = queryset.prefetch_related(LATEST_REVIEWS)
+        if 'related_products' in fields:
+            queryset = queryset.prefetch_related(RELATED_LINKS)
+        return queryset
+
+    def get_serializer_class(self):
+        fields = self.get_sparse_fields()
+        if fields is not None and fields <= PRODUCT_COLUMN_FIELDS.keys():
+            return ProductRowSerializer
+        return super().get_serializer_class()
+
+    def get_serializer(self, *args, **kwargs):
+        fields = self.get_sparse_fields()
+        if fields is not None:
+            kwargs['fields'] = fields
+        return super().get_serializer(*args, **kwargs)
+
+    def perform_create(self, serializer):
+        super().perform_create(serializer)
+        # save() does not read back the generated columns, so the response would show stale values
+        serializer.instance.refresh_from_db(fields=['effective_price', 'average_rating'])
+
+    def perform_update(self, serializer):
+        super().perform_update(serializer)
+        serializer.instance.refresh_from_db(fields=['effective_price', 'average_rating'])
+
+    @action(detail=True)
+    def reviews(self, request, pk=None):
+        """Full review history of one product, newest first, with keyset pagination."""
+        if not Product.objects.filter(pk=pk).exists():
+            return Response({"detail": "Not found."}, status=status.HTTP_404_NOT_FOUND)
+        reviews = Review.objects.filter(product_id=pk).select_related('user')
+        paginator = ReviewCursorPagination()
+        page = paginator.paginate_queryset(reviews, request)
+        return paginator.get_paginated_response(ReviewSerializer(page, many=True).data)
+
+    @action(detail=False)
+    def facets(self, request):
+        """Product counts per brand, category subtree and price band for the same filters as the list."""
+        filterset = ProductFilter(request.query_params, queryset=Product.objects.all(), request=request)
+        if not filterset.is_valid():
+            return Response(filterset.errors, status=status.HTTP_400_BAD_REQUEST)
+        return Response(cached_facets(filterset))
+
+    @action(detail=False)
+    def search(self, request):
+        """Ranked full-text search over name, description, brand and category; `?q=` is required."""
+        query = request.query_params.get('q', '').strip()
+        if not query:
+            return Response({"detail": "The q parameter is required."}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            limit = max(1, min(int(request.query_params.get('limit', SEARCH_RESULTS_LIMIT)), SEARCH_RESULTS_LIMIT))
+        except ValueError:
+            limit = SEARCH_RESULTS_LIMIT
+
+        queryset = self.filter_queryset(self.get_queryset())
+        # Filters narrow the ranked match itself, so they cannot empty a page of top hits
+        filtered = any(name in request.query_params for name in ProductFilter.base_filters)
+        ids = search_product_ids(query, limit, queryset if filtered else None)
+        products = {p.id: p for p in queryset.filter(id__in=ids)}
+        ranked = [products[product_id] for product_id in ids if product_id in products]
+        return Response(self.get_serializer(ranked, many=True).data)
 
 # User Registration View - Handles new user registration
 class RegisterView(generics.CreateAPIView):
     queryset = User.objects.all()
     serializer_class = UserSerializer
 
+# Checkout View - Places a multi-item cart, reserving stock atomically
+class CheckoutView(generics.GenericAPIView):
+    serializer_class = CheckoutSerializer
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        items = [(item['product'], item['quantity']) for item in serializer.validated_data['items']]
+        try:
+            orders = place_order(request.user, items)
+        except OutOfStock as error:
+            return Response(
+                {"detail": str(error), "product": error.product_id},
+                status=status.HTTP_409_CONFLICT
+            )
+        except UnknownProducts as error:
+            return Response(
+                {"detail": str(error), "products": error.product_ids},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        return Response(OrderSerializer(orders, many=True).data, status=status.HTTP_201_CREATED)
+
+# Sales Report View - Revenue and quantities from the daily rollups, never the order table
+class SalesReportView(generics.GenericAPIView):
+    serializer_class = SalesReportQuerySerializer
+    permission_classes = [IsAdminUser]
+
+    def get(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        params = serializer.validated_data
+        rows, totals = sales_report(**params)
+        return Response({
+            "start": params['start'],
+            "end": params['end'],
+            "group_by": params['group_by'],
+            "results": rows,
+            "totals": totals,
+        })
+
+# Bulk Pricing View - Staff repricing of a product selection in one UPDATE, now or as a scheduled sale
+class BulkPricingView(generics.GenericAPIView):
+    serializer_class = BulkPricingSerializer
+    permission_classes = [IsAdminUser]
+
+    def post(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+        selection = {key: data[key] for key in SELECTION_KEYS if data.get(key)}
+        if 'starts_at' in data:
+            sale = ScheduledSale.objects.create(
+                name=data.get('name', ''), selection=selection, discount_percentage=data['discount_percentage'],
+                starts_at=data['starts_at'], ends_at=data.get('ends_at'),
+            )
+            return Response(ScheduledSaleSerializer(sale).data, status=status.HTTP_201_CREATED)
+        changes = {key: data[key] for key in ('price', 'price_change_percent', 'discount_percentage', 'is_on_sale')
+                   if key in data}
+        return Response({"updated": reprice(select_products(**selection), **changes)})
+
 # Review ViewSet - Handles customer reviews for products
 class ReviewViewSet(viewsets.ModelViewSet):
-    queryset = Review.objects.select_related('product', 'user').order_by('-created_at')
+    queryset = Review.objects.select_related('user').order_by('-created_at', 'id')
     serializer_class = ReviewSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = ReviewCursorPagination
+    filter_backends = [DjangoFilterBackend]
+    filterset_fields = ['product']
 
     def create(self, request, *args, **kwargs):
         product_id = request.data.get('product')
@@ -70,5 +322,27 @@ class ReviewViewSet(viewsets.ModelViewSet):
 
         serializer = self.get_serializer(data=request.data)
         serializer.is_valid(raise_exception=True)
-        serializer.save(user=request.user)
-        return Response(serializer.data, status=status.HTTP_201_CREATED)
\ No newline at end of file
+        self.perform_create(serializer)
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+
+    # The product's stored rating aggregates move in the same transaction as the review
+    @transaction.atomic
+    def perform_create(self, serializer):
+        review = serializer.save(user=self.request.user)
+        Product.adjust_rating(review.product_id, review.rating, 1)
+
+    @transaction.atomic
+    def perform_update(self, serializer):
+        old_product_id, old_rating = serializer.instance.product_id, serializer.instance.rating
+        review = serializer.save()
+        if review.product_id != old_product_id:
+            Product.adjust_rating(old_product_id, -old_rating, -1)
+            Product.adjust_rating(review.product_id, review.rating, 1)
+        else:
+            # Even a comment-only edit must bump the product's updated_at
+            Product.adjust_rating(review.product_id, review.rating - old_rating)
+
+    @transaction.atomic
+    def perform_destroy(self, instance):
+        Product.adjust_rating(instance.product_id, -instance.rating, -1)
+        instance.delete()